@@ -24,5 +24,9 @@ setup(
     entry_points={'console_scripts': [
         '{0} = xbeachmi.console:xbeachmi'.format(
             'xbeach-mi'),
+        '{0} = xbeachmi.console:xbeachmi_merge'.format(
+            'xbeach-mi-merge'),
+        '{0} = xbeachmi.console:xbeachmi_benchmark'.format(
+            'xbeach-mi-benchmark'),
     ]},
 )
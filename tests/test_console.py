@@ -0,0 +1,54 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import pytest
+import numpy as np
+
+import xbeachmi.netcdf
+import xbeachmi.console
+
+
+def test_merge():
+    netCDF4 = pytest.importorskip('netCDF4')
+    tmpdir = tempfile.mkdtemp()
+    argv = sys.argv
+    try:
+        config = {'scenario' : [[0., 'stat'], [10., 'instat']],
+                  'netcdf' : {'outputfile' : 'xbeachmi.nc'}}
+        configfile = os.path.join(tmpdir, 'config.json')
+        with open(configfile, 'w') as fp:
+            json.dump(config, fp)
+
+        # output files written by the individual instances
+        for instance, times in [('stat', [5., 10.]), ('instat', [15., 20.])]:
+            ncfile = os.path.join(tmpdir, '.%s' % instance, 'xbeachmi.nc')
+            os.makedirs(os.path.dirname(ncfile))
+            xbeachmi.netcdf.initialize(ncfile, {'x' : np.arange(3.),
+                                                'y' : np.arange(1.),
+                                                'fractions' : np.arange(2.)},
+                                       variables={'zb' : {'dimensions' : ['time', 'y', 'x']},
+                                                  'Ct' : {'dimensions' : ['time', 'y', 'x', 'fractions']}})
+            with xbeachmi.netcdf.NetCDFWriter(ncfile) as writer:
+                for t in times:
+                    writer.append({'time' : t,
+                                   'zb' : np.full((1, 3), t),
+                                   'Ct' : np.full((1, 3, 2), t),
+                                   'instance' : instance})
+
+        sys.argv = ['xbeach-mi-merge', configfile]
+        xbeachmi.console.xbeachmi_merge()
+
+        with netCDF4.Dataset(os.path.join(tmpdir, 'xbeachmi.nc'), 'r') as nc:
+            assert list(nc.variables['time'][:]) == [5., 10., 15., 20.]
+            assert nc.variables['Ct'].shape == (4, 2, 1, 3, 2)
+            names = list(netCDF4.chartostring(nc.variables['instance_names'][:,:]))
+            instances = list(netCDF4.chartostring(nc.variables['instance'][:,:]))
+            assert instances == ['stat', 'stat', 'instat', 'instat']
+            zb = nc.variables['zb'][:,names.index('instat'),0,0]
+            assert list(zb[2:]) == [15., 20.]
+            assert np.all(zb.mask[:2])
+    finally:
+        sys.argv = argv
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,36 @@
+import os
+import shutil
+import tempfile
+import pytest
+import numpy as np
+
+import xbeachmi.netcdf
+
+
+def test_to_char():
+    values = ['stat', np.str_('instat'), np.asarray('stat'), b'instat']
+    chars = xbeachmi.netcdf.to_char(values, 8)
+    assert chars.shape == (4, 8)
+    assert chars[1,:6].tobytes() == b'instat'
+    assert chars[2,:4].tobytes() == b'stat'
+
+
+def test_writer_instance_roundtrip():
+    netCDF4 = pytest.importorskip('netCDF4')
+    tmpdir = tempfile.mkdtemp()
+    try:
+        ncfile = os.path.join(tmpdir, 'xbeachmi.nc')
+        xbeachmi.netcdf.initialize(ncfile, {'x' : np.arange(3.),
+                                            'y' : np.arange(1.)},
+                                   variables={'zb' : {'dimensions' : ['time', 'y', 'x']}})
+        with xbeachmi.netcdf.NetCDFWriter(ncfile, buffer_size=10) as writer:
+            for t, instance in [(1., 'stat'), (2., 'instat')]:
+                writer.append({'time' : t,
+                               'zb' : np.zeros((1, 3)),
+                               'instance' : instance})
+
+        with netCDF4.Dataset(ncfile, 'r') as nc:
+            instances = netCDF4.chartostring(nc.variables['instance'][:,:])
+        assert list(instances) == ['stat', 'instat']
+    finally:
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,461 @@
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+
+# registered reducers
+REDUCERS = {}
+
+# operators for combining partial aggregates in a tree reduction
+TREE_OPERATORS = {
+    'average' : 'sum',
+    'mean' : 'sum',
+    'sum' : 'sum',
+    'min' : 'min',
+    'max' : 'max',
+}
+
+# aggregation methods of which a tree reduction is normalized by the sum of weights
+TREE_NORMALIZED = ('average', 'mean')
+
+
+def register(name, reducer):
+    '''Register reducer class for aggregation
+
+    Registered reducers can be selected using the "method" keyword in
+    the "aggregate" section of the configuration file.
+
+    Parameters
+    ----------
+    name : str
+        name of aggregation method
+    reducer : type
+        subclass of :class:`Reducer`
+
+    '''
+
+    REDUCERS[name] = reducer
+
+
+def get_reducer(method):
+    '''Create reducer for a given aggregation method
+
+    Parameters
+    ----------
+    method : str
+        name of aggregation method
+
+    Returns
+    -------
+    Reducer
+        reducer instance
+
+    '''
+
+    if method not in REDUCERS.keys():
+        raise ValueError('Unsupported aggregation method [%s]' % method)
+
+    return REDUCERS[method]()
+
+
+def get_tree_operator(method):
+    '''Return operator for combining partial aggregates in a tree reduction
+
+    Parameters
+    ----------
+    method : str
+        name of aggregation method
+
+    Returns
+    -------
+    str
+        name of operator ("sum", "min" or "max")
+
+    '''
+
+    if method not in TREE_OPERATORS.keys():
+        raise ValueError('Aggregation method not supported by tree reduction [%s]' % method)
+
+    return TREE_OPERATORS[method]
+
+
+def combine(acc, value, operator):
+    '''Combine partial aggregate into accumulator in place
+
+    Parameters
+    ----------
+    acc : np.ndarray
+        accumulator
+    value : np.ndarray
+        partial aggregate
+    operator : str
+        name of operator ("sum", "min" or "max")
+
+    '''
+
+    if operator == 'sum':
+        acc += value
+    elif operator == 'min':
+        np.minimum(acc, value, out=acc)
+    elif operator == 'max':
+        np.maximum(acc, value, out=acc)
+    else:
+        raise ValueError('Unsupported operator [%s]' % operator)
+
+
+def get_reduction_schedule(n):
+    '''Return pairs of participants per level of a binary tree reduction
+
+    In each level the participant with the higher index sends its
+    partial aggregate to the participant with the lower index. After
+    all levels, the participant with index 0 holds the aggregate.
+
+    Parameters
+    ----------
+    n : int
+        number of participants
+
+    Returns
+    -------
+    list
+        list of levels, each a list of tuples with the index of the
+        receiver and the index of the sender
+
+    '''
+
+    levels = []
+    step = 1
+    while step < n:
+        levels.append([(i, i + step) for i in range(0, n, 2 * step) if i + step < n])
+        step *= 2
+    return levels
+
+
+def get_broadcast_schedule(n):
+    '''Return pairs of participants per level of a binary tree broadcast
+
+    The inverse of :func:`get_reduction_schedule`. Participant 0
+    initially holds the data and in each level every participant
+    that holds the data passes it on to one other participant.
+
+    Parameters
+    ----------
+    n : int
+        number of participants
+
+    Returns
+    -------
+    list
+        list of levels, each a list of tuples with the index of the
+        receiver and the index of the sender
+
+    '''
+
+    return [[(j, i) for i, j in level] for level in get_reduction_schedule(n)[::-1]]
+
+
+class Reducer:
+    '''Reducer base class
+
+    A reducer folds values into an accumulator one at a time, as
+    soon as they are available, such that never more than one
+    accumulator per variable is needed. The accumulator is allocated
+    upon the first value and reused after :func:`reset`. The result
+    is a view on the accumulator and remains valid until the next
+    reset.
+
+    '''
+
+
+    def __init__(self):
+        '''Initialize the class'''
+
+        self.acc = None
+        self.count = 0
+
+
+    def reset(self):
+        '''Prepare accumulator for the next aggregation'''
+
+        self.count = 0
+
+
+    def add(self, value, weight=1.):
+        '''Fold value into accumulator
+
+        Parameters
+        ----------
+        value : np.ndarray or float
+            value to be folded
+        weight : float, optional
+            weight of value
+
+        '''
+
+        value = np.asarray(0. if value is None else value)
+        if self.count == 0:
+            self.first(value, weight)
+        else:
+            self.fold(value, weight)
+        self.count += 1
+
+
+    def first(self, value, weight):
+        '''Initialize accumulator with first value'''
+
+        if self.acc is None or self.acc.shape != value.shape or \
+           self.acc.dtype != value.dtype:
+            self.acc = np.array(value, copy=True)
+        else:
+            self.acc[...] = value
+
+
+    def fold(self, value, weight):
+        '''Fold value into initialized accumulator'''
+
+        raise NotImplementedError
+
+
+    def result(self):
+        '''Return aggregated value'''
+
+        if self.count == 0:
+            return None
+        return self.finish()
+
+
+    def finish(self):
+        '''Finalize accumulator and return aggregated value'''
+
+        return self.scalar(self.acc)
+
+
+    @staticmethod
+    def scalar(x):
+        '''Return zero-dimensional arrays as scalar'''
+
+        if x.ndim == 0:
+            return x[()]
+        return x
+
+
+class Average(Reducer):
+    '''Weighted average reducer'''
+
+
+    def __init__(self):
+        super().__init__()
+        self.scratch = None
+        self.weight = 0.
+
+
+    def first(self, value, weight):
+        dtype = np.result_type(value.dtype, np.float64)
+        if self.acc is None or self.acc.shape != value.shape or \
+           self.acc.dtype != dtype:
+            self.acc = np.empty(value.shape, dtype=dtype)
+            self.scratch = None
+        np.multiply(value, weight, out=self.acc)
+        self.weight = weight
+
+
+    def fold(self, value, weight):
+        if weight == 1.:
+            self.acc += value
+        else:
+            if self.scratch is None:
+                self.scratch = np.empty_like(self.acc)
+            np.multiply(value, weight, out=self.scratch)
+            self.acc += self.scratch
+        self.weight += weight
+
+
+    def finish(self):
+        if self.weight == 0.:
+            raise ZeroDivisionError('Weights sum to zero, can\'t be normalized')
+        self.acc /= self.weight
+        return self.scalar(self.acc)
+
+
+class Sum(Reducer):
+    '''Weighted sum reducer'''
+
+
+    def first(self, value, weight):
+        dtype = np.result_type(value.dtype, np.float64)
+        if self.acc is None or self.acc.shape != value.shape or \
+           self.acc.dtype != dtype:
+            self.acc = np.empty(value.shape, dtype=dtype)
+        np.multiply(value, weight, out=self.acc)
+
+
+    def fold(self, value, weight):
+        if weight == 1.:
+            self.acc += value
+        else:
+            self.acc += value * weight
+
+
+class Minimum(Reducer):
+    '''Minimum reducer, weights are ignored'''
+
+
+    def fold(self, value, weight):
+        np.minimum(self.acc, value, out=self.acc)
+
+
+class Maximum(Reducer):
+    '''Maximum reducer, weights are ignored'''
+
+
+    def fold(self, value, weight):
+        np.maximum(self.acc, value, out=self.acc)
+
+
+class Median(Reducer):
+    '''Median reducer, weights are ignored
+
+    The median cannot be computed incrementally. Therefore, this
+    reducer keeps a copy of all values until the result is requested.
+
+    '''
+
+
+    def reset(self):
+        super().reset()
+        self.values = []
+
+
+    def first(self, value, weight):
+        self.values = [np.array(value, copy=True)]
+
+
+    def fold(self, value, weight):
+        self.values.append(np.array(value, copy=True))
+
+
+    def finish(self):
+        self.acc = np.median(self.values, axis=0)
+        self.values = []
+        return self.scalar(np.asarray(self.acc))
+
+
+register('average', Average)
+register('mean', Average)
+register('sum', Sum)
+register('min', Minimum)
+register('max', Maximum)
+register('median', Median)
+
+
+class Aggregator:
+    '''Streaming aggregator for multiple variables
+
+    Keeps a single reducer per variable that is reused between
+    aggregations. Values of each instance are folded in as soon as
+    they arrive. Optionally, the variables are folded on a thread
+    pool, which is effective since numpy releases the GIL for most
+    array operations.
+
+    '''
+
+
+    def __init__(self, method='average', weights=None, threads=0):
+        '''Initialize the class
+
+        Parameters
+        ----------
+        method : str, optional
+            name of aggregation method, see :func:`register`
+        weights : list or dict, optional
+            weights per instance, either as list in the order of the
+            running instances or as dict with instance names as keys
+        threads : int, optional
+            number of threads used for folding variables
+
+        '''
+
+        get_reducer(method) # check method
+
+        self.method = method
+        self.weights = weights
+        self.reducers = {}
+        self.pool = ThreadPoolExecutor(max_workers=threads) if threads > 1 else None
+
+
+    def get_weight(self, instance, index):
+        '''Return weight of instance
+
+        Parameters
+        ----------
+        instance : str
+            name of instance
+        index : int
+            position of instance in running instances
+
+        Returns
+        -------
+        float
+            weight
+
+        '''
+
+        if self.weights is None:
+            return 1.
+        elif isinstance(self.weights, dict):
+            return self.weights.get(instance, 1.)
+        else:
+            return self.weights[index]
+
+
+    def reset(self):
+        '''Prepare all reducers for the next aggregation'''
+
+        for reducer in self.reducers.values():
+            reducer.reset()
+
+
+    def add(self, values, weight=1.):
+        '''Fold values of a single instance into the accumulators
+
+        Parameters
+        ----------
+        values : dict
+            dict with variable names (keys) and values (values)
+        weight : float, optional
+            weight of instance
+
+        '''
+
+        for var in values.keys():
+            if var not in self.reducers.keys():
+                self.reducers[var] = get_reducer(self.method)
+                self.reducers[var].reset()
+
+        if self.pool is None or len(values) < 2:
+            for var, value in values.items():
+                self.reducers[var].add(value, weight)
+        else:
+            list(self.pool.map(lambda var: self.reducers[var].add(values[var], weight),
+                               values.keys()))
+
+
+    def result(self):
+        '''Return aggregated values
+
+        Returns
+        -------
+        dict
+            dict with variable names (keys) and aggregated values
+            (values), which remain valid until the next reset
+
+        '''
+
+        return {var : reducer.result() for var, reducer in self.reducers.items()}
+
+
+    def close(self):
+        '''Shut down thread pool'''
+
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
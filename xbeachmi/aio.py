@@ -0,0 +1,271 @@
+from __future__  import absolute_import
+
+import asyncio
+import logging
+import numpy as np
+
+import xbeachmi.ipc
+from xbeachmi.model import XBeachMI
+
+
+# initialize log
+logger = logging.getLogger(__name__)
+
+
+class AsyncXBeachMI(XBeachMI):
+    '''Asynchronous XBeach MI wrapper class
+
+    Asyncio counterpart of :class:`~xbeachmi.model.XBeachMI`. The
+    public methods that communicate with the instance processes are
+    awaitables. Both classes run the same coupling steps, but this
+    class waits for replies by registering the instance pipes with
+    the running event loop rather than by blocking. A single event
+    loop can therefore drive many instances, or multiple engines
+    side by side, without a thread per instance:
+
+    .. code-block:: python
+
+       async def run(configfiles, t):
+           engines = [AsyncXBeachMI(f) for f in configfiles]
+           await asyncio.gather(*[e.initialize() for e in engines])
+           await asyncio.gather(*[e.advance_to(t) for e in engines])
+           await asyncio.gather(*[e.finalize() for e in engines])
+
+    All public methods that communicate with the instance processes
+    are overridden, such that none of them blocks the event loop.
+
+    Note that, as all engines share the process working directory,
+    the configuration files of side by side engines should be
+    located in the same directory.
+
+    '''
+
+
+    async def __aenter__(self):
+        await self.initialize()
+        return self
+
+
+    async def __aexit__(self, errtype, errobj, traceback):
+        await self.finalize()
+
+
+    async def initialize(self):
+        '''Initialize and start instance processes'''
+
+        self.start()
+        try:
+            return await self._drive_async(self._initialize())
+        except:
+            await self.finalize()
+            raise
+
+
+    async def update(self, dt=-1):
+        '''Update running instances and time
+
+        See :func:`~xbeachmi.model.XBeachMI.update`.
+
+        '''
+
+        return await self._drive_async(self._update(dt))
+
+
+    async def advance_to(self, t):
+        '''Update running instances until a given time
+
+        See :func:`~xbeachmi.model.XBeachMI.advance_to`.
+
+        '''
+
+        return await self._drive_async(self._advance_to(t))
+
+
+    async def update_instances(self):
+        '''Change and/or update running instances
+
+        See :func:`~xbeachmi.model.XBeachMI.update_instances`.
+
+        '''
+
+        return await self._drive_async(self._update_instances())
+
+
+    async def sync_time(self, instances):
+        '''Synchronize time between running instances and given instances
+
+        See :func:`~xbeachmi.model.XBeachMI.sync_time`.
+
+        '''
+
+        return await self._drive_async(self._sync_time(instances))
+
+
+    async def aggregate_data(self, variables=None):
+        '''Aggregate exchange values of running instances
+
+        See :func:`~xbeachmi.model.XBeachMI.aggregate_data`.
+
+        '''
+
+        return await self._drive_async(self._aggregate_data(variables=variables))
+
+
+    async def exchange_data(self, instances, variables=None):
+        '''Exchange data from aggregated storage to given instances
+
+        See :func:`~xbeachmi.model.XBeachMI.exchange_data`.
+
+        '''
+
+        return await self._drive_async(self._exchange_data(instances, variables=variables))
+
+
+    async def get_current_time(self):
+        return await self._drive_async(self._get_current_time())
+
+
+    async def get_start_time(self):
+        return await self._drive_async(self._call('get_start_time'))
+
+
+    async def get_end_time(self):
+        return await self._drive_async(self._get_end_time())
+
+
+    async def get_next_event_time(self):
+        return await self._drive_async(self._get_next_event_time())
+
+
+    async def get_next_switch_time(self):
+        return await self._drive_async(self._get_next_switch_time())
+
+
+    async def get_var(self, var):
+        return await self._drive_async(self._get_var(var))
+
+
+    async def get_var_count(self, var):
+        return await self._drive_async(self._call('get_var_count', (var,)))
+
+
+    async def get_var_rank(self, var):
+        return (await self._drive_async(self._get_metadata(var)))['rank']
+
+
+    async def get_var_shape(self, var):
+        return np.asarray((await self._drive_async(self._get_metadata(var)))['shape'], dtype=int)
+
+
+    async def get_var_type(self, var):
+        return (await self._drive_async(self._get_metadata(var)))['type']
+
+
+    async def get_dimensions(self, var):
+        '''Return dimensions of a given variable
+
+        See :func:`~xbeachmi.model.XBeachMI.get_dimensions`.
+
+        '''
+
+        return (u'time',) + (await self._drive_async(self._get_metadata(var)))['dimensions']
+
+
+    async def get_instance_vars(self, variables, instances=None):
+        return await self._drive_async(self._get_instance_vars(variables, instances))
+
+
+    async def set_var(self, var, val):
+        return await self._drive_async(self._set_var_or_instance(var, val))
+
+
+    async def set_instances(self, instances, event='switch'):
+        '''Change running instance, set time and exchange data
+
+        See :func:`~xbeachmi.model.XBeachMI.set_instances`.
+
+        '''
+
+        return await self._drive_async(self._set_instances(instances, event=event))
+
+
+    async def get_state(self):
+        '''Return simulation state for checkpointing
+
+        See :func:`~xbeachmi.model.XBeachMI.get_state`.
+
+        '''
+
+        return await self._drive_async(self._get_state())
+
+
+    async def set_state(self, state):
+        '''Restore simulation state from checkpoint
+
+        See :func:`~xbeachmi.model.XBeachMI.set_state`.
+
+        '''
+
+        return await self._drive_async(self._set_state(state))
+
+
+    async def init_output(self, ncfile, dimensions, variables, options={}):
+        '''Initialize a netCDF4 output file in each instance process
+
+        See :func:`~xbeachmi.model.XBeachMI.init_output`.
+
+        '''
+
+        return await self._drive_async(self._init_output(ncfile, dimensions,
+                                                         variables, options))
+
+
+    async def write_output(self, t, variables):
+        '''Let running instance processes write output variables
+
+        See :func:`~xbeachmi.model.XBeachMI.write_output`.
+
+        '''
+
+        return await self._drive_async(self._write_output(t, variables))
+
+
+    async def flush_output(self):
+        '''Wait until instance processes finished writing output
+
+        See :func:`~xbeachmi.model.XBeachMI.flush_output`.
+
+        '''
+
+        return await self._drive_async(self._flush_output())
+
+
+    async def finalize(self):
+        '''Finalize instance processes
+
+        Waits for the instance processes to end in a worker thread,
+        such that the event loop is not blocked.
+
+        '''
+
+        await self._drive_async(self._finalize())
+        await asyncio.get_running_loop().run_in_executor(None, self.join)
+        self.close()
+
+
+    async def _drive_async(self, steps):
+        '''Run coupling steps awaiting each pending request
+
+        Parameters
+        ----------
+        steps : generator
+            coupling steps
+
+        Returns
+        -------
+        any
+            return value of coupling steps
+
+        '''
+
+        return await xbeachmi.ipc.drive_async(steps)
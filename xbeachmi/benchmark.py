@@ -0,0 +1,632 @@
+from __future__  import absolute_import
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import platform
+import tempfile
+import subprocess
+import numpy as np
+
+import xbeachmi.netcdf
+import xbeachmi.output
+from xbeachmi.model import XBeachMI
+
+
+# initialize log
+logger = logging.getLogger(__name__)
+
+# version of the report format
+FORMAT = 1
+
+# benchmarks in order of execution
+BENCHMARKS = ('startup', 'ipc', 'exchange', 'scaling', 'output')
+
+# parameters of each benchmark, every combination is run
+PARAMETERS = {
+    'full' : {
+        'startup' : {'instances' : [1, 4, 8], 'lazy' : [False, True]},
+        'ipc' : {'grid' : [10, 100, 500], 'transport' : ['pipe', 'shared_memory']},
+        'exchange' : {'grid' : [10, 100, 500], 'nvars' : [1, 4, 16],
+                      'transport' : ['pipe', 'shared_memory']},
+        'scaling' : {'instances' : [1, 2, 4, 8], 'grid' : [200],
+                     'transport' : ['pipe', 'shared_memory']},
+        'output' : {'grid' : [100, 500], 'writer' : ['master', 'workers']},
+    },
+    'quick' : {
+        'startup' : {'instances' : [1, 4], 'lazy' : [False]},
+        'ipc' : {'grid' : [10, 100], 'transport' : ['pipe', 'shared_memory']},
+        'exchange' : {'grid' : [10, 100], 'nvars' : [1, 4], 'transport' : ['pipe']},
+        'scaling' : {'instances' : [1, 2, 4], 'grid' : [50], 'transport' : ['pipe']},
+        'output' : {'grid' : [100], 'writer' : ['master', 'workers']},
+    },
+}
+
+# metrics for which a higher value is better, lower is better for
+# all other metrics
+HIGHER_IS_BETTER = ('throughput',)
+
+
+def create_case(path, instances=2, nx=100, ny=100, nvars=3, cost=1, dt=1.,
+                tstop=100., interval=None, transport='pipe', config={}):
+    '''Create model configuration using the mock model engine
+
+    All instances run simultaneously and exchange all variables of
+    the :class:`~xbeachmi.mock.MockEngine`.
+
+    Parameters
+    ----------
+    path : str
+        path to model directory, created if it does not exist
+    instances : int, optional
+        number of instances
+    nx, ny : int, optional
+        number of grid cells
+    nvars : int, optional
+        number of variables
+    cost : int, optional
+        number of smoothing sweeps per update
+    dt : float, optional
+        model time step
+    tstop : float, optional
+        end time
+    interval : float, optional
+        aggregation interval, defaults to the model time step
+    transport : str, optional
+        exchange transport
+    config : dict, optional
+        additional configuration keywords
+
+    Returns
+    -------
+    str
+        path to configuration file
+
+    '''
+
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    names = ['instance%d' % i for i in range(instances)]
+    variables = ['zb', 'zs', 'H'][:nvars] + ['var%d' % i for i in range(3, nvars)]
+
+    with open(os.path.join(path, 'params.txt'), 'w') as fp:
+        for key, value in [('nx', nx), ('ny', ny), ('nvars', nvars), ('cost', cost),
+                           ('dt', dt), ('tstart', 0.), ('tstop', tstop)]:
+            fp.write('%s = %s\n' % (key, value))
+
+    cfg = {
+        'engine' : 'mock',
+        'params_file' : 'params.txt',
+        'instances' : names,
+        'scenario' : [[0., names]],
+        'transport' : transport,
+        'exchange' : variables,
+        'aggregate' : {'interval' : interval or dt},
+    }
+    cfg.update(config)
+
+    configfile = os.path.join(path, 'config.json')
+    with open(configfile, 'w') as fp:
+        json.dump(cfg, fp, indent=4)
+
+    return configfile
+
+
+def get_environment():
+    '''Return description of the benchmark environment
+
+    Returns
+    -------
+    dict
+        versions of Python and numpy, platform, number of CPUs and
+        git revision of the source code, if available
+
+    '''
+
+    revision = None
+    try:
+        revision = subprocess.check_output(
+            ['git', 'describe', '--always', '--dirty'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+
+    return {
+        'python' : platform.python_version(),
+        'numpy' : np.__version__,
+        'platform' : platform.platform(),
+        'cpus' : os.cpu_count(),
+        'revision' : revision,
+    }
+
+
+def run_coupling(engine):
+    '''Run coupled simulation until the end time
+
+    Parameters
+    ----------
+    engine : XBeachMI
+        initialized model
+
+    Returns
+    -------
+    int
+        number of coupling events
+
+    '''
+
+    n = 0
+    while engine.get_current_time() < engine.get_end_time():
+        engine.advance_to(engine.get_next_event_time())
+        n += 1
+    return n
+
+
+def bench_startup(path, instances=4, lazy=False, repeat=3):
+    '''Measure configuration, initialization and finalization time
+
+    The first configuration creates the model directories, while
+    the second reuses them. With lazy startup, only the first
+    instance is started upon initialization.
+
+    Parameters
+    ----------
+    path : str
+        path to model directory
+    instances : int, optional
+        number of instances
+    lazy : bool, optional
+        start instances lazily
+    repeat : int, optional
+        number of repetitions, the median is reported
+
+    Returns
+    -------
+    dict
+        dict with metric names (keys) and values (values)
+
+    '''
+
+    metrics = {'configure_time' : [], 'reconfigure_time' : [],
+               'initialize_time' : [], 'finalize_time' : []}
+
+    config = {'startup' : {'lazy' : lazy}}
+    if lazy:
+        config['scenario'] = [[0., 'instance0']]
+
+    for i in range(repeat):
+        case = os.path.join(path, 'run%d' % i)
+        configfile = create_case(case, instances=instances, nx=10, ny=10,
+                                 config=config)
+
+        t0 = time.perf_counter()
+        XBeachMI(configfile).close()
+        t1 = time.perf_counter()
+        engine = XBeachMI(configfile)
+        t2 = time.perf_counter()
+        engine.initialize()
+        t3 = time.perf_counter()
+        engine.finalize()
+        t4 = time.perf_counter()
+
+        metrics['configure_time'].append(t1 - t0)
+        metrics['reconfigure_time'].append(t2 - t1)
+        metrics['initialize_time'].append(t3 - t2)
+        metrics['finalize_time'].append(t4 - t3)
+
+    return {k : float(np.median(v)) for k, v in metrics.items()}
+
+
+def bench_ipc(path, grid=100, transport='pipe', repeat=200):
+    '''Measure round-trip latency and data throughput between processes
+
+    The latency is measured with requests without data, the
+    throughput by reading a single variable from a single instance.
+
+    Parameters
+    ----------
+    path : str
+        path to model directory
+    grid : int, optional
+        number of grid cells in both directions
+    transport : str, optional
+        exchange transport
+    repeat : int, optional
+        number of requests
+
+    Returns
+    -------
+    dict
+        dict with metric names (keys) and values (values)
+
+    '''
+
+    configfile = create_case(path, instances=1, nx=grid, ny=grid, nvars=1,
+                             transport=transport)
+
+    with XBeachMI(configfile) as engine:
+
+        engine.get_start_time()
+        t0 = time.perf_counter()
+        for i in range(repeat):
+            engine.get_start_time()
+        latency = (time.perf_counter() - t0) / repeat
+
+        nbytes = engine.get_instance_vars(['zb'])['instance0']['zb'].nbytes
+        t0 = time.perf_counter()
+        for i in range(repeat):
+            engine.get_instance_vars(['zb'])
+        dt = time.perf_counter() - t0
+
+    return {
+        'latency' : latency,
+        'get_var_time' : dt / repeat,
+        'throughput' : nbytes * repeat / dt,
+        'bytes' : nbytes,
+    }
+
+
+def bench_exchange(path, grid=100, nvars=3, transport='pipe', steps=50):
+    '''Measure exchange latency of two simultaneously running instances
+
+    Variables are aggregated and exchanged after every time step.
+    The exchange time is taken from the coupling phases recorded by
+    the :class:`~xbeachmi.profiler.Profiler`.
+
+    Parameters
+    ----------
+    path : str
+        path to model directory
+    grid : int, optional
+        number of grid cells in both directions
+    nvars : int, optional
+        number of exchanged variables
+    transport : str, optional
+        exchange transport
+    steps : int, optional
+        number of time steps
+
+    Returns
+    -------
+    dict
+        dict with metric names (keys) and values (values)
+
+    '''
+
+    configfile = create_case(path, instances=2, nx=grid, ny=grid, nvars=nvars,
+                             cost=0, tstop=steps, transport=transport)
+
+    with XBeachMI(configfile, profile=True) as engine:
+        t0 = time.perf_counter()
+        n = run_coupling(engine)
+        dt = time.perf_counter() - t0
+        phases = engine.profiler.to_dict()['phases']
+
+    exchange = sum([phases[name]['total'] for name in
+                    ['aggregate_data', 'wake', 'sync_time', 'exchange_data']
+                    if name in phases.keys()])
+
+    return {
+        'step_time' : dt / n,
+        'exchange_time' : exchange / n,
+        'update_time' : phases.get('update', {}).get('total', 0.) / n,
+        'bytes' : 8 * (grid + 1) ** 2 * nvars,
+    }
+
+
+def bench_scaling(path, instances=4, grid=200, transport='pipe', steps=20):
+    '''Measure wall-clock time of simultaneously running instances
+
+    Each instance performs the same amount of work, so that the
+    time per coupling event stays constant with perfect scaling.
+
+    Parameters
+    ----------
+    path : str
+        path to model directory
+    instances : int, optional
+        number of instances
+    grid : int, optional
+        number of grid cells in both directions
+    transport : str, optional
+        exchange transport
+    steps : int, optional
+        number of time steps
+
+    Returns
+    -------
+    dict
+        dict with metric names (keys) and values (values)
+
+    '''
+
+    configfile = create_case(path, instances=instances, nx=grid, ny=grid, nvars=3,
+                             cost=10, tstop=steps, transport=transport)
+
+    with XBeachMI(configfile) as engine:
+        t0 = time.perf_counter()
+        n = run_coupling(engine)
+        dt = time.perf_counter() - t0
+
+    return {
+        'step_time' : dt / n,
+        'instance_step_time' : dt / n / instances,
+    }
+
+
+def bench_output(path, grid=100, writer='master', steps=50):
+    '''Measure output write throughput
+
+    Output is either written by the master process through a
+    :class:`~xbeachmi.output.BackgroundWriter`, or by the instance
+    processes themselves, see
+    :func:`~xbeachmi.model.XBeachMI.write_output`.
+
+    Parameters
+    ----------
+    path : str
+        path to model directory
+    grid : int, optional
+        number of grid cells in both directions
+    writer : str, optional
+        "master" or "workers"
+    steps : int, optional
+        number of output time steps
+
+    Returns
+    -------
+    dict or None
+        dict with metric names (keys) and values (values) or None
+        if netCDF4 is not available
+
+    '''
+
+    if not xbeachmi.netcdf.HAVE_NETCDF:
+        return None
+
+    configfile = create_case(path, instances=2, nx=grid, ny=grid, nvars=3,
+                             cost=0, tstop=steps)
+    variables = ['zb', 'zs', 'H']
+    ncfile = os.path.join(path, 'output.nc')
+
+    with XBeachMI(configfile) as engine:
+
+        dimensions = {'x' : np.arange(grid + 1), 'y' : np.arange(grid + 1)}
+        output = {var : {'dimensions' : engine.get_dimensions(var)} for var in variables}
+        options = {'latlon' : False}
+
+        t0 = time.perf_counter()
+        if writer == 'master':
+            xbeachmi.netcdf.initialize(ncfile, dimensions, output, **options)
+            with xbeachmi.output.BackgroundWriter(ncfile, buffer_size=10) as w:
+                for i in range(steps):
+                    values = {var : engine.get_var(var) for var in variables}
+                    values['time'] = float(i)
+                    values['instance'] = ', '.join(engine.running)
+                    w.append(values)
+            nbytes = steps * sum([engine.get_var(var).nbytes for var in variables])
+        else:
+            engine.init_output(ncfile, dimensions, output,
+                               options=dict(options, buffer_size=10))
+            for i in range(steps):
+                engine.write_output(float(i), variables)
+            engine.flush_output()
+            nbytes = steps * len(engine.running) * sum(
+                [engine.get_var(var).nbytes for var in variables])
+        dt = time.perf_counter() - t0
+
+    return {
+        'write_time' : dt / steps,
+        'throughput' : nbytes / dt,
+    }
+
+
+def get_combinations(parameters):
+    '''Return all combinations of benchmark parameters
+
+    Parameters
+    ----------
+    parameters : dict
+        dict with parameter names (keys) and lists of values
+        (values)
+
+    Returns
+    -------
+    list
+        list of dicts with parameter names (keys) and values
+        (values)
+
+    '''
+
+    combinations = [{}]
+    for key, values in parameters.items():
+        combinations = [dict(c, **{key : value}) for c in combinations for value in values]
+    return combinations
+
+
+def run(benchmarks=BENCHMARKS, suite='full', path=None):
+    '''Run benchmark suite
+
+    Each benchmark is run in its own temporary model directory,
+    which is removed afterwards. Benchmarks that fail or cannot run
+    in the current environment, like output benchmarks without
+    netCDF4, are reported with the reason instead of metrics.
+
+    Parameters
+    ----------
+    benchmarks : list, optional
+        names of benchmarks, see :data:`BENCHMARKS`
+    suite : str, optional
+        parameter set, either "full" or "quick", see
+        :data:`PARAMETERS`
+    path : str, optional
+        directory in which model directories are created, defaults
+        to the system temporary directory
+
+    Returns
+    -------
+    dict
+        benchmark report with format version ("format"), creation
+        time ("created"), environment ("environment", see
+        :func:`get_environment`), parameter set ("suite") and a list
+        of results ("results"), each with the benchmark name
+        ("benchmark"), parameters ("parameters") and either metrics
+        ("metrics") or the reason it was skipped ("skipped")
+
+    '''
+
+    if suite not in PARAMETERS.keys():
+        raise ValueError('Unsupported benchmark suite [%s]' % suite)
+
+    report = {
+        'format' : FORMAT,
+        'created' : time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment' : get_environment(),
+        'suite' : suite,
+        'results' : [],
+    }
+
+    for name in benchmarks:
+        if name not in BENCHMARKS:
+            raise ValueError('Unknown benchmark [%s]' % name)
+
+        fcn = getattr(sys.modules[__name__], 'bench_%s' % name)
+        for parameters in get_combinations(PARAMETERS[suite][name]):
+
+            logger.info('Running benchmark "%s" with %s...' % (name, parameters))
+
+            result = {'benchmark' : name, 'parameters' : parameters}
+            tmpdir = tempfile.mkdtemp(prefix='xbeachmi_%s_' % name, dir=path)
+            try:
+                metrics = fcn(tmpdir, **parameters)
+                if metrics is None:
+                    result['skipped'] = 'not supported in this environment'
+                else:
+                    result['metrics'] = metrics
+            except Exception as e:
+                logger.error('Benchmark "%s" failed: %s' % (name, e))
+                result['skipped'] = 'failed: %s' % e
+            finally:
+                shutil.rmtree(tmpdir, ignore_errors=True)
+
+            report['results'].append(result)
+
+    return report
+
+
+def compare(old, new, threshold=.1):
+    '''Compare two benchmark reports
+
+    Results are matched by benchmark name and parameters. A metric
+    has regressed if it changed for the worse by more than the
+    threshold, where higher is better for metrics ending with any of
+    :data:`HIGHER_IS_BETTER` and lower is better otherwise.
+
+    Parameters
+    ----------
+    old : dict
+        reference benchmark report, see :func:`run`
+    new : dict
+        benchmark report
+    threshold : float, optional
+        relative change considered significant
+
+    Returns
+    -------
+    list
+        list of dicts with benchmark name ("benchmark"), parameters
+        ("parameters"), metric name ("metric"), old and new value
+        ("old" and "new"), ratio of new and old value ("ratio") and
+        status ("status"), which is either "regressed", "improved"
+        or "unchanged"
+
+    '''
+
+    def key(result):
+        return (result['benchmark'], json.dumps(result['parameters'], sort_keys=True))
+
+    reference = {key(result) : result for result in old['results']
+                 if 'metrics' in result.keys()}
+
+    comparison = []
+    for result in new['results']:
+        if 'metrics' not in result.keys() or key(result) not in reference.keys():
+            continue
+
+        metrics = reference[key(result)]['metrics']
+        for metric, value in result['metrics'].items():
+            if metric == 'bytes' or metric not in metrics.keys():
+                continue
+            if metrics[metric] == 0:
+                continue
+
+            ratio = value / metrics[metric]
+            change = ratio - 1.
+            if metric.endswith(HIGHER_IS_BETTER):
+                change = -change
+
+            status = 'unchanged'
+            if change > threshold:
+                status = 'regressed'
+            elif change < -threshold:
+                status = 'improved'
+
+            comparison.append({
+                'benchmark' : result['benchmark'],
+                'parameters' : result['parameters'],
+                'metric' : metric,
+                'old' : metrics[metric],
+                'new' : value,
+                'ratio' : ratio,
+                'status' : status,
+            })
+
+    return comparison
+
+
+def save(fname, report):
+    '''Write benchmark report to JSON file
+
+    Parameters
+    ----------
+    fname : str
+        path to report file
+    report : dict
+        benchmark report, see :func:`run`
+
+    '''
+
+    with open(fname, 'w') as fp:
+        json.dump(report, fp, indent=2)
+
+
+def load(fname):
+    '''Read benchmark report from JSON file
+
+    Parameters
+    ----------
+    fname : str
+        path to report file
+
+    Returns
+    -------
+    dict
+        benchmark report, see :func:`run`
+
+    '''
+
+    if not os.path.exists(fname):
+        raise IOError('Benchmark report not found [%s]' % fname)
+
+    with open(fname, 'r') as fp:
+        report = json.load(fp)
+
+    if report.get('format') != FORMAT:
+        raise ValueError('Unsupported benchmark report format [%s]' % fname)
+
+    return report
@@ -0,0 +1,191 @@
+from __future__  import absolute_import
+
+import os
+import json
+import time
+import logging
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+
+# initialize log
+logger = logging.getLogger(__name__)
+
+
+def save(fname, state):
+    '''Write checkpoint file
+
+    The file is written under a temporary name first and renamed
+    afterwards, such that an interrupted write never corrupts an
+    existing checkpoint.
+
+    Parameters
+    ----------
+    fname : str
+        path to checkpoint file
+    state : dict
+        simulation state, see
+        :func:`~xbeachmi.model.XBeachMI.get_state`, with optional
+        additional scalar items
+
+    '''
+
+    state = dict(state)
+    instances = state.pop('instances')
+    data = state.pop('data')
+
+    arrays = {}
+    meta = {'instances' : {}, 'data' : []}
+    for i, (instance, variables) in enumerate(instances.items()):
+        meta['instances'][instance] = []
+        for j, (var, value) in enumerate(variables.items()):
+            arrays['i%d_v%d' % (i, j)] = np.asarray(value)
+            meta['instances'][instance].append(var)
+    for j, (var, value) in enumerate(data.items()):
+        arrays['d%d' % j] = np.asarray(value)
+        meta['data'].append(var)
+    meta['state'] = state
+
+    arrays['meta'] = np.asarray(json.dumps(meta, default=_to_json))
+
+    tmpfile = '%s.tmp' % fname
+    with open(tmpfile, 'wb') as fp:
+        np.savez(fp, **arrays)
+    os.replace(tmpfile, fname)
+
+
+def load(fname):
+    '''Read checkpoint file
+
+    Parameters
+    ----------
+    fname : str
+        path to checkpoint file
+
+    Returns
+    -------
+    dict
+        simulation state, see :func:`save`
+
+    '''
+
+    if not os.path.exists(fname):
+        raise IOError('Checkpoint file not found [%s]' % fname)
+
+    with np.load(fname) as f:
+        meta = json.loads(str(f['meta']))
+        state = meta['state']
+        state['instances'] = {
+            instance : {var : f['i%d_v%d' % (i, j)] for j, var in enumerate(variables)}
+            for i, (instance, variables) in enumerate(meta['instances'].items())
+        }
+        state['data'] = {var : f['d%d' % j] for j, var in enumerate(meta['data'])}
+
+    return state
+
+
+def _to_json(x):
+    '''Convert numpy scalars to JSON serializable types'''
+
+    if isinstance(x, np.generic):
+        return x.item()
+    raise TypeError('Object of type %s is not JSON serializable' % type(x).__name__)
+
+
+class Checkpointer:
+    '''Periodic, asynchronous checkpoint writer
+
+    Decides when a checkpoint is due, based on simulation time
+    and/or wall-clock time, and writes checkpoint files in a
+    background thread, such that the simulation can continue while
+    the file is written. At most one checkpoint is written at a time.
+
+    '''
+
+
+    def __init__(self, fname, interval=None, wall_interval=None):
+        '''Initialize the class
+
+        Parameters
+        ----------
+        fname : str
+            path to checkpoint file
+        interval : float, optional
+            simulation time between checkpoints
+        wall_interval : float, optional
+            wall-clock time in seconds between checkpoints
+
+        '''
+
+        self.fname = fname
+        self.interval = interval
+        self.wall_interval = wall_interval
+        self.last = None
+        self.last_wall = time.time()
+        self.pool = ThreadPoolExecutor(max_workers=1)
+        self.future = None
+
+
+    def due(self, t):
+        '''Check if a checkpoint is due
+
+        Parameters
+        ----------
+        t : float
+            current simulation time
+
+        Returns
+        -------
+        bool
+            checkpoint is due
+
+        '''
+
+        if self.last is None:
+            self.last = t
+
+        if self.interval is not None and \
+           np.floor(t / self.interval) > np.floor(self.last / self.interval):
+            return True
+        if self.wall_interval is not None and \
+           time.time() - self.last_wall >= self.wall_interval:
+            return True
+        return False
+
+
+    def save(self, t, state):
+        '''Write checkpoint in the background
+
+        Waits for the previous checkpoint to be written first.
+
+        Parameters
+        ----------
+        t : float
+            current simulation time
+        state : dict
+            simulation state, see :func:`save`
+
+        '''
+
+        self.wait()
+        logger.debug('Writing checkpoint at t=%0.2f...' % t)
+        self.future = self.pool.submit(save, self.fname, state)
+        self.last = t
+        self.last_wall = time.time()
+
+
+    def wait(self):
+        '''Wait for the checkpoint being written, if any'''
+
+        if self.future is not None:
+            future, self.future = self.future, None
+            future.result()
+
+
+    def close(self):
+        '''Wait for the checkpoint being written and stop background thread'''
+
+        try:
+            self.wait()
+        finally:
+            self.pool.shutdown()
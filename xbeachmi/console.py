@@ -1,22 +1,29 @@
 from __future__  import absolute_import
 
+import os
+import sys
+import json
 import docopt
 import logging
 
-from xbeachmi.model import XBeachMIWrapper
+import xbeachmi.netcdf as netcdf
+import xbeachmi.benchmark as benchmark
+from xbeachmi.model import XBeachMI, XBeachMIWrapper
 
 
 def xbeachmi():
     '''xbeach-mi : XBeach wrapper for running multiple parallel instances
 
 Usage:
-    xbeach-mi <config> [--verbose=LEVEL]
+    xbeach-mi <config> [--restart] [--profile] [--verbose=LEVEL]
 
 Positional arguments:
     config             configuration file
 
 Options:
     -h, --help         show this help message and exit
+    --restart          restart from last checkpoint
+    --profile          export performance statistics, see "profile" in configuration
     --verbose=LEVEL    print logging messages [default: 30]
 
     '''
@@ -31,7 +38,111 @@ Options:
         logging.root.setLevel(logging.NOTSET)
 
     # start model
-    XBeachMIWrapper(configfile=arguments['<config>']).run()
+    XBeachMIWrapper(configfile=arguments['<config>'],
+                    restart=arguments['--restart'],
+                    profile=True if arguments['--profile'] else None).run()
+
+
+
+def xbeachmi_merge():
+    '''xbeach-mi-merge : merge netCDF output files written by individual instances
+
+Usage:
+    xbeach-mi-merge <config> [--output=FILE] [--verbose=LEVEL]
+
+Positional arguments:
+    config             configuration file
+
+Options:
+    -h, --help         show this help message and exit
+    --output=FILE      merged output file, defaults to output file in configuration
+    --verbose=LEVEL    print logging messages [default: 30]
+
+    '''
+
+    arguments = docopt.docopt(xbeachmi_merge.__doc__)
+
+    # initialize logger
+    if arguments['--verbose'] is not None:
+        logging.basicConfig(format='%(asctime)-15s %(name)-8s %(levelname)-8s %(message)s')
+        logging.root.setLevel(int(arguments['--verbose']))
+    else:
+        logging.root.setLevel(logging.NOTSET)
+
+    # read configuration file
+    fpath = os.path.dirname(os.path.abspath(arguments['<config>']))
+    with open(arguments['<config>'], 'r') as fp:
+        config = json.load(fp)
+
+    cfg = config['netcdf']
+    outputfile = arguments['--output']
+    if outputfile is None:
+        outputfile = os.path.join(fpath, cfg['outputfile'])
+
+    # merge output files of all instances
+    ncfiles = {instance : os.path.join(fpath, '.%s' % instance,
+                                       os.path.basename(cfg['outputfile']))
+               for instance in XBeachMI.get_instance_names(config, path=fpath)}
+    netcdf.merge(ncfiles, outputfile, encoding=cfg.get('encoding'))
+
+
+
+def xbeachmi_benchmark():
+    '''xbeach-mi-benchmark : measure coupling performance using a mock model engine
+
+Usage:
+    xbeach-mi-benchmark run [<benchmark>...] [--quick] [--output=FILE] [--tmpdir=PATH] [--verbose=LEVEL]
+    xbeach-mi-benchmark compare <reference> <report> [--threshold=FRACTION] [--verbose=LEVEL]
+
+Positional arguments:
+    benchmark          benchmarks to run: startup, ipc, exchange, scaling and/or output, defaults to all
+    reference          reference benchmark report
+    report             benchmark report compared to the reference
+
+Options:
+    -h, --help         show this help message and exit
+    --quick            run reduced set of benchmark parameters
+    --output=FILE      benchmark report file [default: xbeachmi_benchmark.json]
+    --tmpdir=PATH      directory for temporary model directories
+    --threshold=FRACTION  relative change considered significant [default: 0.1]
+    --verbose=LEVEL    print logging messages [default: 20]
+
+    '''
+
+    arguments = docopt.docopt(xbeachmi_benchmark.__doc__)
+
+    # initialize logger
+    if arguments['--verbose'] is not None:
+        logging.basicConfig(format='%(asctime)-15s %(name)-8s %(levelname)-8s %(message)s')
+        logging.root.setLevel(int(arguments['--verbose']))
+    else:
+        logging.root.setLevel(logging.NOTSET)
+
+    if arguments['run']:
+        report = benchmark.run(
+            benchmarks=arguments['<benchmark>'] or benchmark.BENCHMARKS,
+            suite='quick' if arguments['--quick'] else 'full',
+            path=arguments['--tmpdir'])
+        benchmark.save(arguments['--output'], report)
+
+        for result in report['results']:
+            print('%-10s %-50s %s' % (result['benchmark'],
+                                      json.dumps(result['parameters'], sort_keys=True),
+                                      json.dumps(result.get('metrics', result.get('skipped')))))
+    else:
+        comparison = benchmark.compare(
+            benchmark.load(arguments['<reference>']),
+            benchmark.load(arguments['<report>']),
+            threshold=float(arguments['--threshold']))
+
+        for c in comparison:
+            print('%-10s %-50s %-20s %12.4g %12.4g %6.2f %s' % (
+                c['benchmark'], json.dumps(c['parameters'], sort_keys=True), c['metric'],
+                c['old'], c['new'], c['ratio'], c['status']))
+
+        # exit with error code if any metric regressed
+        if any([c['status'] == 'regressed' for c in comparison]):
+            sys.exit(1)
 
             
 if __name__ == '__main__':
@@ -0,0 +1,238 @@
+import numpy as np
+
+
+# coupling events with their own exchange set
+EVENTS = ('aggregate', 'switch')
+
+
+def parse_config(config):
+    '''Parse exchange configuration
+
+    The exchange configuration is either a list of variable names or
+    a dictionary with at least the key "variables" holding such a
+    list. The dictionary may also contain the key "delta" to enable
+    delta-encoded exchange and the key "tolerance" with a single
+    tolerance or a dictionary with a tolerance per variable. For
+    example:
+
+    .. code-block:: json
+
+       {
+           "variables" : ["zb", "zs", "H"],
+           "delta" : true,
+           "tolerance" : {
+               "zb" : 1e-4
+           }
+       }
+
+    The key "events" may hold a list of variables per coupling event
+    that replaces the default list for that event. Periodic
+    aggregations are "aggregate" events and changes of the running
+    instances are "switch" events. The key "pairs" may hold a list
+    of exchange sets for specific source and/or target instances.
+    Sources are the instances running before the event and targets
+    are the instances receiving data. For example:
+
+    .. code-block:: json
+
+       {
+           "variables" : ["zb", "zs", "H"],
+           "events" : {
+               "aggregate" : ["zb"]
+           },
+           "pairs" : [
+               {"source" : "stat", "target" : "instat", "variables" : ["zb", "zs"]}
+           ]
+       }
+
+    See :func:`get_variables`.
+
+    Parameters
+    ----------
+    config : list or dict
+        exchange configuration
+
+    Returns
+    -------
+    dict
+        exchange configuration with keys "variables", "delta",
+        "tolerance", "events" and "pairs"
+
+    '''
+
+    if isinstance(config, dict):
+        cfg = dict(config)
+    else:
+        cfg = {'variables' : config}
+
+    cfg.setdefault('variables', [])
+    cfg.setdefault('delta', False)
+    cfg.setdefault('tolerance', {})
+    cfg.setdefault('events', {})
+    cfg.setdefault('pairs', [])
+
+    for event in cfg['events'].keys():
+        if event not in EVENTS:
+            raise ValueError('Unsupported exchange event [%s]' % event)
+
+    for pair in cfg['pairs']:
+        if 'variables' not in pair.keys():
+            raise ValueError('No variables defined for exchange pair [%s > %s]' %
+                             (pair.get('source', '*'), pair.get('target', '*')))
+
+    return cfg
+
+
+def get_variables(config, event, sources, target):
+    '''Return exchange variables for a coupling event and target instance
+
+    If any exchange pair matches one of the source instances and the
+    target instance, the union of the variables of all matching pairs
+    is returned. A pair without "source" or "target" matches any
+    instance. Otherwise, the variables for the event are returned,
+    or the default variables if the event has no exchange set.
+
+    Parameters
+    ----------
+    config : dict
+        exchange configuration, see :func:`parse_config`
+    event : str
+        name of coupling event ("aggregate" or "switch")
+    sources : list
+        names of instances running before the event
+    target : str
+        name of instance receiving data
+
+    Returns
+    -------
+    list
+        variable names
+
+    '''
+
+    matched = False
+    variables = []
+    for pair in config['pairs']:
+        if 'source' in pair.keys() and pair['source'] not in sources:
+            continue
+        if 'target' in pair.keys() and pair['target'] != target:
+            continue
+        matched = True
+        variables.extend([var for var in pair['variables'] if var not in variables])
+
+    if matched:
+        return variables
+
+    return list(config['events'].get(event, config['variables']))
+
+
+def get_tolerance(config, var):
+    '''Return exchange tolerance for a variable
+
+    Parameters
+    ----------
+    config : dict
+        exchange configuration, see :func:`parse_config`
+    var : str
+        variable name
+
+    Returns
+    -------
+    float
+        tolerance
+
+    '''
+
+    tolerance = config['tolerance']
+    if isinstance(tolerance, dict):
+        return tolerance.get(var, 0.)
+    return tolerance
+
+
+def encode_delta(value, baseline, tolerance=0.):
+    '''Encode the difference between a value and a baseline
+
+    Parameters
+    ----------
+    value : np.ndarray
+        new value
+    baseline : np.ndarray
+        value currently held by the receiver
+    tolerance : float, optional
+        maximum absolute difference that is not considered a change
+
+    Returns
+    -------
+    tuple or None
+        tuple with flat indices and values of changed cells, or None
+        if a sparse representation is not smaller than the value
+        itself
+
+    '''
+
+    value = np.asarray(value)
+    if baseline is None or np.shape(baseline) != value.shape:
+        return None
+
+    if tolerance > 0.:
+        changed = np.abs(value - baseline) > tolerance
+    else:
+        changed = value != baseline
+
+    # NaN values that did not change are not different
+    if value.dtype.kind == 'f':
+        changed &= ~(np.isnan(value) & np.isnan(baseline))
+
+    idx = np.flatnonzero(changed)
+    if idx.size > 0 and idx.dtype.itemsize > 4 and value.size < 2**31:
+        idx = idx.astype(np.int32)
+
+    if idx.size * (idx.itemsize + value.itemsize) >= value.nbytes:
+        return None
+
+    return idx, value.flat[idx]
+
+
+def apply_delta(value, idx, values):
+    '''Apply encoded difference to a value
+
+    Parameters
+    ----------
+    value : np.ndarray
+        value to be updated in place
+    idx : np.ndarray
+        flat indices of changed cells
+    values : np.ndarray
+        values of changed cells
+
+    Returns
+    -------
+    np.ndarray
+        updated value
+
+    '''
+
+    value.flat[idx] = values
+    return value
+
+
+def get_all_variables(config):
+    '''Return all variables that may be exchanged in any coupling event
+
+    Parameters
+    ----------
+    config : dict
+        exchange configuration, see :func:`parse_config`
+
+    Returns
+    -------
+    list
+        variable names
+
+    '''
+
+    variables = list(config['variables'])
+    for v in list(config['events'].values()) + [p['variables'] for p in config['pairs']]:
+        variables.extend([var for var in v if var not in variables])
+
+    return variables
@@ -0,0 +1,418 @@
+from __future__  import absolute_import
+
+import os
+import time
+import asyncio
+import logging
+import traceback
+from multiprocessing.reduction import ForkingPickler
+
+
+# initialize log
+logger = logging.getLogger(__name__)
+
+
+class Channel:
+    '''Request/response channel to an instance process
+
+    Master side of a duplex pipe to an instance process. Each request
+    is a batch of commands that is sent as a single message and
+    tagged with a unique request ID. The instance process replies
+    with a single message holding the results of all commands in the
+    batch. Multiple requests can be in flight at the same time, since
+    replies are stored by request ID until they are collected.
+
+    '''
+
+
+    def __init__(self, conn, name='', profiler=None):
+        '''Initialize the class
+
+        Parameters
+        ----------
+        conn : multiprocessing.connection.Connection
+            master end of duplex pipe to instance process
+        name : str, optional
+            name of instance, used in error messages
+        profiler : xbeachmi.profiler.Profiler, optional
+            profiler that records the execution time, round-trip
+            time and size of each request
+
+        '''
+
+        self.conn = conn
+        self.name = name
+        self.rid = 0
+        self.replies = {}
+        self.pending = set()
+        self.lock = None
+        self.profiler = profiler if profiler is not None and profiler.enabled else None
+        self.sent = {}
+
+
+    def submit(self, calls):
+        '''Send batch of commands without waiting for the result
+
+        Parameters
+        ----------
+        calls : list
+            list of tuples with function name and function arguments
+
+        Returns
+        -------
+        int
+            request ID
+
+        '''
+
+        self.rid += 1
+        if self.profiler is None:
+            self.conn.send((self.rid, list(calls)))
+        else:
+            buf = ForkingPickler.dumps((self.rid, list(calls)))
+            self.conn.send_bytes(buf)
+            self.sent[self.rid] = (time.perf_counter(), [fcn for fcn, args in calls], len(buf))
+        self.pending.add(self.rid)
+        return self.rid
+
+
+    def receive(self):
+        '''Receive a single reply and store it by request ID'''
+
+        if self.profiler is None:
+            rid, ok, payload, timings = self.conn.recv()
+        else:
+            buf = self.conn.recv_bytes()
+            rid, ok, payload, timings = ForkingPickler.loads(buf)
+            self._record(rid, timings, len(buf))
+        self.replies[rid] = (ok, payload)
+
+
+    def _record(self, rid, timings, nbytes):
+        '''Record statistics of a request
+
+        The bytes of request and reply are divided equally over the
+        commands in the request.
+
+        '''
+
+        if rid not in self.sent.keys():
+            return
+
+        t0, fcns, sent = self.sent.pop(rid)
+        nbytes += sent
+        self.profiler.record_request(self.name, time.perf_counter() - t0, nbytes)
+        for fcn, dt in zip(fcns, timings):
+            self.profiler.record_call(fcn, self.name, dt, nbytes // max(1, len(fcns)))
+
+
+    def result(self, rid):
+        '''Wait for the reply to a request
+
+        Parameters
+        ----------
+        rid : int
+            request ID
+
+        Returns
+        -------
+        list
+            results of all commands in the request
+
+        '''
+
+        if rid not in self.pending:
+            raise ValueError('Unknown request [%d]' % rid)
+
+        while rid not in self.replies.keys():
+            self.receive()
+
+        return self._pop(rid)
+
+
+    async def aresult(self, rid):
+        '''Wait for the reply to a request without blocking the event loop
+
+        The pipe is registered with the running event loop and only
+        read once data is available.
+
+        Parameters
+        ----------
+        rid : int
+            request ID
+
+        Returns
+        -------
+        list
+            results of all commands in the request
+
+        '''
+
+        if rid not in self.pending:
+            raise ValueError('Unknown request [%d]' % rid)
+
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+
+        async with self.lock:
+            loop = asyncio.get_running_loop()
+            fd = self.conn.fileno()
+            while rid not in self.replies.keys():
+                if not self.conn.poll():
+                    ready = loop.create_future()
+                    loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
+                    try:
+                        await ready
+                    finally:
+                        loop.remove_reader(fd)
+                self.receive()
+
+        return self._pop(rid)
+
+
+    def _pop(self, rid):
+        '''Remove reply from storage and return results'''
+
+        self.pending.remove(rid)
+        ok, payload = self.replies.pop(rid)
+        if not ok:
+            raise RuntimeError('Request failed in "%s":\n%s' % (self.name, payload))
+
+        return payload
+
+
+class Request:
+    '''Pending requests to one or more instance processes
+
+    Returned by :func:`submit` and yielded by coupling steps to wait
+    for the replies. The replies are collected either blocking, see
+    :func:`drive`, or asynchronously, see :func:`drive_async`.
+
+    '''
+
+
+    def __init__(self, channels, strict=True):
+        '''Initialize the class
+
+        Parameters
+        ----------
+        channels : dict
+            dict with instance names (keys) and tuples with channel
+            and request ID (values)
+        strict : bool, optional
+            raise an exception if any request failed, otherwise
+            failed requests return None
+
+        '''
+
+        self.channels = channels
+        self.strict = strict
+
+
+    def split(self):
+        '''Split into separate requests per instance
+
+        Returns
+        -------
+        dict
+            dict with instance names (keys) and requests (values)
+
+        '''
+
+        return {instance : Request({instance : c}, strict=self.strict)
+                for instance, c in self.channels.items()}
+
+
+    def result(self):
+        '''Wait for all replies
+
+        Returns
+        -------
+        dict
+            dict with instance names (keys) and lists of function
+            results (values)
+
+        '''
+
+        replies = {}
+        errors = []
+        for instance, (channel, rid) in self.channels.items():
+            try:
+                replies[instance] = channel.result(rid)
+            except RuntimeError as e:
+                replies[instance] = None
+                errors.append(e)
+
+        return self._check(replies, errors)
+
+
+    async def aresult(self):
+        '''Wait for all replies without blocking the event loop
+
+        Returns
+        -------
+        dict
+            dict with instance names (keys) and lists of function
+            results (values)
+
+        '''
+
+        replies = {}
+        errors = []
+        for instance, (channel, rid) in self.channels.items():
+            try:
+                replies[instance] = await channel.aresult(rid)
+            except RuntimeError as e:
+                replies[instance] = None
+                errors.append(e)
+
+        return self._check(replies, errors)
+
+
+    def _check(self, replies, errors):
+        '''Log failed requests and raise the first if strict'''
+
+        for e in errors:
+            logger.error(str(e))
+
+        if self.strict and len(errors) > 0:
+            raise errors[0]
+
+        return replies
+
+
+def submit(channels, calls, strict=True):
+    '''Send a batch of commands to multiple instance processes
+
+    Parameters
+    ----------
+    channels : dict
+        dict with instance names (keys) and channels (values)
+    calls : dict
+        dict with instance names (keys) and lists of tuples with
+        function name and function arguments (values)
+    strict : bool, optional
+        raise an exception if any request failed, otherwise failed
+        requests return None
+
+    Returns
+    -------
+    Request
+        pending requests
+
+    '''
+
+    return Request({instance : (channels[instance], channels[instance].submit(c))
+                    for instance, c in calls.items()}, strict=strict)
+
+
+def drive(steps):
+    '''Run coupling steps blocking on each pending request
+
+    Coupling steps are generators that yield :class:`Request`
+    objects and receive the replies in return. Exceptions raised
+    while collecting the replies are raised inside the generator.
+
+    Parameters
+    ----------
+    steps : generator
+        coupling steps
+
+    Returns
+    -------
+    any
+        return value of coupling steps
+
+    '''
+
+    reply, error = None, None
+    while True:
+        try:
+            if error is None:
+                request = steps.send(reply)
+            else:
+                request = steps.throw(error)
+        except StopIteration as e:
+            return e.value
+
+        try:
+            reply, error = request.result(), None
+        except Exception as e:
+            reply, error = None, e
+
+
+async def drive_async(steps):
+    '''Run coupling steps awaiting each pending request
+
+    Asynchronous counterpart of :func:`drive`.
+
+    Parameters
+    ----------
+    steps : generator
+        coupling steps
+
+    Returns
+    -------
+    any
+        return value of coupling steps
+
+    '''
+
+    reply, error = None, None
+    while True:
+        try:
+            if error is None:
+                request = steps.send(reply)
+            else:
+                request = steps.throw(error)
+        except StopIteration as e:
+            return e.value
+
+        try:
+            reply, error = await request.aresult(), None
+        except Exception as e:
+            reply, error = None, e
+
+
+def serve(conn, execute):
+    '''Handle requests in an instance process
+
+    Receives batches of commands, executes them in order and replies
+    with all results in a single message. If a command fails, the
+    remaining commands in the batch are skipped and the traceback is
+    returned instead. The execution time of each command is returned
+    along with the results. The loop quits after a batch that
+    contains the "finalize" command.
+
+    Parameters
+    ----------
+    conn : multiprocessing.connection.Connection
+        instance end of duplex pipe to master process
+    execute : callable
+        function that takes a function name and arguments and
+        returns the result
+
+    '''
+
+    while True:
+
+        # get request from pipe
+        rid, calls = conn.recv()
+
+        results = []
+        timings = []
+        try:
+            for fcn, args in calls:
+                t0 = time.perf_counter()
+                results.append(execute(fcn, args))
+                timings.append(time.perf_counter() - t0)
+            conn.send((rid, True, results, timings))
+        except:
+            fcn, args = calls[min(len(results), len(calls)-1)]
+            logger.error('Call "%s" with "(%s)" FAILED [%d]' %
+                         (fcn, ','.join([str(x) for x in args]), os.getpid()))
+            conn.send((rid, False, traceback.format_exc(), timings))
+
+        # quit listening loop upon finalize
+        if 'finalize' in [fcn for fcn, args in calls]:
+            break
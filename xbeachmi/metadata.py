@@ -0,0 +1,104 @@
+import numpy as np
+
+import xbeachmi.sharedmem
+
+
+# dimension names in order of preference when matching variable shapes
+DIMENSIONS = ('y', 'x', 'fractions', 'layers')
+
+
+def read_sizes(config):
+    '''Read dimension sizes from a parsed XBeach configuration
+
+    Parameters
+    ----------
+    config : dict
+        key/value pairs of XBeach configuration, see
+        :class:`~xbeachmi.parsers.XBeachParser`
+
+    Returns
+    -------
+    dict
+        dict with dimension names (keys) and sizes (values)
+
+    '''
+
+    sizes = {}
+    if 'ny' in config.keys():
+        sizes['y'] = int(config['ny']) + 1
+    if 'nx' in config.keys():
+        sizes['x'] = int(config['nx']) + 1
+    if 'ngd' in config.keys():
+        sizes['fractions'] = int(config['ngd'])
+    if 'nd' in config.keys():
+        sizes['layers'] = int(config['nd'])
+
+    return sizes
+
+
+def get_dimension_names(shape, sizes):
+    '''Map the shape of a variable to dimension names
+
+    Each axis is assigned the first dimension, in the order of
+    :data:`DIMENSIONS`, that is not yet used by another axis and has
+    the same size. Axes without a matching dimension are named after
+    their size, e.g. "n5".
+
+    Parameters
+    ----------
+    shape : tuple
+        variable shape
+    sizes : dict
+        dict with dimension names (keys) and sizes (values), see
+        :func:`read_sizes`
+
+    Returns
+    -------
+    tuple
+        dimension names
+
+    '''
+
+    names = []
+    for n in shape:
+        for dim in DIMENSIONS:
+            if dim not in names and sizes.get(dim) == n:
+                names.append(dim)
+                break
+        else:
+            names.append('n%d' % n)
+
+    return tuple(names)
+
+
+def create_entry(shape, typename, sizes):
+    '''Create metadata registry entry for a variable
+
+    Parameters
+    ----------
+    shape : array_like
+        variable shape as returned by ``get_var_shape``
+    typename : str
+        BMI type name as returned by ``get_var_type``
+    sizes : dict
+        dict with dimension names (keys) and sizes (values)
+
+    Returns
+    -------
+    dict
+        dict with keys "shape", "rank", "type", "dtype" and
+        "dimensions"
+
+    '''
+
+    shape = tuple([int(n) for n in np.atleast_1d(shape)]) if shape is not None else ()
+    if isinstance(typename, bytes):
+        typename = typename.decode()
+
+    return {
+        'shape' : shape,
+        'rank' : len(shape),
+        'type' : typename,
+        'dtype' : xbeachmi.sharedmem.get_dtype(typename),
+        'dimensions' : get_dimension_names(shape, sizes),
+    }
@@ -0,0 +1,157 @@
+from __future__  import absolute_import
+
+import time
+import logging
+import numpy as np
+
+import xbeachmi.parsers
+
+
+# initialize log
+logger = logging.getLogger(__name__)
+
+# names of the first mock variables, further variables are named
+# "var3", "var4", etc.
+VARIABLES = ('zb', 'zs', 'H')
+
+# default model parameters
+DEFAULTS = {
+    'nx' : 100,
+    'ny' : 100,
+    'nvars' : 3,
+    'dt' : 1.,
+    'tstart' : 0.,
+    'tstop' : 100.,
+    'cost' : 1,
+    'sleep' : 0.,
+    'seed' : 0,
+}
+
+
+class MockEngine:
+    '''Pure-NumPy mock of a BMI compatible model engine
+
+    Mimics the part of the BMI interface of XBeach used by
+    :class:`~xbeachmi.worker.InstanceWorker`, such that the
+    coupling can be run and measured without a compiled model
+    library. Selected by setting "engine" to "mock" in the
+    configuration file.
+
+    The model parameters are read from the params.txt file of the
+    instance. The keywords "nx" and "ny" determine the grid size,
+    such that all variables have shape (ny+1, nx+1) like XBeach
+    grid variables. The keyword "nvars" sets the number of
+    variables, see :data:`VARIABLES`. Each update advances the
+    model time by "dt" until "tstop" is reached. The computational
+    cost of an update is set by "cost", the number of smoothing
+    sweeps over all variables, and "sleep", an additional idle time
+    in seconds. Missing keywords are taken from :data:`DEFAULTS`.
+
+    '''
+
+
+    def __init__(self, engine='mock', configfile=None):
+        '''Initialize the class
+
+        Parameters
+        ----------
+        engine : str, optional
+            name of model engine, ignored
+        configfile : str, optional
+            path to model configuration file (params.txt)
+
+        '''
+
+        self.configfile = configfile
+        self.params = dict(DEFAULTS)
+        self.vars = {}
+        self.t = 0.
+
+
+    def initialize(self):
+        '''Read model parameters and allocate variables'''
+
+        if self.configfile is not None:
+            params = xbeachmi.parsers.ConfigParser(self.configfile, cache=False).parse(
+                keys=list(DEFAULTS.keys()))
+            self.params.update({key : value for key, value in params.items()})
+
+        shape = (int(self.params['ny']) + 1, int(self.params['nx']) + 1)
+        rng = np.random.default_rng(int(self.params['seed']))
+
+        self.vars = {}
+        for i in range(int(self.params['nvars'])):
+            name = VARIABLES[i] if i < len(VARIABLES) else 'var%d' % i
+            self.vars[name] = rng.random(shape)
+
+        self.t = float(self.params['tstart'])
+
+        logger.debug('Initialized mock engine with %d variables of shape %s' %
+                     (len(self.vars), shape))
+
+
+    def update(self, dt=-1):
+        '''Advance model a single time step
+
+        Parameters
+        ----------
+        dt : float, optional
+            maximum time step, defaults to the model time step
+
+        '''
+
+        step = float(self.params['dt'])
+        if dt > 0:
+            step = min(dt, step)
+
+        for i in range(int(self.params['cost'])):
+            for x in self.vars.values():
+                x[1:-1,1:-1] = .2 * (x[1:-1,1:-1] + x[:-2,1:-1] + x[2:,1:-1] +
+                                     x[1:-1,:-2] + x[1:-1,2:])
+
+        if self.params['sleep'] > 0:
+            time.sleep(self.params['sleep'])
+
+        self.t += step
+
+
+    def finalize(self):
+        '''Release model variables'''
+
+        self.vars = {}
+
+
+    def get_current_time(self):
+        return self.t
+
+
+    def set_current_time(self, t):
+        self.t = t
+
+
+    def get_start_time(self):
+        return float(self.params['tstart'])
+
+
+    def get_end_time(self):
+        return float(self.params['tstop'])
+
+
+    def get_var(self, var):
+        return self.vars[var]
+
+
+    def set_var(self, var, val):
+        self.vars[var][...] = val
+
+
+    def get_var_shape(self, var):
+        return np.array(self.vars[var].shape)
+
+
+    def get_var_rank(self, var):
+        return self.vars[var].ndim
+
+
+    def get_var_type(self, var):
+        return 'double'
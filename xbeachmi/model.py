@@ -1,21 +1,35 @@
 from __future__  import absolute_import
 
 import os
-import re
 import json
-import shutil
+import time
 import logging
 import traceback
 import numpy as np
 from mako.template import Template
-from bmi.wrapper import BMIWrapper
-from bmi.api import IBmi
-from multiprocessing import Process, Queue, JoinableQueue
-from queue import Empty, Full
+from multiprocessing import Process, Pipe, Semaphore
 
 import xbeachmi.progress
 import xbeachmi.netcdf
+import xbeachmi.output
 import xbeachmi.parsers
+import xbeachmi.ipc
+import xbeachmi.worker
+import xbeachmi.sharedmem
+import xbeachmi.exchange
+import xbeachmi.aggregate
+import xbeachmi.metadata
+import xbeachmi.checkpoint
+import xbeachmi.workdir
+import xbeachmi.scenario
+import xbeachmi.profiler
+
+# the BMI interface definition is only needed for real model engines,
+# the mock engine and benchmarks run without it
+try:
+    from bmi.api import IBmi
+except ImportError:
+    IBmi = object
 
 
 # initialize log
@@ -31,7 +45,7 @@ class XBeachMIWrapper:
     '''
 
     
-    def __init__(self, configfile=None):
+    def __init__(self, configfile=None, restart=False, profile=None):
         '''Initialize the class
 
         Parameters
@@ -39,58 +53,275 @@ class XBeachMIWrapper:
         configfile : str
             path to JSON configuration file, see
             :func:`~beachmi.model.XBeachMI.load_configfile`
+        restart : bool, optional
+            restart from the last checkpoint, see
+            :func:`checkpoint_init`
+        profile : bool, optional
+            enable or disable performance instrumentation,
+            overriding the configuration file
 
         '''
 
         self.configfile = configfile
+        self.restart = restart
+        self.profile = profile
+        self.writer = None
+        self.checkpointer = None
 
 
     def run(self):
-        '''Start model time loop'''
+        '''Start model time loop
 
-        with XBeachMI(configfile=self.configfile) as self.engine:
+        The model instances are advanced from one coupling event to
+        the next, see :func:`get_next_event_time`, without waking up
+        the master process in between.
+
+        '''
+
+        with XBeachMI(configfile=self.configfile, profile=self.profile) as self.engine:
 
             self.t = 0
             self.progress = xbeachmi.progress.ProgressIndicator(
                 duration=self.engine.get_end_time()
             )
 
-            self.output_init()
-            while self.t < self.progress.duration:
-                self.progress.progress(self.t)
-                self.engine.update()
-                self.t = self.engine.get_current_time()
-                self.output()
+            try:
+                state = self.checkpoint_init()
+                self.output_init(state)
+                while self.t < self.progress.duration:
+                    self.progress.progress(self.t)
+                    self.engine.advance_to(self.get_next_event_time())
+                    self.t = self.engine.get_current_time()
+                    with self.engine.profiler.phase('output'):
+                        self.output()
+                    with self.engine.profiler.phase('checkpoint'):
+                        self.checkpoint()
+            finally:
+                self.finalize()
+
+
+    def finalize(self):
+        '''Flush and close netCDF4 output file and checkpoint writer
+
+        Waits for all queued output and the last checkpoint to be
+        written.
+
+        '''
+
+        try:
+            if self.writer is not None:
+                self.writer.close()
+                self.writer = None
+        finally:
+            if self.checkpointer is not None:
+                self.checkpointer.close()
+                self.checkpointer = None
+
+
+    def checkpoint_init(self):
+        '''Initialize checkpoints and restore state if restarting
+
+        The optional "checkpoint" section of the configuration file
+        may contain the keywords "file" (default: "xbeachmi.chk"),
+        "interval" for the simulation time between checkpoints and
+        "wall_interval" for the wall-clock time in seconds between
+        checkpoints. Checkpoints hold the exchange variables and time
+        of each instance, the scenario and aggregation state, the
+        aggregated data and the netCDF4 output index, see
+        :func:`~xbeachmi.model.XBeachMI.get_state`. They are
+        written in the background, see
+        :class:`~xbeachmi.checkpoint.Checkpointer`.
+
+        Returns
+        -------
+        dict
+            restored state, or None if not restarting
+
+        '''
+
+        cfg = self.engine.config.get('checkpoint', {})
+        fname = cfg.get('file', 'xbeachmi.chk')
+
+        state = None
+        if self.restart:
+            logger.info('Restarting from checkpoint "%s"...' % fname)
+            state = xbeachmi.checkpoint.load(fname)
+            self.engine.set_state(state)
+            self.t = state['t']
+
+        if 'interval' in cfg.keys() or 'wall_interval' in cfg.keys():
+            self.checkpointer = xbeachmi.checkpoint.Checkpointer(
+                fname,
+                interval=cfg.get('interval'),
+                wall_interval=cfg.get('wall_interval'))
+            self.checkpointer.due(self.t)
+
+        return state
+
+
+    def checkpoint(self):
+        '''Write checkpoint if due
+
+        Buffered output is flushed first, such that the output file
+        is consistent with the checkpoint.
+
+        '''
+
+        if self.checkpointer is not None and self.checkpointer.due(self.t):
+            state = self.engine.get_state()
+            state['t'] = self.t
+            if self.writer is not None:
+                self.writer.flush()
+                state['output_index'] = self.writer.tell()
+            self.checkpointer.save(self.t, state)
+
+
+    def get_next_event_time(self):
+        '''Return the time of the next coupling or output event
+
+        Returns
+        -------
+        float
+            time of next event
+
+        '''
+
+        t = self.engine.get_next_event_time()
+
+        if 'netcdf' in self.engine.config.keys():
+            interval = self.engine.config['netcdf']['interval']
+            t = min(t, (np.floor(self.t / interval) + 1.) * interval)
+
+        if self.checkpointer is not None and self.checkpointer.interval is not None:
+            interval = self.checkpointer.interval
+            t = min(t, (np.floor(self.t / interval) + 1.) * interval)
+
+        return t
 
 
-    def output_init(self):
+    def output_init(self, state=None):
         '''Initialize netCDF4 output file
 
         Creates an empty netCDF4 output file with the necessary
         dimensions, variables, attributes and coordinate reference
-        system specification (crs).
+        system specification (crs). The file is kept open by a
+        :class:`~xbeachmi.netcdf.NetCDFWriter` until
+        :func:`finalize`. The optional keywords "buffer_size" and
+        "flush_interval" in the "netcdf" section of the configuration
+        file set the number of output time steps written at once and
+        the maximum wall-clock time in seconds between writes. The
+        optional keyword "encoding" holds compression, chunking and
+        precision options per output variable, see
+        :func:`~xbeachmi.netcdf.get_encoding`. The static variables
+        lat, lon, lat_bounds and lon_bounds are omitted if the
+        optional keyword "latlon" is false.
+
+        If the optional keyword "background" is true, the output is
+        written by a separate process, see
+        :class:`~xbeachmi.output.BackgroundWriter`, and the model
+        instances continue while the output is written. The keyword
+        "queue_size" sets the number of output time steps that may
+        wait to be written before the simulation is held up.
+
+        The optional keyword "mode" determines whether the output
+        holds the aggregate of all running instances ("aggregate",
+        default), the values of each individual instance along an
+        additional "instances" dimension ("instances") or both
+        ("both"), in which case the individual values are stored in
+        variables with the suffix "_instances". Values of instances
+        that are not running are NaN.
+
+        If restarting, the existing output file is reused and
+        written from the output index stored in the checkpoint.
+
+        If the optional keyword "writer" is "workers", the output
+        is not written by the master process. Instead, each instance
+        process writes its own output file in its own model
+        directory at the output times of the master process, see
+        :func:`~xbeachmi.model.XBeachMI.write_output`. The keyword
+        "mode" is then ignored. The separate files can be merged
+        afterwards using :func:`~xbeachmi.netcdf.merge` or the
+        ``xbeach-mi-merge`` command. Output written by instance
+        processes is not restored upon restart.
+
+        Parameters
+        ----------
+        state : dict, optional
+            state restored from checkpoint, see
+            :func:`checkpoint_init`
 
         '''
 
+        index = None
+        if state is not None:
+            index = state.get('output_index')
+
         if 'netcdf' in self.engine.config.keys():
 
             logger.debug('Initializing output...')
         
             cfg = self.engine.config['netcdf']
 
+            if cfg.get('writer', 'master') not in ['master', 'workers']:
+                raise ValueError('Unsupported output writer [%s]' % cfg['writer'])
+
+            if cfg.get('writer', 'master') == 'workers':
+                self.engine.init_output(
+                    cfg['outputfile'],
+                    self.read_dimensions(),
+                    {v : { 'dimensions' : self.engine.get_dimensions(v) }
+                     for v in cfg['outputvars']},
+                    options={'attributes' : cfg['attributes'],
+                             'crs' : cfg['crs'],
+                             'encoding' : cfg.get('encoding'),
+                             'latlon' : cfg.get('latlon', True),
+                             'buffer_size' : cfg.get('buffer_size', 10),
+                             'flush_interval' : cfg.get('flush_interval', 60.)})
+                return
+
+            mode = cfg.get('mode', 'aggregate')
+            if mode not in ['aggregate', 'instances', 'both']:
+                raise ValueError('Unsupported output mode [%s]' % mode)
+
             # get dimension names for each variable
-            variables = {
-                v : { 'dimensions' : self.engine.get_dimensions(v) }
-                for v in cfg['outputvars']
-            }
-        
-            xbeachmi.netcdf.initialize(cfg['outputfile'],
-                                       self.read_dimensions(),
-                              variables=variables,
-                              attributes=cfg['attributes'],
-                              crs=cfg['crs'])
+            variables = {}
+            for v in cfg['outputvars']:
+                dims = self.engine.get_dimensions(v)
+                if mode in ['aggregate', 'both']:
+                    variables[v] = { 'dimensions' : dims }
+                if mode in ['instances', 'both']:
+                    variables[self.get_instance_name(v, mode)] = {
+                        'dimensions' : (dims[0], u'instances') + tuple(dims[1:])
+                    }
 
-        self.iout = 0
+            instances = None
+            if mode != 'aggregate':
+                instances = list(self.engine.instances.keys())
+
+            if index is None or not os.path.exists(cfg['outputfile']):
+                index = 0
+                xbeachmi.netcdf.initialize(cfg['outputfile'],
+                                           self.read_dimensions(),
+                                  variables=variables,
+                                  attributes=cfg['attributes'],
+                                  crs=cfg['crs'],
+                                  encoding=cfg.get('encoding'),
+                                  latlon=cfg.get('latlon', True),
+                                  instances=instances)
+
+            if cfg.get('background', False):
+                self.writer = xbeachmi.output.BackgroundWriter(
+                    cfg['outputfile'],
+                    buffer_size=cfg.get('buffer_size', 10),
+                    flush_interval=cfg.get('flush_interval', 60.),
+                    queue_size=cfg.get('queue_size', 4),
+                    index=index)
+            else:
+                self.writer = xbeachmi.netcdf.NetCDFWriter(
+                    cfg['outputfile'],
+                    buffer_size=cfg.get('buffer_size', 10),
+                    flush_interval=cfg.get('flush_interval', 60.),
+                    index=index)
 
         
     def output(self):
@@ -103,17 +334,76 @@ class XBeachMIWrapper:
             if self.progress.check_period(self.t, cfg['interval']):
 
                 logger.debug('Writing output at t=%0.2f...' % self.t)
+
+                if cfg.get('writer', 'master') == 'workers':
+                    self.engine.write_output(self.t, cfg['outputvars'])
+                    return
                 
                 # get dimension data for each variable
-                variables = {v : self.engine.get_var(v) for v in cfg['outputvars']}
+                mode = cfg.get('mode', 'aggregate')
+                if mode == 'aggregate':
+                    variables = {v : self.engine.get_var(v) for v in cfg['outputvars']}
+                else:
+                    variables = self.read_instances(cfg['outputvars'], mode)
                 variables['time'] = self.t
                 variables['instance'] = ', '.join(self.engine.running)
         
-                xbeachmi.netcdf.append(cfg['outputfile'],
-                                       idx=self.iout,
-                                       variables=variables)
+                self.writer.append(variables)
+
+
+    def read_instances(self, outputvars, mode):
+        '''Read output variables from all running instances at once
+
+        Parameters
+        ----------
+        outputvars : list
+            names of output variables
+        mode : str
+            output mode ("instances" or "both")
+
+        Returns
+        -------
+        dict
+            dict with variable names (keys) and values of all
+            instances stacked along the first axis, and aggregated
+            values if mode is "both" (values)
+
+        '''
+
+        running = list(self.engine.running)
+        instances = list(self.engine.instances.keys())
+        values = self.engine.get_instance_vars(outputvars, instances=running)
+
+        if mode == 'both':
+            aggregator = self.engine.create_aggregator()
+            for instance in running:
+                aggregator.add(values[instance],
+                               aggregator.get_weight(instance, running.index(instance)))
+            aggregated = aggregator.result()
+
+        variables = {}
+        for v in outputvars:
+            shape = np.shape(values[running[0]][v])
+            stack = np.full((len(instances),) + shape, np.nan)
+            for instance in running:
+                stack[instances.index(instance),...] = values[instance][v]
+            variables[self.get_instance_name(v, mode)] = stack
+            if mode == 'both':
+                variables[v] = aggregated[v]
 
-                self.iout += 1
+        if mode == 'both':
+            aggregator.close()
+
+        return variables
+
+
+    @staticmethod
+    def get_instance_name(var, mode):
+        '''Return name of output variable holding values of individual instances'''
+
+        if mode == 'both':
+            return '%s_instances' % var
+        return var
 
 
     def read_dimensions(self):
@@ -134,7 +424,8 @@ class XBeachMIWrapper:
         dimensions = {}
 
         cfg_xbeach = xbeachmi.parsers.XBeachParser(
-            self.engine.instances[self.engine.running[0]]['configfile']).parse()
+            self.engine.instances[self.engine.running[0]]['configfile']).parse(
+                keys=['nx', 'ny', 'xfile', 'yfile'])
 
         # x and y
         if len(cfg_xbeach) > 0:
@@ -154,6 +445,14 @@ class XBeachMIWrapper:
                 len(v)
             except:
                 dimensions[k] = [v]
+
+        # other dimensions of output variables, like fractions and layers
+        if 'netcdf' in self.engine.config.keys():
+            for var in self.engine.config['netcdf']['outputvars']:
+                shape = self.engine.get_var_shape(var)
+                for dim, n in zip(self.engine.get_dimensions(var)[1:], shape):
+                    if dim not in dimensions.keys():
+                        dimensions[dim] = np.arange(n)
             
         return dimensions
 
@@ -185,16 +484,38 @@ class XBeachMI(IBmi):
     '''
 
     engine = 'xbeach'
+    transport = 'pipe'
+    reduction = 'master'
     running = []
     instances = {}
+    scenario = None
+    profiler = None
     next_index = 0
     next_aggegation = 0.
     data = {}
+    times = {}
+    sent = {}
+    versions = {}
+    held = {}
+    metadata = {}
+    sizes = {}
+    max_resident = None
+    lazy = False
+    semaphore = None
+    prewarm = False
+    prewarmed = {}
+    switches = []
+    last_used = {}
+    clock = 0
+    output_args = None
+    end_time = None
+    broadcast = None
+    output_request = None
     
     dzmax = 0.05            # maximum bed level change per time step
     
 
-    def __init__(self, configfile=''):
+    def __init__(self, configfile='', profile=None):
         '''Initialize class
 
         Parameters
@@ -202,10 +523,26 @@ class XBeachMI(IBmi):
         configfile : str
             path to JSON configuration file, see
             :func:`~xbeach-mi.model.XBeachMI.load_configfile`
+        profile : bool, optional
+            enable or disable performance instrumentation,
+            overriding the configuration file
 
         '''
         
         self.configfile = configfile
+        self.profile = profile
+        self.running = []
+        self.instances = {}
+        self.data = {}
+        self.times = {}
+        self.sent = {}
+        self.versions = {}
+        self.held = {}
+        self.metadata = {}
+        self.sizes = {}
+        self.last_used = {}
+        self.prewarmed = {}
+        self.switches = []
         self.load_configfile()
 
 
@@ -247,6 +584,114 @@ class XBeachMI(IBmi):
         file and the absolute path to the params.txt template file
         used.
 
+        The keyword "scenario" is either a list of pairs of time and
+        instance name(s) or a path to a file with such a schedule,
+        see :func:`~xbeachmi.scenario.load`. The schedule is indexed
+        by time, such that long schedules and restarts at any time
+        do not require replaying the schedule.
+
+        The keyword "engine" sets the name of the BMI compatible
+        model engine library (default: "xbeach"). The engine "mock"
+        runs the pure-NumPy :class:`~xbeachmi.mock.MockEngine`
+        instead, which requires no compiled model library and is
+        used by the benchmark suite, see :mod:`~xbeachmi.benchmark`.
+
+        The optional keyword "profile" enables performance
+        instrumentation, see :class:`~xbeachmi.profiler.Profiler`,
+        which is disabled by default. It is either true or a
+        dictionary with the keywords "enabled" (default: true),
+        "file" for the path to the exported statistics without
+        extension (default: "xbeachmi_profile") and "interval" for
+        the wall-clock time in seconds between periodic exports. If
+        enabled, the statistics are always exported when the
+        instances are finalized.
+
+        The optional keyword "transport" determines how exchange
+        variables are moved between the master and instance
+        processes. The default "pipe" transport pickles all data
+        through the process pipes. The "shared_memory" transport
+        creates a named shared memory arena for each instance with a
+        slot for each exchange variable, see
+        :class:`~xbeachmi.sharedmem.SharedArena`.
+
+        The keyword "exchange" is either a list of exchange
+        variables or a dictionary with additional exchange options,
+        see :func:`~xbeachmi.exchange.parse_config`. If the option
+        "delta" is enabled, the master process keeps the last value
+        held by each instance for each exchange variable and only
+        sends the cells that changed by more than the configured
+        tolerance, or nothing at all if no cell changed. Separate
+        exchange sets can be defined per coupling event and per pair
+        of source and target instances, see
+        :func:`~xbeachmi.exchange.get_variables`. Only the variables
+        needed by any target are aggregated. Variables are not sent
+        at all to instances that already hold the current aggregate,
+        for example when switching back to the instance that ran
+        alone since the last exchange.
+
+        The optional keyword "reduction" in the "aggregate" section
+        determines where the exchange variables are aggregated. By
+        default, the "master" process collects the values of all
+        running instances. The "tree" reduction, which requires the
+        "shared_memory" transport, lets the instance processes
+        combine their values pairwise along a binary tree through
+        dedicated reduction arenas, such that the master process
+        only reads the final aggregate. Aggregated values are sent
+        back to the instances along the same tree. Tree reduction
+        supports the methods "average", "mean", "sum", "min" and
+        "max" and does not use delta-encoded exchange.
+
+        The optional keyword "hibernate" enables hibernation of idle
+        instances in sequential scenarios. It is either true or a
+        dictionary with the keyword "max_resident" that sets the
+        maximum number of instance processes kept alive. If more
+        instances are resident after a change of running instances,
+        the least recently used idle instances are finalized and
+        their processes end. Upon the next switch to a hibernated
+        instance, its process is started again and brought up to
+        date with the aggregated exchange variables. Any other model
+        state of a hibernated instance is lost. By default, or if
+        "max_resident" is zero, only the running instances are kept
+        alive.
+
+        The optional keyword "startup" is a dictionary that controls
+        the start of the instance processes. If "lazy" is true, only
+        the instances in the first scenario entry are started upon
+        initialization and the other instances are started when the
+        scenario first switches to them. Note that this changes the
+        initial exchange: with lazy startup, the data exchanged upon
+        the first scenario switch at the start of the simulation is
+        aggregated over the instances in the first scenario entry
+        only, while otherwise it is aggregated over all instances.
+        The keyword "max_concurrent" limits the number of instances
+        that initialize their model simultaneously, which avoids all
+        instances reading their model input at once. If "prewarm"
+        is true, the instances of the next scenario entry are
+        prepared in the background after each scenario switch, see
+        :func:`prewarm_instances`.
+
+        The optional keyword "workdir" is a dictionary that controls
+        the provisioning of the model directories, see
+        :func:`~xbeachmi.workdir.provision_all`. The keyword
+        "method" determines whether model input files are placed as
+        hard links ("link", default), copy-on-write clones
+        ("reflink") or copies ("copy"). Hard links share the file
+        with the source directory, so model input files should not
+        be modified in place. Files that may be written by XBeach,
+        like boundary condition files, are never hard linked, see
+        :data:`~xbeachmi.workdir.MUTABLE`. Output, log and checkpoint
+        files are not placed at all, see
+        :data:`~xbeachmi.workdir.EXCLUDE`. If "reuse" is true
+        (default), existing model directories are kept and only files
+        with changed contents are placed again. The keyword
+        "threads" sets the number of directories provisioned
+        concurrently. The params.txt template is compiled once for
+        all instances and the compiled module is cached in the
+        directory "template_cache" (default: ".templates"). A
+        params.txt file is only rendered again if the template or
+        the template variables changed, and only written if its
+        contents changed.
+
         '''
 
         if os.path.exists(self.configfile):
@@ -273,6 +718,57 @@ class XBeachMI(IBmi):
         if 'engine' in self.config.keys():
             self.engine = self.config['engine']
 
+        # read exchange configuration
+        self.exchange = xbeachmi.exchange.parse_config(self.config.get('exchange', []))
+
+        # create aggregator
+        self.aggregator = self.create_aggregator()
+
+        # set exchange transport
+        if 'transport' in self.config.keys():
+            if self.config['transport'] not in ['pipe', 'shared_memory']:
+                raise ValueError('Unsupported transport [%s]' % self.config['transport'])
+            self.transport = self.config['transport']
+
+        # set aggregation strategy
+        agg = self.config.get('aggregate', {})
+        if 'reduction' in agg.keys():
+            if agg['reduction'] not in ['master', 'tree']:
+                raise ValueError('Unsupported reduction [%s]' % agg['reduction'])
+            if agg['reduction'] == 'tree':
+                if self.transport != 'shared_memory':
+                    raise ValueError('Tree reduction requires shared memory transport')
+                xbeachmi.aggregate.get_tree_operator(self.aggregator.method)
+            self.reduction = agg['reduction']
+
+        # set hibernation of idle instances
+        if self.config.get('hibernate', False):
+            hibernate = self.config['hibernate']
+            if not isinstance(hibernate, dict):
+                hibernate = {}
+            self.max_resident = int(hibernate.get('max_resident', 0))
+
+        # set startup of instances
+        startup = self.config.get('startup', {})
+        self.lazy = bool(startup.get('lazy', False))
+        if startup.get('max_concurrent'):
+            self.semaphore = Semaphore(int(startup['max_concurrent']))
+        self.prewarm = bool(startup.get('prewarm', False))
+
+        # create profiler
+        profile = self.config.get('profile', False)
+        if not isinstance(profile, dict):
+            profile = {'enabled' : bool(profile)}
+        if self.profile is not None:
+            profile = dict(profile, enabled=self.profile)
+        self.profiler = xbeachmi.profiler.Profiler(enabled=profile.get('enabled', True),
+                                                   fname=profile.get('file', 'xbeachmi_profile'),
+                                                   interval=profile.get('interval'))
+
+        # read scenario
+        if 'scenario' in self.config.keys():
+            self.scenario = xbeachmi.scenario.load(self.config['scenario'])
+
         # read params.txt file
         if 'params_file' in self.config.keys():
             if os.path.exists(self.config['params_file']):
@@ -281,16 +777,7 @@ class XBeachMI(IBmi):
                     fpath = os.path.join(os.getcwd(), fpath)
 
                 # get instances
-                instances = []
-                if 'instances' in self.config.keys():
-                    instances.extend(self.config['instances'])
-                if 'scenario' in self.config.keys():
-                    for t, i in self.config['scenario']:
-                        if type(i) is list:
-                            instances.extend(i)
-                        else:
-                            instances.append(i)
-                instances = np.unique(instances)
+                instances = self.get_instance_names(self.config, scenario=self.scenario)
 
                 # check if instances are defined
                 if len(instances) == 0:
@@ -298,37 +785,56 @@ class XBeachMI(IBmi):
                 
                 # set initial running instances
                 self.running = list(instances)
+                if self.lazy and self.scenario is not None and len(self.scenario) > 0:
+                    self.running = self.scenario[0][1]
+                    logger.info('Lazy startup, initial data is aggregated from "%s" only...'
+                                % ', '.join(self.running))
 
                 # create a hidden model directory for each model
-                # instance listed in the configuration file and copy
-                # params.txt file and other model configuration files
-                # to the model directory
-                for instance in instances:
+                # instance listed in the configuration file and link
+                # or copy params.txt file and other model
+                # configuration files to the model directory
+                workdir = self.config.get('workdir', {})
+
+                # exclude the params.txt file, which is rendered in
+                # place, and files read or written by xbeach-mi
+                exclude = [fname]
+                for f in [os.path.basename(self.configfile),
+                          self.config.get('checkpoint', {}).get('file'),
+                          self.config.get('netcdf', {}).get('outputfile'),
+                          self.config.get('scenario'),
+                          '%s.json' % self.profiler.fname,
+                          '%s.prom' % self.profiler.fname]:
+                    if isinstance(f, str):
+                        exclude.append(os.path.relpath(os.path.abspath(f), fpath))
+
+                with open(os.path.join(fpath, fname), 'r') as fp:
+                    source = fp.read()
+                subdirs = ['.%s' % instance for instance in instances]
+                logger.debug('Provisioning working directories...')
+                xbeachmi.workdir.provision_all(fpath, subdirs, exclude=exclude,
+                                               method=workdir.get('method', 'link'),
+                                               reuse=workdir.get('reuse', True),
+                                               threads=workdir.get('threads', 4))
 
-                    logger.debug('Creating working directory "%s"...' % instance)
+                for instance in instances:
 
                     # create instance variables
+                    conn, conn_instance = Pipe(duplex=True)
                     self.instances[instance] = {'process': None,
-                                                'queue_to': JoinableQueue(),
-                                                'queue_from': Queue(),
+                                                'channel': xbeachmi.ipc.Channel(conn, instance,
+                                                                                profiler=self.profiler),
+                                                'conn': conn_instance,
                                                 'configfile': '',
-                                                'markers': {}}
-
-                    # create hidden model directory
-                    subdir = '.%s' % instance
-                    if os.path.exists(subdir):
-                        shutil.rmtree(subdir)
-                    shutil.copytree(fpath, subdir,
-                                    ignore=lambda src, files: [f
-                                                               for f in files
-                                                               if f.startswith('.') or 
-                                                               f.endswith('.nc') or
-                                                               f.endswith('.log')])
+                                                'markers': {},
+                                                'arena': None,
+                                                'reduction': None}
 
                     # create backup of original params.txt file
+                    subdir = '.%s' % instance
                     parfile = os.path.join(subdir, fname)
                     tmplfile = os.path.join(subdir, '%s.tmpl' % fname)
-                    shutil.copyfile(parfile, tmplfile)
+                    xbeachmi.workdir.write_if_changed(tmplfile, source)
 
                     # store instance-specific mako template markers
                     self.instances[instance]['markers'] = {
@@ -340,6 +846,12 @@ class XBeachMI(IBmi):
 
                     self.instances[instance]['configfile'] = os.path.abspath(parfile)
 
+                # compile template once for all instances, the
+                # compiled module is cached between runs
+                template = Template(filename=os.path.join(fpath, fname),
+                                    module_directory=os.path.abspath(
+                                        workdir.get('template_cache', '.templates')))
+
                 # render templates
                 for instance in self.instances.values():
 
@@ -347,122 +859,594 @@ class XBeachMI(IBmi):
                     markers = instance['markers']
                     markers['instances'] = self.instances.keys()
 
+                    # skip rendering if template and markers did not change
+                    key = xbeachmi.workdir.get_render_hash(source, markers)
+                    keyfile = os.path.join(markers['path'], '.%s.sha1' % fname)
+                    if os.path.exists(keyfile) and os.path.exists(markers['parfile']):
+                        with open(keyfile, 'r') as fp:
+                            if fp.read() == key:
+                                continue
+
                     logger.debug('Rendering template "%s"...' % markers['tmplfile'])
-                    
-                    template = Template(filename=markers['tmplfile'])
-                    with open(markers['parfile'], 'w') as fp:
-                        rendered = template.render(**markers)
-                        fp.write('defuse = 0\n') # disable time explosion checks
-                        fp.write(rendered)
+
+                    rendered = 'defuse = 0\n' # disable time explosion checks
+                    rendered += template.render(**markers)
+                    xbeachmi.workdir.write_if_changed(markers['parfile'], rendered)
+                    with open(keyfile, 'w') as fp:
+                        fp.write(key)
+
+
+    @staticmethod
+    def get_instance_names(config, scenario=None, path=''):
+        '''Return names of all instances in a configuration
+
+        Parameters
+        ----------
+        config : dict
+            contents of JSON configuration file
+        scenario : xbeachmi.scenario.Scenario, optional
+            schedule of running instances, read from the
+            configuration if not given
+        path : str, optional
+            directory relative to which a scenario file is resolved
+
+        Returns
+        -------
+        np.ndarray
+            unique instance names
+
+        '''
+
+        instances = []
+        if 'instances' in config.keys():
+            instances.extend(config['instances'])
+        if scenario is None and 'scenario' in config.keys():
+            scenario = xbeachmi.scenario.load(config['scenario'], path=path)
+        if scenario is not None:
+            instances.extend(scenario.get_instances())
+        return np.unique(instances)
 
 
     def update_instances(self):
         '''Change and/or update running instances'''
 
+        return self._drive(self._update_instances())
+
+
+    def _update_instances(self):
+        '''Coupling steps of :func:`update_instances`'''
+
+        t = yield from self._get_current_time()
+
+        aggregate = False
         if 'aggregate' in self.config.keys():
             if 'interval' in self.config['aggregate'].keys():
-                t = self._call('get_current_time')
                 if t >= self.next_aggegation:
-                    logger.debug('Aggregate instances...')
-                    self.set_instances(self.running)
+                    aggregate = True
                     self.next_aggegation = t + self.config['aggregate']['interval']
-                    return
 
-        if 'scenario' in self.config.keys():
-            if self.next_index < len(self.config['scenario']):
-                t = self.get_current_time()
-                tc, instances = self.config['scenario'][self.next_index]
-                if t >= tc:
-                    logger.debug('Update instances...')
-                    self.set_instances(instances)
-                    self.next_index += 1
-                    return
+        if self.scenario is not None:
+            instances = None
+            index = self.scenario.get_index(t)
+            if index > self.next_index:
+                instances = self.scenario[index - 1][1]
+                self.next_index = index
+
+            if instances is not None:
+                logger.debug('Update instances...')
+                yield from self._set_instances(instances)
+                if self.prewarm:
+                    self.prewarm_instances()
+                return
 
+        if aggregate:
+            logger.debug('Aggregate instances...')
+            yield from self._set_instances(self.running, event='aggregate')
 
-    def set_instances(self, instances):
+
+    def set_instances(self, instances, event='switch'):
         '''Change running instance, set time and exchange data
 
         Parameters
         ----------
         instances : list
             list of names of next running instances
+        event : str, optional
+            name of coupling event ("aggregate" or "switch") that
+            determines the exchange variables, see
+            :func:`~xbeachmi.exchange.get_variables`
 
         '''
 
-        self.aggregate_data()
-        
+        return self._drive(self._set_instances(instances, event=event))
+
+
+    def _set_instances(self, instances, event='switch'):
+        '''Coupling steps of :func:`set_instances`'''
+
         for instance in instances:
-            if instance in self.instances.keys():
-                self.sync_time(instance)
-                self.exchange_data(instance)
-            else:
+            if instance not in self.instances.keys():
                 raise ValueError('Invalid instance [%s]' % instance)
 
+        t0 = time.time()
+
+        yield from self._collect_prewarm(instances)
+
+        variables = {instance : xbeachmi.exchange.get_variables(self.exchange, event,
+                                                                self.running, instance)
+                     for instance in instances}
+
+        # only aggregate variables needed by any of the instances
+        needed = []
+        for v in variables.values():
+            needed.extend([var for var in v if var not in needed])
+
+        with self.profiler.phase('aggregate_data'):
+            yield from self._aggregate_data(needed)
+
+        with self.profiler.phase('wake'):
+            yield from self._wake(instances)
+        
+        with self.profiler.phase('sync_time'):
+            yield from self._sync_time(instances)
+        with self.profiler.phase('exchange_data'):
+            yield from self._exchange_data(instances, variables)
+
         self.running = instances
+
+        for instance in instances:
+            self.clock += 1
+            self.last_used[instance] = self.clock
+        yield from self._hibernate_idle()
+
+        if event == 'switch':
+            t = yield from self._get_current_time()
+            self.switches.append({'t' : t,
+                                  'instances' : list(instances),
+                                  'latency' : time.time() - t0})
+            logger.info('Switched to "%s" at t=%0.2f in %0.3f s' %
+                        (', '.join(instances), t, self.switches[-1]['latency']))
+
+
+    def prewarm_instances(self):
+        '''Prepare the instances of the next scenario entry in the background
+
+        Instances of the next scenario entry that are not running are
+        started, if needed, and receive the current aggregated
+        exchange variables. The commands are sent without waiting
+        for the replies, such that the preparation overlaps with the
+        time steps of the running instances. With delta-encoded
+        exchange, the scenario switch itself then only transfers the
+        cells that changed since. The data is sent through the pipes,
+        since the shared memory broadcast arena may be overwritten
+        before a prewarmed instance reads it.
+
+        '''
+
+        if self.scenario is None or self.next_index >= len(self.scenario):
+            return
+
+        tc, i = self.scenario[self.next_index]
+        instances = [name for name in i
+                     if name not in self.running and name not in self.prewarmed.keys()]
+        if len(instances) == 0:
+            return
+
+        logger.debug('Prewarming "%s"...' % ', '.join(instances))
+
+        hibernated = [name for name in instances
+                      if self.instances[name]['process'] is None]
+        calls = self._get_wake_calls(hibernated)
+
+        for name in instances:
+            calls.setdefault(name, [])
+            if self.exchange['delta']:
+                for var in xbeachmi.exchange.get_variables(self.exchange, 'switch',
+                                                           self.running, name):
+                    if var in self.data.keys() and not self._is_held(name, var):
+                        calls[name].append(('set_var', (var, self.data[var])))
+                        self._set_baseline(name, var, self.data[var])
+            self.prewarmed[name] = (self._submit({name : calls[name]}), name in hibernated)
+
+
+    def _collect_prewarm(self, instances=None):
+        '''Wait for the preparation of prewarmed instances
+
+        Parameters
+        ----------
+        instances : list, optional
+            names of instances, defaults to all prewarmed instances
+
+        '''
+
+        for name in list(self.prewarmed.keys()):
+            if instances is None or name in instances:
+                request, woken = self.prewarmed.pop(name)
+                replies = yield request
+                if woken:
+                    yield from self._complete_wake([name], replies)
+
+
+    def get_switch_stats(self):
+        '''Return statistics of scenario switches
+
+        Returns
+        -------
+        list
+            list of dicts with simulation time ("t"), names of new
+            running instances ("instances") and wall-clock time in
+            seconds needed for the switch ("latency") per switch
+
+        '''
+
+        return [dict(s) for s in self.switches]
             
 
-    def sync_time(self, instance):
-        '''Synchronize time between running instances and given instance
+    def sync_time(self, instances):
+        '''Synchronize time between running instances and given instances
 
         Parameters
         ----------
-        instance : str
-            name of instance to be synced
+        instances : str or list
+            name(s) of instance(s) to be synced
 
         '''
 
+        return self._drive(self._sync_time(instances))
+
+
+    def _sync_time(self, instances):
+        '''Coupling steps of :func:`sync_time`'''
+
         logger.debug('Synchronizing time...')
+
+        if type(instances) is not list:
+            instances = [instances]
         
         try:
-            t = self._call('get_current_time')
+            t = yield from self._get_current_time()
         except:
             logger.error('Failed to get time from "%s"!' % ', '.join(self.running))
             logger.error(traceback.format_exc())
 
         try:
-            self._call('set_current_time', (t,), instances=[instance])
+            yield from self._broadcast('set_current_time', (t,), instances=instances)
+            self.times.update({instance : t for instance in instances})
         except:
-            logger.error('Failed to set time in "%s"!' % instance)
+            logger.error('Failed to set time in "%s"!' % instances)
             logger.error(traceback.format_exc())
         
 
-    def aggregate_data(self):
-        '''Aggregate exchange values of running instances and store in aggregated storage'''
+    def aggregate_data(self, variables=None):
+        '''Aggregate exchange values of running instances and store in aggregated storage
 
-        for var in self.config['exchange']:
-            logger.debug('Aggregating "%s"...' % var)
+        All exchange variables are requested from each running
+        instance in a single batch.
 
-            vals = []
-            for instance in self.running:
-                try:
-                    vals.append(self._call('get_var', (var,)))
-                except:
-                    logger.error('Failed to get "%s" from "%s"!' % (var, instance))
-                    logger.error(traceback.format_exc())
+        Parameters
+        ----------
+        variables : list, optional
+            names of variables to aggregate, defaults to the exchange
+            variables
+
+        '''
 
-            self.data[var] = self.aggregate(tuple(vals))
+        return self._drive(self._aggregate_data(variables))
+
+
+    def _aggregate_data(self, variables=None):
+        '''Coupling steps of :func:`aggregate_data`'''
+
+        if variables is None:
+            variables = self.exchange['variables']
+        running = list(self.running)
+
+        # new aggregates are held by none of the instances, except
+        # if the aggregate equals the value of the only running
+        # instance
+        for var in variables:
+            self.versions[var] = self.versions.get(var, 0) + 1
+
+        if len(variables) == 0:
+            return
+
+        if self.reduction == 'tree':
+            tree = self._get_tree_variables(variables, running)
+            if len(tree) > 0:
+                yield from self._reduce_tree(tree, running)
+            variables = [var for var in variables if var not in tree]
+            if len(variables) == 0:
+                return
+
+        def fold(instance, r):
+            if r is None:
+                logger.error('Failed to get "%s" from "%s"!' %
+                             (', '.join(variables), instance))
+                self.sent.pop(instance, None)
+                return
+            for var, val in zip(variables, r):
+                self._set_baseline(instance, var, val)
+            self.aggregator.add(dict(zip(variables, r)),
+                                self.aggregator.get_weight(instance, running.index(instance)))
+            if len(running) == 1:
+                values.update(zip(variables, r))
+
+        logger.debug('Aggregating "%s"...' % ', '.join(variables))
+
+        values = {}
+        self.aggregator.reset()
+        yield from self._get_vars(variables, instances=running,
+                                  copy=False, callback=fold)
+        self.data.update({var : val for var, val in self.aggregator.result().items()
+                          if var in variables and val is not None})
+
+        for var, val in values.items():
+            if var in self.data.keys() and np.array_equal(self.data[var], val):
+                self._set_held(running[0], var)
         
             
-    def exchange_data(self, instance):
-        '''Exchange data from aggregated storage to given instance
+    def exchange_data(self, instances, variables=None):
+        '''Exchange data from aggregated storage to given instances
+
+        All exchange variables are sent to each instance in a single
+        batch. Variables that an instance already holds are skipped.
 
         Parameters
         ----------
-        instance : str
-            name of instance to be updated
+        instances : str or list
+            name(s) of instance(s) to be updated
+        variables : list or dict, optional
+            names of variables to exchange, or dict with instance
+            names (keys) and lists of variable names (values),
+            defaults to the exchange variables
 
         '''
 
-        for var in self.config['exchange']:
-            logger.debug('Exchanging "%s"...' % var)
+        return self._drive(self._exchange_data(instances, variables))
 
-            try:
-                self._call('set_var', (var, self.data[var]), instances=[instance])
-            except:
-                logger.error('Failed to set "%s" in "%s"!' % (var, instance))
-                logger.error(traceback.format_exc())
-            
+
+    def _exchange_data(self, instances, variables=None):
+        '''Coupling steps of :func:`exchange_data`'''
+
+        if type(instances) is not list:
+            instances = [instances]
+
+        if variables is None:
+            variables = self.exchange['variables']
+        if not isinstance(variables, dict):
+            variables = {instance : variables for instance in instances}
+
+        # group instances that need the same variables
+        groups = {}
+        for instance in instances:
+            needed = tuple([var for var in variables[instance]
+                            if var in self.data.keys() and not self._is_held(instance, var)])
+            if len(needed) > 0:
+                groups.setdefault(needed, []).append(instance)
+
+        for needed, targets in groups.items():
+            yield from self._exchange_group(list(needed), targets)
+
+
+    def _exchange_group(self, variables, instances):
+        '''Send variables from aggregated storage to instances'''
+
+        logger.debug('Exchanging "%s"...' % ', '.join(variables))
+
+        try:
+            if self.reduction == 'tree':
+                tree = self._get_tree_variables(variables, instances)
+                if len(tree) > 0:
+                    yield from self._broadcast_tree({var : self.data[var] for var in tree},
+                                                    instances)
+                    for instance in instances:
+                        for var in tree:
+                            self._set_held(instance, var)
+                variables = [var for var in variables if var not in tree]
+
+            if len(variables) > 0:
+                if self.exchange['delta']:
+                    yield from self._set_vars_delta({var : self.data[var] for var in variables},
+                                                    instances=instances)
+                else:
+                    yield from self._set_vars({var : self.data[var] for var in variables},
+                                              instances=instances)
+                for instance in instances:
+                    for var in variables:
+                        self._set_held(instance, var)
+        except:
+            logger.error('Failed to set "%s" in "%s"!' %
+                         (', '.join(variables), ', '.join(instances)))
+            logger.error(traceback.format_exc())
+
+
+    def _is_held(self, instance, var):
+        '''Check if an instance holds the current aggregate of a variable'''
+
+        return self.held.get(instance, {}).get(var) == self.versions.get(var)
+
+
+    def _set_held(self, instance, var):
+        '''Mark the current aggregate of a variable as held by an instance'''
+
+        if instance not in self.held.keys():
+            self.held[instance] = {}
+        self.held[instance][var] = self.versions.get(var)
+
+
+    def _clear_held(self, instances):
+        '''Mark all aggregates as not held by instances that were updated'''
+
+        for instance in instances:
+            self.held.pop(instance, None)
+
+
+    def _clear_baselines(self, instances):
+        '''Forget the values held by instances that were updated
+
+        The model state of an updated instance no longer matches the
+        values stored for delta encoding, see :func:`_set_baseline`.
+        Baselines of variables that are aggregated again are
+        refreshed upon aggregation, other variables are sent in full
+        upon the next exchange.
+
+        '''
+
+        for instance in instances:
+            self.sent.pop(instance, None)
+
+
+    def _get_tree_variables(self, variables, instances):
+        '''Return variables that have a reduction slot in all given instances'''
+
+        return [var for var in variables
+                if all([self.instances[instance]['reduction'] is not None and
+                        var in self.instances[instance]['reduction'].slots.keys()
+                        for instance in instances])]
+
+
+    def _reduce_tree(self, variables, instances):
+        '''Aggregate variables along a binary tree of instances
+
+        Each instance writes its (weighted) value to its reduction
+        arena. Subsequently, in each level of the tree, half of the
+        remaining instances combine the partial aggregate of a
+        neighbour into their own, see
+        :func:`~xbeachmi.aggregate.get_reduction_schedule`. The
+        master process only reads the final aggregate from the first
+        instance. The number of levels grows logarithmically with the
+        number of instances.
+
+        Parameters
+        ----------
+        variables : list
+            variable names
+        instances : list
+            names of instances to aggregate
+
+        '''
+
+        method = self.aggregator.method
+        operator = xbeachmi.aggregate.get_tree_operator(method)
+        weights = [self.aggregator.get_weight(instance, i)
+                   for i, instance in enumerate(instances)]
+
+        logger.debug('Reducing "%s" along tree...' % ', '.join(variables))
+
+        yield self._submit({instance : [('reduce_begin', (variables, weights[i], operator))]
+                            for i, instance in enumerate(instances)})
+
+        for level in xbeachmi.aggregate.get_reduction_schedule(len(instances)):
+            calls = {}
+            for i, j in level:
+                peer = self.instances[instances[j]]['reduction']
+                calls[instances[i]] = [('reduce_from', (peer.name, peer.layout,
+                                                        variables, operator))]
+            yield self._submit(calls)
+
+        root = self.instances[instances[0]]['reduction']
+        for var in variables:
+            val = root.read(var, copy=True)
+            if method in xbeachmi.aggregate.TREE_NORMALIZED:
+                if sum(weights) == 0.:
+                    raise ZeroDivisionError('Weights sum to zero, can\'t be normalized')
+                val /= sum(weights)
+            self.data[var] = val
             
+
+    def _broadcast_tree(self, variables, instances):
+        '''Set variables in instances along a binary tree of instances
+
+        The master process writes the data only to the reduction
+        arena of the first instance. Subsequently, in each level of
+        the tree, every instance that holds the data passes it on to
+        another instance, see
+        :func:`~xbeachmi.aggregate.get_broadcast_schedule`. Each
+        instance sets the variables as soon as it received the data.
+
+        Parameters
+        ----------
+        variables : dict
+            dict with variable names (keys) and values (values)
+        instances : list
+            names of instances to set the variables in
+
+        '''
+
+        names = list(variables.keys())
+
+        root = self.instances[instances[0]]['reduction']
+        for var, val in variables.items():
+            root.write(var, val)
+
+        calls = {instances[0] : [('set_var_reduced', (names,))]}
+        for level in xbeachmi.aggregate.get_broadcast_schedule(len(instances)):
+            for i, j in level:
+                peer = self.instances[instances[j]]['reduction']
+                calls[instances[i]] = [('pull_from', (peer.name, peer.layout, names)),
+                                       ('set_var_reduced', (names,))]
+            yield self._submit(calls)
+            calls = {}
+
+        if len(calls) > 0:
+            yield self._submit(calls)
+
+        for instance in instances:
+            self.sent.pop(instance, None)
+
+
+    def _set_vars_delta(self, variables, instances):
+        '''Set multiple variables in instances sending only changed cells
+
+        For each instance and variable the difference with the value
+        last held by the instance is determined. Only the flat
+        indices and values of the cells that changed more than the
+        configured tolerance are sent. Nothing is sent if no cell
+        changed. The full value is sent if the value held by the
+        instance is unknown or if the difference is not sparse.
+
+        Parameters
+        ----------
+        variables : dict
+            dict with variable names (keys) and values (values)
+        instances : list
+            names of instances to set the variables in
+
+        '''
+
+        calls = {instance : [] for instance in instances}
+        for var, val in variables.items():
+            tolerance = xbeachmi.exchange.get_tolerance(self.exchange, var)
+            full = []
+            for instance in instances:
+                baseline = self.sent.get(instance, {}).get(var)
+                delta = xbeachmi.exchange.encode_delta(val, baseline, tolerance)
+                if delta is None:
+                    full.append(instance)
+                elif len(delta[0]) > 0:
+                    calls[instance].append(('set_var_delta', (var,) + delta))
+                    xbeachmi.exchange.apply_delta(baseline, *delta)
+
+            if len(full) > 0:
+                call = self._get_set_var_call(var, val)
+                for instance in full:
+                    calls[instance].append(call)
+                    self._set_baseline(instance, var, val)
+
+        calls = {instance : c for instance, c in calls.items() if len(c) > 0}
+        if len(calls) > 0:
+            yield self._submit(calls)
+
+
+    def _set_baseline(self, instance, var, val):
+        '''Store the value currently held by an instance for delta encoding'''
+
+        if self.exchange['delta']:
+            if instance not in self.sent.keys():
+                self.sent[instance] = {}
+            self.sent[instance][var] = np.array(val, copy=True)
+
+
     def aggregate(self, x, method='average', options={}):
         '''Aggregate values
 
@@ -482,7 +1466,6 @@ class XBeachMI(IBmi):
 
         '''
         
-        x = tuple([0 if i is None else i for i in x])
         if len(x) > 0:
 
             # read config
@@ -494,73 +1477,227 @@ class XBeachMI(IBmi):
                     options = agg['options']
 
             # apply aggregation
-            if method == 'average':
-                return np.average(x, axis=0, **options)
-            else:
-                raise ValueError('Unsupported aggregation method [%s]' % method)
+            weights = self._check_aggregate_options(options).get('weights')
+            reducer = xbeachmi.aggregate.get_reducer(method)
+            reducer.reset()
+            for i, xi in enumerate(x):
+                reducer.add(xi, weights[i] if isinstance(weights, list) else 1.)
+            return reducer.result()
+
+
+    def create_aggregator(self):
+        '''Create streaming aggregator for exchange variables
+
+        The "aggregate" section of the configuration file may contain
+        the keywords "method" (e.g. "average", "median", "min", "max"
+        or any method registered with
+        :func:`~xbeachmi.aggregate.register`), "options" with
+        "weights" per instance and "threads" for the number of
+        threads used to fold the exchange variables.
+
+        Returns
+        -------
+        xbeachmi.aggregate.Aggregator
+            aggregator
+
+        '''
+
+        agg = self.config.get('aggregate', {})
+        options = self._check_aggregate_options(agg.get('options', {}))
+        return xbeachmi.aggregate.Aggregator(method=agg.get('method', 'average'),
+                                             weights=options.get('weights'),
+                                             threads=agg.get('threads', 0))
+
+
+    @staticmethod
+    def _check_aggregate_options(options):
+        '''Check if all aggregation options are supported'''
+
+        for key in options.keys():
+            if key != 'weights':
+                raise ValueError('Unsupported aggregation option [%s]' % key)
+        return options
     
 
-    def start(self):
-        '''Start all instance processes'''
-        
-        for name, instance in self.instances.items():
-            logger.debug('Starting instance "%s"...' % name)
-            self.instances[name]['process'].start()
-            
-            
     def join(self):
         '''Wait for all instance processes to be finished'''
         
         for name, instance in self.instances.items():
-            logger.debug('Joining instance "%s"...' % name)
-            self.instances[name]['process'].join()
-            
+            if instance['process'] is not None:
+                logger.debug('Joining instance "%s"...' % name)
+                instance['process'].join()
+
+
+    def get_resident(self):
+        '''Return names of instances with a live process
+
+        Returns
+        -------
+        list
+            names of instances that are not hibernated
+
+        '''
+
+        return [name for name, instance in self.instances.items()
+                if instance['process'] is not None]
+
+
+    def _hibernate_idle(self):
+        '''Hibernate least recently used idle instances exceeding the maximum'''
+
+        if self.max_resident is None:
+            return
+
+        resident = self.get_resident()
+        excess = len(resident) - max(self.max_resident, len(self.running))
+        if excess <= 0:
+            return
+
+        idle = sorted([name for name in resident
+                       if name not in self.running and name not in self.prewarmed.keys()],
+                      key=lambda name: self.last_used.get(name, 0))
+        yield from self._hibernate(idle[:excess])
+
+
+    def _hibernate(self, instances):
+        '''Finalize idle instances and end their processes
+
+        Parameters
+        ----------
+        instances : list
+            names of idle instances
+
+        '''
+
+        if len(instances) == 0:
+            return
+
+        logger.debug('Hibernating "%s"...' % ', '.join(instances))
+
+        yield self._submit({name : [('finalize', ())] for name in instances})
+
+        for name in instances:
+            self.instances[name]['process'].join()
+            self.instances[name]['process'] = None
+        self._clear_held(instances)
+        self._clear_baselines(instances)
+
+
+    def _wake(self, instances):
+        '''Restart processes of hibernated instances
+
+        Also starts instances that were not started upon
+        initialization, see :func:`start`. The processes are
+        attached to their shared memory arenas and output files, if
+        any. The exchange variables are restored by
+        the subsequent exchange, see :func:`set_instances`.
+
+        Parameters
+        ----------
+        instances : list
+            names of instances that should be resident
+
+        '''
+
+        hibernated = [name for name in instances
+                      if self.instances[name]['process'] is None]
+        if len(hibernated) == 0:
+            return
+
+        replies = yield self._submit(self._get_wake_calls(hibernated))
+        yield from self._complete_wake(hibernated, replies)
+
+
+    def _get_wake_calls(self, instances):
+        '''Start processes of hibernated instances and return wake-up commands
+
+        Parameters
+        ----------
+        instances : list
+            names of hibernated instances
+
+        Returns
+        -------
+        dict
+            dict with instance names (keys) and lists of commands
+            (values), starting with "get_current_time"
+
+        '''
+
+        if len(instances) > 0:
+            logger.debug('Waking "%s"...' % ', '.join(instances))
+
+        calls = {}
+        for name in instances:
+            self._start_instance(name)
+            calls[name] = [('get_current_time', ())]
+            if self.instances[name]['arena'] is not None:
+                calls[name].append(self._get_attach_call(name))
+            if self.output_args is not None:
+                ncfile, dimensions, variables, options = self.output_args
+                calls[name].append(('output_init', (name,
+                                                    self.get_output_file(name, ncfile),
+                                                    dimensions, variables,
+                                                    dict(options, append=True))))
+
+        return calls
+
+
+    def _complete_wake(self, instances, replies):
+        '''Process replies to wake-up commands
+
+        Parameters
+        ----------
+        instances : list
+            names of woken instances
+        replies : dict
+            dict with instance names (keys) and lists of function
+            results (values), see :func:`_get_wake_calls`
+
+        '''
+
+        self.times.update({name : replies[name][0] for name in instances})
+        self._clear_held(instances)
+
+        # cache metadata of instances that are started for the first time
+        started = [name for name in instances if name not in self.metadata.keys()]
+        if len(started) > 0:
+            variables = []
+            for metadata in self.metadata.values():
+                variables.extend([var for var in metadata.keys() if var not in variables])
+            yield from self._init_metadata(variables, instances=started)
+            
             
-    def run(self, parfile, queue_to, queue_from):
+    def run(self, parfile, conn, semaphore=None):
         '''Start instance process
 
         Parameters
         ----------
         parfile : str
             path to params.txt file for current instance
-        queue_to : multiprocessing.JoinableQueue
-            joinable queue for sharing data from master to subprocess
-        queue_from : multiprocessing.Queue
-            queue for sharing data from subprocess to master
+        conn : multiprocessing.connection.Connection
+            instance end of duplex pipe for exchanging requests and
+            replies with the master process
+        semaphore : multiprocessing.Semaphore, optional
+            semaphore that limits the number of instances
+            initializing simultaneously
 
         '''
         
         logger.info('Process #%d started...' % os.getpid())
 
         # initialize xbeach model
-        w = BMIWrapper(self.engine, configfile=parfile)
-        w.initialize()
+        if semaphore is not None:
+            semaphore.acquire()
+        try:
+            w = xbeachmi.worker.InstanceWorker(self.engine, configfile=parfile)
+            w.execute('initialize')
+        finally:
+            if semaphore is not None:
+                semaphore.release()
 
         # start listening loop
-        while True:
-
-            # get command from queue
-            q = queue_to.get()
-
-            if q:
-                fcn, args = q
-                try:
-                    # execute command and put result to queue
-                    r = getattr(w, fcn)(*args)
-                    queue_from.put(r)
-                except:
-                    # command failed
-                    logger.error('Call "%s" with "(%s)" FAILED [%d]' %
-                                 (fcn, ','.join([str(x) for x in args]), os.getpid()))
-                    queue_from.put(None)
-                    raise
-
-                # register task as completed
-                queue_to.task_done()
-
-                # quit listening loop upon finalize
-                if fcn == 'finalize':
-                    break
+        xbeachmi.ipc.serve(conn, w.execute)
                 
                 
     def __enter__(self):
@@ -575,19 +1712,254 @@ class XBeachMI(IBmi):
         
         
     def get_current_time(self):
-        return self._call('get_current_time')
+        return self._drive(self._get_current_time())
+
+
+    def _get_current_time(self):
+        if all([instance in self.times.keys() for instance in self.running]):
+            return min([self.times[instance] for instance in self.running])
+        return (yield from self._call('get_current_time'))
     
     
     def get_start_time(self):
-        return self._call('get_start_time')
+        return self._drive(self._call('get_start_time'))
     
     
     def get_end_time(self):
-        return self._call('get_end_time')
+        return self._drive(self._get_end_time())
+
+
+    def _get_end_time(self):
+        if self.end_time is None:
+            self.end_time = yield from self._call('get_end_time')
+        return self.end_time
     
     
     def get_var(self, var):
-        return self._call('get_var', (var,))
+        return self._drive(self._get_var(var))
+
+
+    def init_output(self, ncfile, dimensions, variables, options={}):
+        '''Initialize a netCDF4 output file in each instance process
+
+        Each instance process writes its own output file in its own
+        model directory, see :func:`write_output`.
+
+        Parameters
+        ----------
+        ncfile : str
+            name of netCDF4 output file
+        dimensions : dict
+            dict with dimension variables, see
+            :func:`~xbeachmi.netcdf.initialize`
+        variables : dict
+            dict of dicts with output variables
+        options : dict, optional
+            keyword arguments for :func:`~xbeachmi.netcdf.initialize`
+            and :class:`~xbeachmi.netcdf.NetCDFWriter`
+
+        '''
+
+        return self._drive(self._init_output(ncfile, dimensions, variables, options))
+
+
+    def _init_output(self, ncfile, dimensions, variables, options={}):
+        '''Coupling steps of :func:`init_output`'''
+
+        yield from self._collect_prewarm()
+
+        self.output_args = (ncfile, dimensions, variables, options)
+        yield self._submit({name : [('output_init', (name,
+                                                     self.get_output_file(name, ncfile),
+                                                     dimensions, variables, options))]
+                            for name in self.get_resident()})
+
+
+    def write_output(self, t, variables):
+        '''Let running instance processes write output variables
+
+        The command is sent without waiting for the instance
+        processes to finish writing. Errors are raised upon the next
+        call or upon finalization.
+
+        Parameters
+        ----------
+        t : float
+            output time
+        variables : list
+            names of output variables
+
+        '''
+
+        return self._drive(self._write_output(t, variables))
+
+
+    def _write_output(self, t, variables):
+        '''Coupling steps of :func:`write_output`'''
+
+        yield from self._flush_output()
+
+        self.output_request = self._submit([('output', (t, variables))],
+                                           instances=list(self.running))
+
+
+    def flush_output(self):
+        '''Wait until instance processes finished writing output
+
+        Waits for the last command sent by :func:`write_output` and
+        raises any error that occurred while writing.
+
+        '''
+
+        return self._drive(self._flush_output())
+
+
+    def _flush_output(self):
+        '''Coupling steps of :func:`flush_output`'''
+
+        if self.output_request is not None:
+            request, self.output_request = self.output_request, None
+            yield request
+
+
+    def get_output_file(self, instance, ncfile):
+        '''Return path to netCDF4 output file written by an instance process
+
+        Parameters
+        ----------
+        instance : str
+            name of instance
+        ncfile : str
+            name of netCDF4 output file
+
+        Returns
+        -------
+        str
+            path to output file in the model directory of the instance
+
+        '''
+
+        return os.path.join(os.path.dirname(self.instances[instance]['configfile']),
+                            os.path.basename(ncfile))
+
+
+    def get_state(self):
+        '''Return simulation state for checkpointing
+
+        The exchange variables of all instances are requested in a
+        single batch.
+
+        Returns
+        -------
+        dict
+            dict with current time ("t"), time of each instance
+            ("times"), running instances ("running"), scenario and
+            aggregation state ("next_index" and "next_aggegation"),
+            aggregated data ("data") and copies of the exchange
+            variables of each instance ("instances")
+
+        '''
+
+        return self._drive(self._get_state())
+
+
+    def _get_state(self):
+        '''Coupling steps of :func:`get_state`'''
+
+        yield from self._collect_prewarm()
+
+        variables = xbeachmi.exchange.get_all_variables(self.exchange)
+        replies = yield from self._get_vars(variables, instances=self.get_resident(),
+                                            copy=True, strict=True)
+        t = yield from self._get_current_time()
+
+        return {
+            't' : t,
+            'times' : dict(self.times),
+            'running' : list(self.running),
+            'next_index' : self.next_index,
+            'next_aggegation' : self.next_aggegation,
+            'data' : {var : np.array(val, copy=True) for var, val in self.data.items()},
+            'instances' : {instance : dict(zip(variables, r))
+                           for instance, r in replies.items()},
+        }
+
+
+    def set_state(self, state):
+        '''Restore simulation state from checkpoint
+
+        Sets the exchange variables and time of all instances in a
+        single batch.
+
+        Parameters
+        ----------
+        state : dict
+            simulation state, see :func:`get_state`
+
+        '''
+
+        return self._drive(self._set_state(state))
+
+
+    def _set_state(self, state):
+        '''Coupling steps of :func:`set_state`'''
+
+        for instance in state['instances'].keys():
+            if instance not in self.instances.keys():
+                raise ValueError('Invalid instance [%s]' % instance)
+        yield from self._collect_prewarm()
+        yield from self._wake(list(state['instances'].keys()))
+
+        calls = {}
+        for instance, variables in state['instances'].items():
+            calls[instance] = [('set_var', (var, val)) for var, val in variables.items()]
+            calls[instance].append(('set_current_time', (state['times'][instance],)))
+        yield self._submit(calls)
+
+        self.times.update(state['times'])
+        self.running = list(state['running'])
+        if 'next_index' in state.keys():
+            self.next_index = state['next_index']
+        elif self.scenario is not None:
+            self.next_index = self.scenario.get_index(state['t'])
+        self.next_aggegation = state['next_aggegation']
+        self.data = dict(state['data'])
+        self.sent = {}
+        self.held = {}
+
+        yield from self._hibernate_idle()
+
+
+    def get_instance_vars(self, variables, instances=None):
+        '''Get multiple variables from individual instances without aggregation
+
+        All variables are requested from all instances in a single
+        batch.
+
+        Parameters
+        ----------
+        variables : list
+            variable names
+        instances : list, optional
+            names of instances, defaults to the running instances
+
+        Returns
+        -------
+        dict
+            dict with instance names (keys) and dicts with variable
+            names and values (values)
+
+        '''
+
+        return self._drive(self._get_instance_vars(variables, instances))
+
+
+    def _get_instance_vars(self, variables, instances=None):
+        '''Coupling steps of :func:`get_instance_vars`'''
+
+        replies = yield from self._get_vars(variables, instances=instances,
+                                            copy=True, strict=True)
+        return {instance : dict(zip(variables, r)) for instance, r in replies.items()}
     
     
     def get_var_name(self, i):
@@ -596,19 +1968,50 @@ class XBeachMI(IBmi):
     
     
     def get_var_count(self, var):
-        return self._call('get_var_count', (var,))
+        return self._drive(self._call('get_var_count', (var,)))
     
 
     def get_var_rank(self, var):
-        return self._call('get_var_rank', (var,))
+        return self._drive(self._get_metadata(var))['rank']
     
     
     def get_var_shape(self, var):
-        return self._call('get_var_shape', (var,))
+        return np.asarray(self._drive(self._get_metadata(var))['shape'], dtype=int)
 
     
     def get_var_type(self, var):
-        return self._call('get_var_type', (var,))
+        return self._drive(self._get_metadata(var))['type']
+
+
+    def _get_metadata(self, var, instance=None):
+        '''Return metadata of a variable from the metadata registry
+
+        Variables that are not yet in the registry are requested
+        from the instance process once and added to the registry.
+
+        Parameters
+        ----------
+        var : str
+            variable name
+        instance : str, optional
+            name of instance, defaults to the first running instance
+
+        Returns
+        -------
+        dict
+            metadata, see :func:`~xbeachmi.metadata.create_entry`
+
+        '''
+
+        if instance is None:
+            instance = self.running[0]
+
+        if var not in self.metadata.get(instance, {}).keys():
+            missing = yield from self._init_metadata([var], instances=[instance])
+            if len(missing) > 0:
+                raise ValueError('Unknown variable [%s]' % var)
+
+        return self.metadata[instance][var]
     
     
     def inq_compound(self, var):
@@ -622,10 +2025,16 @@ class XBeachMI(IBmi):
 
     
     def set_var(self, var, val):
+        return self._drive(self._set_var_or_instance(var, val))
+
+
+    def _set_var_or_instance(self, var, val):
         if var == 'instance':
-            self.set_instance(str(val))
+            yield from self._set_instances([str(val)])
         else:
-            self._call('set_var', (var, val))
+            yield from self._set_var(var, val)
+            for instance in self.running:
+                self.held.get(instance, {}).pop(var, None)
         
         
     def set_var_index(self, var, idx):
@@ -639,16 +2048,203 @@ class XBeachMI(IBmi):
 
     
     def initialize(self):
-        '''Initialize and start instance processes'''
+        '''Initialize and start instance processes
+
+        The instance processes are finalized again if initialization
+        fails, for example due to unknown exchange or output
+        variables.
+
+        '''
+
+        self.start()
+        try:
+            return self._drive(self._initialize())
+        except:
+            self.finalize()
+            raise
+
+
+    def start(self):
+        '''Start instance processes
+
+        Starts all instance processes, or only the initial running
+        instances if startup is lazy.
+
+        '''
         
+        if self.transport == 'shared_memory':
+            xbeachmi.sharedmem.prepare()
+
+        for name in self.instances.keys():
+            if not self.lazy or name in self.running:
+                self._start_instance(name)
+
+
+    def _start_instance(self, name):
+        '''Start process of a single instance
+
+        Parameters
+        ----------
+        name : str
+            name of instance
+
+        '''
+
+        logger.debug('Starting instance "%s"...' % name)
+
+        instance = self.instances[name]
+        instance['process'] = Process(target=self.run,
+                                      args=(instance['configfile'],
+                                            instance['conn'],
+                                            self.semaphore))
+        instance['process'].start()
+
+
+    def _initialize(self):
+        '''Coupling steps of :func:`initialize`'''
+
+        # cache current time of each instance
+        replies = yield from self._call_batch([('get_current_time', ())],
+                                              instances=self.get_resident())
+        self.times = {instance : r[0] for instance, r in replies.items()}
+
+        # cache metadata of exchange and output variables
+        variables = xbeachmi.exchange.get_all_variables(self.exchange)
+        if 'netcdf' in self.config.keys():
+            variables.extend([var for var in self.config['netcdf'].get('outputvars', [])
+                              if var not in variables])
+        missing = yield from self._init_metadata(variables)
+        if len(missing) > 0:
+            raise ValueError('Unknown variable(s) [%s]' % ', '.join(missing))
+
+        if self.transport == 'shared_memory':
+            yield from self._init_arenas()
+
+
+    def _init_metadata(self, variables, instances=None):
+        '''Populate metadata registry
+
+        Requests shape and type of the given variables from the
+        instance processes. The requests for all variables are sent
+        at once. Dimension sizes are read from the model
+        configuration file of the first instance upon first use.
+
+        Parameters
+        ----------
+        variables : list
+            variable names
+        instances : list, optional
+            names of instances, defaults to all resident instances
+
+        Returns
+        -------
+        list
+            names of variables for which no metadata could be
+            determined
+
+        '''
+
+        if instances is None:
+            instances = self.get_resident()
+
+        if len(self.sizes) == 0:
+            configfile = self.instances[instances[0]]['configfile']
+            try:
+                self.sizes = xbeachmi.metadata.read_sizes(
+                    xbeachmi.parsers.XBeachParser(configfile).parse(
+                        keys=['nx', 'ny', 'ngd', 'nd']))
+            except:
+                logger.warning('Failed to read dimensions from "%s"' % configfile)
+
+        requests = {var : self._submit([('get_var_shape', (var,)),
+                                        ('get_var_type', (var,))],
+                                       instances=instances, strict=False)
+                    for var in variables}
+
+        missing = []
+        for var, request in requests.items():
+            replies = yield request
+            for instance, r in replies.items():
+                if r is None:
+                    if var not in missing:
+                        missing.append(var)
+                    continue
+                if instance not in self.metadata.keys():
+                    self.metadata[instance] = {}
+                self.metadata[instance][var] = xbeachmi.metadata.create_entry(
+                    r[0], r[1], self.sizes)
+
+        return missing
+
+
+    def _init_arenas(self):
+        '''Create shared memory arenas for exchange variables
+
+        Creates a named shared memory block for each instance with
+        one slot per exchange variable, sized according to the
+        variable shape and type reported by the instance, and a
+        single broadcast block for setting data in multiple instances
+        at once. The instance processes attach to the blocks by
+        name. For tree reduction, an additional block with a double
+        precision slot per exchange variable is created for each
+        instance. Arenas of instances that are not started yet are
+        sized according to the first resident instance.
+
+        '''
+
+        default = self.metadata.get(self.get_resident()[0], {})
+
+        broadcast_layout = None
         for name, instance in self.instances.items():
-            logger.debug('Starting process "%s"...' % name)
-            self.instances[name]['process'] = \
-                Process(target=self.run,
-                        args=(instance['configfile'],
-                              self.instances[name]['queue_to'],
-                              self.instances[name]['queue_from']))
-        self.start()
+            logger.debug('Creating shared memory arena for "%s"...' % name)
+
+            metadata = self.metadata.get(name, default)
+            variables = {}
+            for var in xbeachmi.exchange.get_all_variables(self.exchange):
+                if var in metadata.keys():
+                    meta = metadata[var]
+                    variables[var] = (meta['shape'], meta['dtype'])
+                else:
+                    logger.warning('Failed to determine shape of "%s" in "%s", '
+                                   'not using shared memory' % (var, name))
+
+            layout = xbeachmi.sharedmem.create_layout(variables)
+            instance['arena'] = xbeachmi.sharedmem.SharedArena(layout)
+            if self.reduction == 'tree':
+                instance['reduction'] = xbeachmi.sharedmem.SharedArena(
+                    xbeachmi.sharedmem.create_layout({var : (shape, np.float64)
+                                                      for var, (offset, shape, dtype) in layout.items()}))
+            if broadcast_layout is None:
+                broadcast_layout = layout
+
+        self.broadcast = xbeachmi.sharedmem.SharedArena(broadcast_layout or {})
+
+        yield self._submit({name : [self._get_attach_call(name)]
+                            for name in self.get_resident()})
+
+
+    def _get_attach_call(self, name):
+        '''Return command that attaches an instance to its shared memory arenas'''
+
+        instance = self.instances[name]
+        args = (instance['arena'].name, instance['arena'].layout,
+                self.broadcast.name, self.broadcast.layout)
+        if instance['reduction'] is not None:
+            args += (instance['reduction'].name, instance['reduction'].layout)
+        return ('attach_arena', args)
+
+
+    def close_arenas(self):
+        '''Close and remove shared memory arenas'''
+
+        for instance in self.instances.values():
+            for key in ('arena', 'reduction'):
+                if instance[key] is not None:
+                    instance[key].close()
+                    instance[key] = None
+        if self.broadcast is not None:
+            self.broadcast.close()
+            self.broadcast = None
             
             
     def update(self, dt=-1):
@@ -665,53 +2261,238 @@ class XBeachMI(IBmi):
             Time step
 
         '''
+
+        return self._drive(self._update(dt))
+
+
+    def _update(self, dt=-1):
+        '''Coupling steps of :func:`update`'''
+
+        if dt > 0.:
+            t = yield from self._get_current_time()
+            yield from self._advance_to(t + dt)
+            return
         
-        self.update_instances()
+        with self.profiler.phase('update_instances'):
+            yield from self._update_instances()
 
         try:
-            t = self._call('get_current_time')
-            self._call('update', (dt,))
+            with self.profiler.phase('update'):
+                replies = yield from self._call_batch([('update', (dt,)),
+                                                       ('get_current_time', ())])
+                self.times.update({instance : r[1] for instance, r in replies.items()})
+                self._clear_held(replies.keys())
+                self._clear_baselines(replies.keys())
+
+                # make sure all instances keep up with the front runner
+                yield from self._catch_up(max([self.times[instance]
+                                               for instance in self.running]))
+            
+        except:
+            logger.error('Failed to update "%s"!' % ', '.join(self.running))
+            logger.error(traceback.format_exc())
 
-            # determine target time
-            if dt > 0.:
-                target = t + dt
-            else:
-                target = max([self._call('get_current_time', instances=[instance])
-                              for instance in self.running])
+        self.profiler.export(force=False)
 
-            # make sure all instances keep up with the front runner
-            for instance in self.running:
-                while True:
-                    t = self._call('get_current_time', instances=[instance])
 
-                    if target > t:
-                        self._call('update', (target - t,))
-                    else:
-                        break
-            
+    def advance_to(self, t):
+        '''Update running instances until a given time
+
+        Each running instance receives a single command to update
+        itself until the given time is reached. The time loop runs
+        within the instance processes, while the master process
+        waits for the next coupling event. Use
+        :func:`get_next_event_time` to determine the time of the next
+        coupling event.
+
+        Parameters
+        ----------
+        t : float
+            Target time
+
+        '''
+
+        return self._drive(self._advance_to(t))
+
+
+    def _advance_to(self, t):
+        '''Coupling steps of :func:`advance_to`'''
+
+        with self.profiler.phase('update_instances'):
+            yield from self._update_instances()
+
+        try:
+            with self.profiler.phase('update'):
+                yield from self._catch_up(t)
         except:
             logger.error('Failed to update "%s"!' % ', '.join(self.running))
             logger.error(traceback.format_exc())
 
-            
+        self.profiler.export(force=False)
+
+
+    def get_next_event_time(self):
+        '''Return the time of the next coupling event
+
+        Coupling events are periodic aggregations, scenario switches
+        and the end of the simulation.
+
+        Returns
+        -------
+        float
+            time of next coupling event
+
+        '''
+
+        return self._drive(self._get_next_event_time())
+
+
+    def get_next_switch_time(self):
+        '''Return the time of the next scenario switch
+
+        The next switch is the first scenario entry after the current
+        time. A pending entry at the current time, which is applied
+        upon the next update, is not included.
+
+        Returns
+        -------
+        float or None
+            time of next scenario switch or None if there is none
+
+        '''
+
+        return self._drive(self._get_next_switch_time())
+
+
+    def _get_next_switch_time(self, t=None):
+        '''Coupling steps of :func:`get_next_switch_time`
+
+        Parameters
+        ----------
+        t : float, optional
+            current time, requested from the instances if not given
+
+        '''
+
+        if self.scenario is None:
+            return None
+        if t is None:
+            t = yield from self._get_current_time()
+        return self.scenario.get_time(self.scenario.get_index(t))
+
+
+    def _get_next_event_time(self):
+        '''Coupling steps of :func:`get_next_event_time`'''
+
+        t = yield from self._get_current_time()
+        events = [(yield from self._get_end_time())]
+
+        if 'aggregate' in self.config.keys():
+            if 'interval' in self.config['aggregate'].keys():
+                if self.next_aggegation > t:
+                    events.append(self.next_aggegation)
+                else:
+                    events.append(t + self.config['aggregate']['interval'])
+
+        # first switch after the current time, such that a pending
+        # switch at the current time does not hide later switches
+        tc = yield from self._get_next_switch_time(t)
+        if tc is not None:
+            events.append(tc)
+
+        events = [te for te in events if te > t]
+        if len(events) > 0:
+            return min(events)
+        else:
+            return t
+
+
+    def _catch_up(self, t):
+        '''Update lagging running instances until a given time
+
+        Parameters
+        ----------
+        t : float
+            Target time
+
+        '''
+
+        lagging = [instance for instance in self.running if self.times[instance] < t]
+        if len(lagging) > 0:
+            replies = yield from self._call_batch([('advance_to', (t,))], instances=lagging)
+            self.times.update({instance : r[0] for instance, r in replies.items()})
+            self._clear_held(lagging)
+            self._clear_baselines(lagging)
+
+
     def finalize(self):
         '''Finalize instance processes'''
-        
-        for instance in self.instances.keys():
-            logger.debug('Finalizing "%s"...' % instance)
-            self._call('finalize', instances=[instance])
+
+        self._drive(self._finalize())
         self.join()
+        self.close()
+
+
+    def _finalize(self):
+        '''Coupling steps of :func:`finalize`'''
+
+        yield from self._flush_output()
+
+        yield from self._collect_prewarm()
+        
+        resident = self.get_resident()
+        logger.debug('Finalizing "%s"...' % ', '.join(resident))
+        yield from self._broadcast('finalize', instances=resident)
+
+
+    def close(self):
+        '''Release resources after all instance processes are finished'''
+
+        self.close_arenas()
+        self.aggregator.close()
+
+        self.profiler.export()
+
+        if len(self.switches) > 0:
+            latency = [s['latency'] for s in self.switches]
+            logger.info('Switch statistics: count=%d, mean_latency=%0.3f, max_latency=%0.3f' %
+                        (len(latency), np.mean(latency), np.max(latency)))
 
         # change working directory back to original
         os.chdir(self.cwd)
         logger.debug('Changed directory to "%s"' % self.cwd)
+
+
+    def _drive(self, steps):
+        '''Run coupling steps blocking on each pending request
+
+        All communication with the instance processes is written as
+        coupling steps: generators that yield pending requests, see
+        :func:`_submit`, and receive the replies in return. This
+        method runs the steps synchronously, while
+        :class:`~xbeachmi.aio.AsyncXBeachMI` runs the same steps in
+        an asyncio event loop.
+
+        Parameters
+        ----------
+        steps : generator
+            coupling steps
+
+        Returns
+        -------
+        any
+            return value of coupling steps
+
+        '''
+
+        return xbeachmi.ipc.drive(steps)
         
         
     def _call(self, fcn, args=(), instances=None):
         '''Subprocess function caller
 
         Calls a function in a subprocess and returns the result via
-        separate queues. If no instance is specified the running
+        the instance pipe. If no instance is specified the running
         instance is used.
 
         Parameters
@@ -730,34 +2511,297 @@ class XBeachMI(IBmi):
 
         '''
 
+        vals = yield from self._broadcast(fcn, args, instances=instances)
+
+        if len(vals) > 1:
+            return self.aggregate(vals)
+        else:
+            return vals[0]
+
+
+    def _broadcast(self, fcn, args=(), instances=None):
+        '''Call a function in multiple subprocesses simultaneously
+
+        Parameters
+        ----------
+        fcn : str
+            name of function
+        args : tuple, optional
+            function arguments
+        instances : list, optional
+            names of instances for calling the function
+
+        Returns
+        -------
+        list
+            function results of each instance
+
+        '''
+
+        replies = yield from self._call_batch([(fcn, args)], instances=instances)
+        return [r[0] for r in replies.values()]
+
+
+    def _call_batch(self, calls, instances=None, strict=True):
+        '''Call a batch of functions in multiple subprocesses simultaneously
+
+        Each instance receives the entire batch in a single request
+        and returns all results in a single reply.
+
+        Parameters
+        ----------
+        calls : list or dict
+            list of tuples with function name and function
+            arguments, or dict with instance names (keys) and such
+            lists (values)
+        instances : list, optional
+            names of instances for calling the functions, ignored if
+            ``calls`` is a dict
+        strict : bool, optional
+            raise an exception if any request failed, otherwise
+            failed requests return None
+
+        Returns
+        -------
+        dict
+            dict with instance names (keys) and lists of function
+            results (values)
+
+        '''
+
+        return (yield self._submit(calls, instances=instances, strict=strict))
+
+
+    def _submit(self, calls, instances=None, strict=True):
+        '''Send a batch of functions to multiple subprocesses without waiting
+
+        The returned request can be yielded from coupling steps to
+        wait for the replies. Multiple requests can be in flight per
+        instance.
+
+        Parameters
+        ----------
+        calls : list or dict
+            list of tuples with function name and function
+            arguments, or dict with instance names (keys) and such
+            lists (values)
+        instances : list, optional
+            names of instances for calling the functions, ignored if
+            ``calls`` is a dict
+        strict : bool, optional
+            raise an exception if any request failed, otherwise
+            failed requests return None
+
+        Returns
+        -------
+        xbeachmi.ipc.Request
+            pending requests
+
+        '''
+
+        if not isinstance(calls, dict):
+            if not instances:
+                instances = self.running
+
+            if type(instances) is not list:
+                instances = [instances]
+
+            calls = {instance : calls for instance in instances}
+
+        #logger.debug('Call "%s" [%d]' %
+        #             (', '.join([fcn for fcn, args in calls]), os.getpid()))
+
+        return xbeachmi.ipc.submit({instance : self.instances[instance]['channel']
+                                    for instance in calls.keys()},
+                                   calls, strict=strict)
+
+
+    def _get_var(self, var, instances=None, copy=True):
+        '''Get variable from instances
+
+        Parameters
+        ----------
+        var : str
+            variable name
+        instances : list, optional
+            names of instances to get the variable from
+        copy : bool, optional
+            return a copy of the data rather than a view on the arena
+
+        Returns
+        -------
+        any
+            variable value, aggregated if multiple instances are given
+
+        '''
+
         if not instances:
             instances = self.running
 
         if type(instances) is not list:
             instances = [instances]
 
-        #logger.debug('Call "%s" with "(%s)" [%d]' %
-        #             (fcn, ','.join([str(x) for x in args]), os.getpid()))
+        if len(instances) == 1:
+            replies = yield from self._get_vars([var], instances=instances,
+                                                copy=copy, strict=True)
+            return replies[instances[0]][0]
 
-        vals = []
-        for instance in instances:
-            self.instances[instance]['queue_to'].put((fcn, args))
-        for instance in instances:
-            self.instances[instance]['queue_to'].join()
-            vals.append(self.instances[instance]['queue_from'].get())
+        # fold values of multiple instances as soon as they arrive
+        aggregator = self.create_aggregator()
+        yield from self._get_vars([var], instances=instances, copy=False, strict=True,
+                                  callback=lambda instance, r: aggregator.add(
+                                      {var : r[0]},
+                                      aggregator.get_weight(instance, instances.index(instance))))
+        return aggregator.result()[var]
 
-        if len(vals) > 1:
-            return self.aggregate(vals)
+
+    def _get_vars(self, variables, instances=None, copy=True, strict=False,
+                  callback=None):
+        '''Get multiple variables from instances in a single batch
+
+        Uses the shared memory arena of an instance if available, in
+        which case only a "slot ready" message is sent through the
+        pipe for each variable. The requests to all instances are
+        sent at once, while the replies are handled one instance at a
+        time.
+
+        Parameters
+        ----------
+        variables : list
+            variable names
+        instances : list, optional
+            names of instances to get the variables from
+        copy : bool, optional
+            return copies of the data rather than views on the arena
+        strict : bool, optional
+            raise an exception if any request failed, otherwise
+            failed requests return None
+        callback : callable, optional
+            function that takes an instance name and a list of
+            variable values and is called as soon as the reply of an
+            instance arrives, in which case the replies are not
+            stored
+
+        Returns
+        -------
+        dict
+            dict with instance names (keys) and lists of variable
+            values (values), empty if a callback is given
+
+        '''
+
+        if self.transport != 'shared_memory':
+            fcn = 'get_var'
         else:
-            return vals[0]
+            fcn = 'get_var_shared'
+
+        request = self._submit([(fcn, (var,)) for var in variables],
+                               instances=instances, strict=strict)
+
+        replies = {}
+        for instance, r in request.split().items():
+            r = (yield r)[instance]
+            if r is not None and self.transport == 'shared_memory':
+                arena = self.instances[instance]['arena']
+                for i, var in enumerate(variables):
+                    if r[i] is True:
+                        r[i] = arena.read(var, copy=copy)
+
+            if callback is None:
+                replies[instance] = r
+            else:
+                callback(instance, r)
 
+        return replies
 
-    @staticmethod
-    def get_dimensions(var):
+
+    def _set_var(self, var, val, instances=None):
+        '''Set variable in instances
+
+        Parameters
+        ----------
+        var : str
+            variable name
+        val : any
+            variable value
+        instances : list, optional
+            names of instances to set the variable in
+
+        '''
+
+        yield from self._set_vars({var : val}, instances=instances)
+
+
+    def _set_vars(self, variables, instances=None):
+        '''Set multiple variables in instances in a single batch
+
+        Uses the shared memory broadcast arena if available, in which
+        case the data is written once and only a "slot ready" message
+        is sent to each instance through the pipe for each variable.
+
+        Parameters
+        ----------
+        variables : dict
+            dict with variable names (keys) and values (values)
+        instances : list, optional
+            names of instances to set the variables in
+
+        '''
+
+        calls = [self._get_set_var_call(var, val) for var, val in variables.items()]
+        yield from self._call_batch(calls, instances=instances)
+
+        if not instances:
+            instances = self.running
+        for var, val in variables.items():
+            for instance in instances:
+                self._set_baseline(instance, var, val)
+
+
+    def _get_set_var_call(self, var, val):
+        '''Return command for setting a variable in instances
+
+        Writes the variable to the shared memory broadcast arena if
+        available, such that the command only holds a "slot ready"
+        message.
+
+        Parameters
+        ----------
+        var : str
+            variable name
+        val : any
+            variable value
+
+        Returns
+        -------
+        tuple
+            tuple with function name and function arguments
+
+        '''
+
+        if self.transport != 'shared_memory':
+            return ('set_var', (var, val))
+        elif self.broadcast.fits(var, val):
+            self.broadcast.write(var, val)
+            return ('set_var_shared', (var,))
+        else:
+            return ('set_var_shared', (var, val))
+
+
+    def get_dimensions(self, var):
         '''Return dimensions of a given variable
 
-        TODO: actually implement this function
+        Parameters
+        ----------
+        var : str
+            variable name
+
+        Returns
+        -------
+        tuple
+            dimension names, starting with "time", see
+            :func:`~xbeachmi.metadata.get_dimension_names`
 
         '''
         
-        return (u'time', u'y', u'x')
+        return (u'time',) + self._drive(self._get_metadata(var))['dimensions']
@@ -1,3 +1,5 @@
+import time
+import logging
 import numpy as np
 from datetime import datetime
 
@@ -10,7 +12,16 @@ except ImportError:
     HAVE_NETCDF = False
 
 
-def initialize(ncfile, dimensions, variables=None, attributes=None, crs=None):
+# initialize log
+logger = logging.getLogger(__name__)
+
+# supported per-variable encoding options
+ENCODING_OPTIONS = ('zlib', 'complevel', 'shuffle', 'chunksizes',
+                    'least_significant_digit')
+
+
+def initialize(ncfile, dimensions, variables=None, attributes=None, crs=None,
+               encoding=None, latlon=True, instances=None):
     '''Initialize netCDF4 file
 
     Creates an empty netCDF4 file with dimensions and variable
@@ -41,7 +52,8 @@ def initialize(ncfile, dimensions, variables=None, attributes=None, crs=None):
     ncfile : str
         path to netCDF4 file
     dimensions : dict
-        dict with dimension variables x, y, layers and fractions
+        dict with dimension variables x, y and optionally other
+        dimensions used by the variables, like layers and fractions
     variables : dict
         dict of dicts with other variables, where each variable
         defines at least its dimensions
@@ -49,6 +61,15 @@ def initialize(ncfile, dimensions, variables=None, attributes=None, crs=None):
         dict with global netCDF attributes
     crs : dict
         dict with EPSG attributes for local coordinate reference system (crs)
+    encoding : dict, optional
+        dict with encoding options per variable, see
+        :func:`get_encoding`
+    latlon : bool, optional
+        create the static variables lat, lon, lat_bounds and
+        lon_bounds
+    instances : list, optional
+        names of instances, creates the dimension "instances" and
+        the variable "instance_names" if given
 
     '''
 
@@ -65,6 +86,11 @@ def initialize(ncfile, dimensions, variables=None, attributes=None, crs=None):
         nc.createDimension('nv', 2)
         nc.createDimension('nv2', 4)
         nc.createDimension('nv3', 128)
+        if instances is not None:
+            nc.createDimension('instances', len(instances))
+        for name, values in dimensions.items():
+            if name not in nc.dimensions.keys():
+                nc.createDimension(name, len(values))
           
         ## add global attributes
         # see http://www.unidata.ucar.edu/software/thredds/current/netcdf-java/formats/DataDiscoveryAttConvention.html
@@ -140,25 +166,26 @@ def initialize(ncfile, dimensions, variables=None, attributes=None, crs=None):
         nc.variables['y'].grid_mapping = 'crs'
         nc.variables['y'].comment = ''
 
-        nc.createVariable('lat', 'float32', (u'y', u'x'))
-        nc.variables['lat'].long_name = 'latitude'
-        nc.variables['lat'].standard_name = 'latitude'
-        nc.variables['lat'].units = 'degrees_north'
-        nc.variables['lat'].valid_min = -np.inf
-        nc.variables['lat'].valid_max = np.inf
-        nc.variables['lat'].bounds = 'lat_bounds'
-        nc.variables['lat'].ancillary_variables = ''
-        nc.variables['lat'].comment = ''
-        
-        nc.createVariable('lon', 'float32', (u'y', u'x'))
-        nc.variables['lon'].long_name = 'longitude'
-        nc.variables['lon'].standard_name = 'longitude'
-        nc.variables['lon'].units = 'degrees_east'
-        nc.variables['lon'].valid_min = -np.inf
-        nc.variables['lon'].valid_max = np.inf
-        nc.variables['lon'].bounds = 'lon_bounds'
-        nc.variables['lon'].ancillary_variables = ''
-        nc.variables['lon'].comment = ''
+        if latlon:
+            nc.createVariable('lat', 'float32', (u'y', u'x'))
+            nc.variables['lat'].long_name = 'latitude'
+            nc.variables['lat'].standard_name = 'latitude'
+            nc.variables['lat'].units = 'degrees_north'
+            nc.variables['lat'].valid_min = -np.inf
+            nc.variables['lat'].valid_max = np.inf
+            nc.variables['lat'].bounds = 'lat_bounds'
+            nc.variables['lat'].ancillary_variables = ''
+            nc.variables['lat'].comment = ''
+
+            nc.createVariable('lon', 'float32', (u'y', u'x'))
+            nc.variables['lon'].long_name = 'longitude'
+            nc.variables['lon'].standard_name = 'longitude'
+            nc.variables['lon'].units = 'degrees_east'
+            nc.variables['lon'].valid_min = -np.inf
+            nc.variables['lon'].valid_max = np.inf
+            nc.variables['lon'].bounds = 'lon_bounds'
+            nc.variables['lon'].ancillary_variables = ''
+            nc.variables['lon'].comment = ''
         
         nc.createVariable('time', 'float64', (u'time',))
         nc.variables['time'].long_name = 'time'
@@ -179,6 +206,11 @@ def initialize(ncfile, dimensions, variables=None, attributes=None, crs=None):
         nc.variables['instance'].ancillary_variables = ''
         nc.variables['instance'].comment = ''
 
+        if instances is not None:
+            nc.createVariable('instance_names', 'S1', (u'instances', u'nv3'))
+            nc.variables['instance_names'].long_name = 'instance names'
+            nc.variables['instance_names'].comment = 'names of the instances along the instances dimension'
+
         nc.createVariable('x_bounds', 'float32', (u'x', u'nv'))
         nc.variables['x_bounds'].units = 'm'
         nc.variables['x_bounds'].comment = 'x-coordinate values at the upper and lower bounds of each pixel.'
@@ -187,13 +219,14 @@ def initialize(ncfile, dimensions, variables=None, attributes=None, crs=None):
         nc.variables['y_bounds'].units = 'm'
         nc.variables['y_bounds'].comment = 'y-coordinate values at the left and right bounds of each pixel.'
         
-        nc.createVariable('lat_bounds', 'float32', (u'y', u'x', u'nv2'))
-        nc.variables['lat_bounds'].units = 'degrees_north'
-        nc.variables['lat_bounds'].comment = 'latitude values at the north and south bounds of each pixel.'
-        
-        nc.createVariable('lon_bounds', 'float32', (u'y', u'x', u'nv2'))
-        nc.variables['lon_bounds'].units = 'degrees_east'
-        nc.variables['lon_bounds'].comment = 'longitude values at the west and east bounds of each pixel.'
+        if latlon:
+            nc.createVariable('lat_bounds', 'float32', (u'y', u'x', u'nv2'))
+            nc.variables['lat_bounds'].units = 'degrees_north'
+            nc.variables['lat_bounds'].comment = 'latitude values at the north and south bounds of each pixel.'
+
+            nc.createVariable('lon_bounds', 'float32', (u'y', u'x', u'nv2'))
+            nc.variables['lon_bounds'].units = 'degrees_east'
+            nc.variables['lon_bounds'].comment = 'longitude values at the west and east bounds of each pixel.'
         
         nc.createVariable('time_bounds', 'float32', (u'time', u'nv'))
         nc.variables['time_bounds'].units = 'seconds since 1970-01-01 00:00:00 0:00'
@@ -202,7 +235,10 @@ def initialize(ncfile, dimensions, variables=None, attributes=None, crs=None):
         if variables is not None:
             for var, props in variables.items():
 
-                nc.createVariable(var, 'float32', props['dimensions'])
+                nc.createVariable(var, 'float32', props['dimensions'],
+                                  **get_encoding(encoding, var, [
+                                      len(nc.dimensions[dim]) if dim != 'time' else None
+                                      for dim in props['dimensions']]))
                 nc.variables[var].long_name = var
                 nc.variables[var].standard_name = ''
                 nc.variables[var].units = ''
@@ -233,12 +269,16 @@ def initialize(ncfile, dimensions, variables=None, attributes=None, crs=None):
         nc.variables['x'][:] = dimensions['x']
         nc.variables['y'][:] = dimensions['y']
 
-        nc.variables['lat'][:,:] = 0.
-        nc.variables['lon'][:,:] = 0.
+        if instances is not None:
+            nc.variables['instance_names'][:,:] = to_char(instances, 128)
+
         nc.variables['x_bounds'][:,:] = 0.
         nc.variables['y_bounds'][:,:] = 0.
-        nc.variables['lat_bounds'][:,:] = 0.
-        nc.variables['lon_bounds'][:,:] = 0.
+        if latlon:
+            nc.variables['lat'][:,:] = 0.
+            nc.variables['lon'][:,:] = 0.
+            nc.variables['lat_bounds'][:,:] = 0.
+            nc.variables['lon_bounds'][:,:] = 0.
         
 #        # store model settings
 #        grp = nc.createGroup('settings')
@@ -249,6 +289,63 @@ def initialize(ncfile, dimensions, variables=None, attributes=None, crs=None):
 #                grp.setncattr(k, v)
 
 
+def get_encoding(encoding, var, shape):
+    '''Return encoding options for a netCDF4 variable
+
+    The encoding options are given per variable name. Options under
+    the key "default" apply to all variables, unless overruled. For
+    example:
+
+    .. code-block:: json
+
+       {
+           "default" : {
+               "zlib" : true,
+               "complevel" : 4,
+               "shuffle" : true
+           },
+           "zb" : {
+               "least_significant_digit" : 4
+           }
+       }
+
+    Supported options are "zlib", "complevel", "shuffle",
+    "chunksizes" and "least_significant_digit", see
+    ``netCDF4.Dataset.createVariable``. The chunk shape defaults to
+    a single time step and the full extent of all other dimensions.
+
+    Parameters
+    ----------
+    encoding : dict
+        dict with encoding options per variable
+    var : str
+        variable name
+    shape : list
+        length of each variable dimension, None for the unlimited
+        time dimension
+
+    Returns
+    -------
+    dict
+        keyword arguments for ``netCDF4.Dataset.createVariable``
+
+    '''
+
+    options = {}
+    if encoding is not None:
+        options.update(encoding.get('default', {}))
+        options.update(encoding.get(var, {}))
+
+    for key in options.keys():
+        if key not in ENCODING_OPTIONS:
+            raise ValueError('Unsupported encoding option [%s]' % key)
+
+    if 'chunksizes' not in options.keys() and None in shape:
+        options['chunksizes'] = [1 if n is None else max(1, n) for n in shape]
+
+    return options
+
+
 def append(ncfile, idx, variables):
     '''Append data to existing netCDF4 file
 
@@ -277,6 +374,262 @@ def append(ncfile, idx, variables):
         nc.variables['time_bounds'][idx,1] = variables['time']
     
 
+def to_char(values, nchar):
+    '''Convert strings to a character array
+
+    Strings are encoded as bytes and truncated or padded to a fixed
+    length. Strings may be given as plain or numpy strings, or as
+    zero-dimensional numpy arrays, like buffered output values.
+    Unlike ``netCDF4.stringtochar``, this does not depend on the
+    string encoding options of the installed netCDF4 version.
+
+    Parameters
+    ----------
+    values : list
+        strings
+    nchar : int
+        number of characters per string
+
+    Returns
+    -------
+    np.ndarray
+        array of single characters with an additional trailing
+        dimension of length ``nchar``
+
+    '''
+
+    values = [np.asarray(v).item() for v in values]
+    values = np.asarray([v if isinstance(v, bytes) else str(v).encode('utf-8')
+                         for v in values], dtype='S%d' % nchar)
+    return values.view('S1').reshape(values.shape + (nchar,))
+
+
+class NetCDFWriter:
+    '''Persistent, buffered netCDF4 output writer
+
+    Keeps the netCDF4 file open during the entire simulation and
+    buffers a number of output time steps in memory. Buffered time
+    steps are written as a single slab per variable. The buffer is
+    flushed if it is full, if a given wall-clock interval has passed
+    since the last flush and upon closing the writer.
+
+    .. code-block:: python
+
+       with NetCDFWriter('xbeachmi.nc', buffer_size=10) as writer:
+           for t in times:
+               writer.append({'time' : t, 'zb' : zb})
+
+    '''
+
+
+    def __init__(self, ncfile, buffer_size=1, flush_interval=None, index=None):
+        '''Initialize the class
+
+        Parameters
+        ----------
+        ncfile : str
+            path to existing netCDF4 file, see :func:`initialize`
+        buffer_size : int, optional
+            number of time steps buffered before writing
+        flush_interval : float, optional
+            maximum wall-clock time in seconds between flushes
+        index : int, optional
+            time index to start writing at, defaults to the end of
+            the file, used to overwrite output written after a
+            checkpoint
+
+        '''
+
+        self.ncfile = ncfile
+        self.buffer_size = max(1, int(buffer_size))
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.idx = 0
+        self.last_time = 0.
+        self.last_flush = time.time()
+
+        # abort if netCDF4 is not available
+        if not HAVE_NETCDF:
+            self.nc = None
+            return
+
+        self.nc = netCDF4.Dataset(ncfile, 'a')
+        self.idx = len(self.nc.variables['time'])
+        if index is not None:
+            self.idx = min(self.idx, index)
+        if self.idx > 0:
+            self.last_time = self.nc.variables['time'][self.idx-1]
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, errtype, errobj, traceback):
+        self.close()
+
+
+    def append(self, variables):
+        '''Append data of a single time step
+
+        Parameters
+        ----------
+        variables : dict
+            dict with variable names (keys) and data to be
+            appended (values), including "time"
+
+        '''
+
+        if self.nc is None:
+            return
+
+        # copy data, since arrays may be reused by the caller
+        self.buffer.append({name : np.array(value, copy=True)
+                            for name, value in variables.items()})
+
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+        elif self.flush_interval is not None and \
+             time.time() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+
+    def tell(self):
+        '''Return time index of the next time step'''
+
+        return self.idx + len(self.buffer)
+
+
+    def flush(self):
+        '''Write buffered time steps to file'''
+
+        self.last_flush = time.time()
+
+        if self.nc is None or len(self.buffer) == 0:
+            return
+
+        n = len(self.buffer)
+        i0, i1 = self.idx, self.idx + n
+
+        logger.debug('Writing %d time steps to "%s"...' % (n, self.ncfile))
+
+        for name in self.buffer[0].keys():
+            values = [step[name] for step in self.buffer]
+            if values[0].dtype.kind in 'SU':
+                values = to_char(values, self.nc.variables[name].shape[-1])
+            else:
+                values = np.stack(values)
+            self.nc.variables[name][i0:i1,...] = values
+
+        # time bounds span the period since the previous time step
+        times = np.asarray([step['time'] for step in self.buffer], dtype=float)
+        bounds = np.empty((n, 2))
+        bounds[0,0] = self.last_time
+        bounds[1:,0] = times[:-1]
+        bounds[:,1] = times
+        self.nc.variables['time_bounds'][i0:i1,:] = bounds
+
+        self.nc.sync()
+
+        self.idx = i1
+        self.last_time = times[-1]
+        self.buffer = []
+
+
+    def close(self):
+        '''Flush buffered time steps and close file'''
+
+        if self.nc is None:
+            return
+
+        try:
+            self.flush()
+        finally:
+            self.nc.close()
+            self.nc = None
+
+
+def merge(ncfiles, outputfile, encoding=None, chunk=100):
+    '''Merge netCDF4 output files of individual instances
+
+    Combines the output files written by the individual instance
+    processes into a single file with an "instances" dimension. The
+    time axis of the merged file is the union of the time axes of
+    all files. Values of instances that did not write output at a
+    given time are left empty (masked).
+
+    Parameters
+    ----------
+    ncfiles : dict
+        dict with instance names (keys) and paths to netCDF4 output
+        files (values)
+    outputfile : str
+        path to merged netCDF4 output file
+    encoding : dict, optional
+        dict with encoding options per variable, see
+        :func:`get_encoding`
+    chunk : int, optional
+        maximum number of time steps copied at once
+
+    '''
+
+    # abort if netCDF4 is not available
+    if not HAVE_NETCDF:
+        return
+
+    instances = list(ncfiles.keys())
+
+    # read time axes and structure of first file
+    times = {}
+    for instance, ncfile in ncfiles.items():
+        with netCDF4.Dataset(ncfile, 'r') as nc:
+            times[instance] = np.asarray(nc.variables['time'][:])
+    t = np.unique(np.concatenate(list(times.values())))
+
+    with netCDF4.Dataset(ncfiles[instances[0]], 'r') as nc:
+        dimensions = {'x' : nc.variables['x'][:],
+                      'y' : nc.variables['y'][:]}
+        attributes = {k : nc.getncattr(k) for k in nc.ncattrs()}
+        crs = {k : nc.variables['crs'].getncattr(k)
+               for k in nc.variables['crs'].ncattrs()}
+        latlon = 'lat' in nc.variables.keys()
+        variables = {
+            var : {'dimensions' : (u'time', u'instances') + v.dimensions[1:]}
+            for var, v in nc.variables.items()
+            if v.dimensions[:1] == (u'time',) and var not in ['time', 'time_bounds', 'instance']
+        }
+
+        # other dimensions of output variables, like fractions and layers
+        for var in variables.keys():
+            for dim in nc.variables[var].dimensions[1:]:
+                if dim not in dimensions.keys():
+                    dimensions[dim] = np.arange(len(nc.dimensions[dim]))
+
+    initialize(outputfile, dimensions, variables=variables, attributes=attributes,
+               crs=crs, encoding=encoding, latlon=latlon, instances=instances)
+
+    with netCDF4.Dataset(outputfile, 'a') as out:
+
+        out.variables['time'][:] = t
+        out.variables['time_bounds'][:,0] = np.concatenate(([0.], t[:-1]))
+        out.variables['time_bounds'][:,1] = t
+
+        running = [[] for i in range(len(t))]
+        for instance in instances:
+            for i in np.searchsorted(t, times[instance]):
+                running[i].append(instance)
+        out.variables['instance'][:,:] = to_char([', '.join(r) for r in running],
+                                                 out.variables['instance'].shape[-1])
+
+        for j, instance in enumerate(instances):
+            idx = np.searchsorted(t, times[instance])
+            with netCDF4.Dataset(ncfiles[instance], 'r') as nc:
+                for var in variables.keys():
+                    for i in range(0, len(idx), chunk):
+                        out.variables[var][idx[i:i+chunk],j,...] = \
+                            nc.variables[var][i:i+chunk,...]
+
+
 def set_ncattr(nc, key, value):
     '''Set netCDF4 attribute safe for boolean values
 
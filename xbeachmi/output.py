@@ -0,0 +1,322 @@
+from __future__  import absolute_import
+
+import time
+import queue
+import logging
+import traceback
+import numpy as np
+from multiprocessing import Process, Queue
+
+import xbeachmi.netcdf
+import xbeachmi.sharedmem
+
+
+# initialize log
+logger = logging.getLogger(__name__)
+
+
+class BackgroundWriter:
+    '''Asynchronous netCDF4 output writer
+
+    Writes output in a dedicated writer process, such that the master
+    process can continue updating the model instances while the
+    output is compressed and written to disk. Each output time step
+    is copied to one of a fixed number of shared memory snapshot
+    slots and only a small message is sent to the writer process.
+    The number of slots bounds the output queue: if all slots are in
+    use, :func:`append` blocks until the writer process releases a
+    slot (back-pressure). The writer process itself uses a
+    :class:`~xbeachmi.netcdf.NetCDFWriter`. All queued output is
+    written upon :func:`close`.
+
+    '''
+
+
+    def __init__(self, ncfile, buffer_size=1, flush_interval=None, queue_size=4,
+                 index=None):
+        '''Initialize the class
+
+        Parameters
+        ----------
+        ncfile : str
+            path to existing netCDF4 file, see
+            :func:`~xbeachmi.netcdf.initialize`
+        buffer_size : int, optional
+            number of time steps buffered by the writer process
+        flush_interval : float, optional
+            maximum wall-clock time in seconds between flushes
+        queue_size : int, optional
+            maximum number of output time steps waiting to be written
+        index : int, optional
+            time index to start writing at, see
+            :class:`~xbeachmi.netcdf.NetCDFWriter`
+
+        '''
+
+        self.ncfile = ncfile
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.queue_size = max(1, int(queue_size))
+        self.index = index
+        self.count = 0
+        self.flushed = True
+
+        self.process = None
+        self.arenas = []
+        self.available = []
+        self.requests = Queue()
+        self.released = Queue()
+
+        self.stats = {
+            'written' : 0,
+            'queue_depth' : 0,
+            'max_queue_depth' : 0,
+            'write_time' : 0.,
+            'max_write_time' : 0.,
+            'blocked_time' : 0.,
+        }
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, errtype, errobj, traceback):
+        self.close()
+
+
+    def start(self, layout):
+        '''Create snapshot slots and start writer process
+
+        Parameters
+        ----------
+        layout : dict
+            memory layout of a single snapshot slot, see
+            :func:`~xbeachmi.sharedmem.create_layout`
+
+        '''
+
+        xbeachmi.sharedmem.prepare()
+
+        self.arenas = [xbeachmi.sharedmem.SharedArena(layout)
+                       for i in range(self.queue_size)]
+        self.available = list(range(self.queue_size))
+
+        self.process = Process(target=write,
+                               args=(self.ncfile, self.buffer_size, self.flush_interval,
+                                     self.index,
+                                     [(arena.name, arena.layout) for arena in self.arenas],
+                                     self.requests, self.released))
+        self.process.daemon = True
+        self.process.start()
+
+        logger.debug('Started output process #%d' % self.process.pid)
+
+
+    def append(self, variables):
+        '''Queue data of a single time step for writing
+
+        Blocks only if the output queue is full.
+
+        Parameters
+        ----------
+        variables : dict
+            dict with variable names (keys) and data to be
+            appended (values), including "time"
+
+        '''
+
+        if self.process is None:
+            self.start(xbeachmi.sharedmem.create_layout({
+                name : (np.shape(value), np.asarray(value).dtype)
+                for name, value in variables.items()
+                if isinstance(value, np.ndarray) and value.dtype.kind in 'biuf'
+            }))
+
+        self._collect(block=False)
+        if len(self.available) == 0:
+            t0 = time.time()
+            self._collect(block=True)
+            self.stats['blocked_time'] += time.time() - t0
+
+        slot = self.available.pop(0)
+        arena = self.arenas[slot]
+
+        shared = []
+        message = {}
+        for name, value in variables.items():
+            if isinstance(value, np.ndarray) and arena.fits(name, value):
+                arena.write(name, value)
+                shared.append(name)
+            else:
+                message[name] = value
+
+        self.requests.put((slot, list(variables.keys()), shared, message))
+        self.count += 1
+        self._update_depth()
+
+
+    def tell(self):
+        '''Return time index of the next time step
+
+        Only valid if the start index is known, i.e. if it was
+        given or the file was empty.
+
+        '''
+
+        return (self.index or 0) + self.count
+
+
+    def flush(self):
+        '''Wait until all queued output is written to file'''
+
+        if self.process is None:
+            return
+
+        self.flushed = False
+        self.requests.put('flush')
+        while not self.flushed:
+            self._collect(block=True)
+
+
+    def get_stats(self):
+        '''Return output statistics
+
+        Returns
+        -------
+        dict
+            number of written time steps, current and maximum queue
+            depth, mean and maximum wall-clock time to write a time
+            step in the writer process and total wall-clock time the
+            master process was blocked by a full queue
+
+        '''
+
+        self._collect(block=False)
+
+        stats = dict(self.stats)
+        stats['mean_write_time'] = stats['write_time'] / max(1, stats['written'])
+        return stats
+
+
+    def close(self):
+        '''Write all queued output and stop writer process'''
+
+        if self.process is None:
+            return
+
+        try:
+            self.requests.put(None)
+            while len(self.available) < self.queue_size and self.process.is_alive():
+                self._collect(block=True)
+            self.process.join()
+            logger.info('Output statistics: %s' % ', '.join(
+                ['%s=%s' % (k, v) for k, v in self.get_stats().items()]))
+        finally:
+            for arena in self.arenas:
+                arena.close()
+            self.arenas = []
+            self.process = None
+
+
+    def _collect(self, block=False):
+        '''Collect released snapshot slots from writer process'''
+
+        while True:
+            try:
+                if block:
+                    item = self.released.get(timeout=1.)
+                else:
+                    item = self.released.get_nowait()
+            except queue.Empty:
+                if not block:
+                    break
+                if not self.process.is_alive():
+                    raise RuntimeError('Output process terminated unexpectedly')
+                continue
+
+            slot, dt = item
+            if slot is None:
+                raise RuntimeError('Output process failed:\n%s' % dt)
+            elif slot < 0:
+                self.flushed = True
+                block = False
+                continue
+
+            self.available.append(slot)
+            self.stats['written'] += 1
+            self.stats['write_time'] += dt
+            self.stats['max_write_time'] = max(self.stats['max_write_time'], dt)
+            block = False
+
+        self._update_depth()
+
+
+    def _update_depth(self):
+        '''Update current and maximum queue depth'''
+
+        self.stats['queue_depth'] = self.queue_size - len(self.available)
+        self.stats['max_queue_depth'] = max(self.stats['max_queue_depth'],
+                                            self.stats['queue_depth'])
+
+
+def write(ncfile, buffer_size, flush_interval, index, slots, requests, released):
+    '''Write queued output time steps in writer process
+
+    Parameters
+    ----------
+    ncfile : str
+        path to existing netCDF4 file
+    buffer_size : int
+        number of time steps buffered before writing
+    flush_interval : float
+        maximum wall-clock time in seconds between flushes
+    index : int
+        time index to start writing at
+    slots : list
+        list of tuples with name and memory layout of each snapshot
+        slot
+    requests : multiprocessing.Queue
+        queue with tuples with slot number, variable names, names of
+        variables stored in the slot and other variables, or None to
+        stop, or "flush" to write all buffered time steps
+    released : multiprocessing.Queue
+        queue with tuples with released slot number and wall-clock
+        time needed to process the time step, a negative slot
+        number confirms a flush
+
+    '''
+
+    arenas = [xbeachmi.sharedmem.SharedArena(layout, name=name)
+              for name, layout in slots]
+
+    try:
+        with xbeachmi.netcdf.NetCDFWriter(ncfile, buffer_size=buffer_size,
+                                          flush_interval=flush_interval,
+                                          index=index) as writer:
+            while True:
+                item = requests.get()
+                if item is None:
+                    break
+                elif item == 'flush':
+                    t0 = time.time()
+                    writer.flush()
+                    released.put((-1, time.time() - t0))
+                    continue
+
+                t0 = time.time()
+                slot, names, shared, message = item
+                variables = {}
+                for name in names:
+                    if name in shared:
+                        variables[name] = arenas[slot].read(name, copy=False)
+                    else:
+                        variables[name] = message[name]
+                writer.append(variables)
+                released.put((slot, time.time() - t0))
+    except:
+        logger.error(traceback.format_exc())
+        released.put((None, traceback.format_exc()))
+    finally:
+        for arena in arenas:
+            arena.close()
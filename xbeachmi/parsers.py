@@ -1,6 +1,154 @@
 import os
 import re
+import glob
+import logging
 import numpy as np
+from collections.abc import MutableMapping
+
+
+# initialize log
+logger = logging.getLogger(__name__)
+
+# precompiled regular expressions for parsing configuration values
+RE_ASSIGN = re.compile(r'\s*=\s*')
+RE_SPACE = re.compile(r'\s')
+RE_SPLIT = re.compile(r'\s+')
+RE_BOOL = re.compile(r'[FT]$')
+RE_INT = re.compile(r'[\-0-9]+$')
+RE_FLOAT = re.compile(r'[\-0-9\.]+$')
+
+# parsed configuration files by path, size and modification time
+CACHE = {}
+
+
+def get_cache_file(fname):
+    '''Return path to the binary cache file of a numeric text file
+
+    The cache file is a hidden ``.npy`` file next to the text file
+    and is keyed by the size and modification time of the text file.
+
+    Parameters
+    ----------
+    fname : str
+        path to numeric text file
+
+    Returns
+    -------
+    str
+        path to cache file
+
+    '''
+
+    st = os.stat(fname)
+    fpath, fname = os.path.split(fname)
+    return os.path.join(fpath, '.%s.%d.%d.npy' % (fname, st.st_size, st.st_mtime_ns))
+
+
+def load_numeric(fname, cache=True):
+    '''Load numeric text file using a binary cache
+
+    Upon first use, the text file is parsed using ``np.loadtxt``
+    and stored in a cache file, see :func:`get_cache_file`.
+    Subsequent calls, also from other processes and runs,
+    memory-map the cache file, as long as the text file is not
+    modified. Outdated cache files are removed.
+
+    Parameters
+    ----------
+    fname : str
+        path to numeric text file
+    cache : bool, optional
+        use cache file
+
+    Returns
+    -------
+    np.ndarray
+        numeric data, read-only if memory-mapped
+
+    '''
+
+    if not cache:
+        return np.loadtxt(fname)
+
+    cachefile = get_cache_file(fname)
+    if os.path.exists(cachefile):
+        try:
+            return np.load(cachefile, mmap_mode='r')
+        except (IOError, ValueError):
+            logger.warning('Failed to read cache file "%s"' % cachefile)
+
+    data = np.loadtxt(fname)
+
+    fpath, name = os.path.split(fname)
+    try:
+        for f in glob.glob(os.path.join(fpath, '.%s.*.npy' % glob.escape(name))):
+            os.remove(f)
+        tmpfile = '%s.tmp' % cachefile
+        with open(tmpfile, 'wb') as fp:
+            np.save(fp, data)
+        os.replace(tmpfile, cachefile)
+    except (IOError, OSError):
+        logger.debug('Failed to write cache file "%s"' % cachefile)
+
+    return data
+
+
+class LazyConfig(MutableMapping):
+    '''Key/value pairs of a model configuration with lazy loading
+
+    Values that refer to existing files are replaced by the contents
+    of the referenced file upon first access, see
+    :func:`ConfigParser.parse_referenced_file`.
+
+    '''
+
+
+    def __init__(self, values, parser):
+        '''Initialize the class
+
+        Parameters
+        ----------
+        values : dict
+            key/value pairs with parsed configuration values
+        parser : ConfigParser
+            parser used to load referenced files
+
+        '''
+
+        self.values = dict(values)
+        self.parser = parser
+        self.loaded = {}
+
+
+    def __getitem__(self, key):
+        if key not in self.loaded.keys():
+            value = self.values[key]
+            if type(value) is str and os.path.exists(value):
+                value = self.parser.parse_referenced_file(value)
+            self.loaded[key] = value
+        return self.loaded[key]
+
+
+    def __setitem__(self, key, value):
+        self.values[key] = value
+        self.loaded[key] = value
+
+
+    def __delitem__(self, key):
+        del self.values[key]
+        self.loaded.pop(key, None)
+
+
+    def __iter__(self):
+        return iter(self.values)
+
+
+    def __len__(self):
+        return len(self.values)
+
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.values)
 
 
 class ConfigParser:
@@ -12,61 +160,80 @@ class ConfigParser:
 
     '''
     
-    def __init__(self, configfile):
+    def __init__(self, configfile, cache=True):
         '''Initialize the class
 
         Parameters
         ----------
         configfile : str
             path to model configuration file
+        cache : bool, optional
+            cache numeric data of referenced files, see
+            :func:`load_numeric`
 
         '''
         
         self.configfile = configfile
+        self.cache = cache
 
         
-    def parse(self):
+    def parse(self, keys=None):
         '''Parse configuration file
 
+        Parameters
+        ----------
+        keys : list, optional
+            keys to be parsed, defaults to all keys
+
         Returns
         -------
-        dict
+        LazyConfig
             key/value pairs of model configuration
 
         '''
 
-        return self.parse_config_file(self.configfile)
+        return self.parse_config_file(self.configfile, keys=keys)
     
 
-    def parse_config_file(self, configfile):
+    def parse_config_file(self, configfile, keys=None):
         '''Parse configuration file
 
+        Referenced files are only loaded upon first access of the
+        corresponding value, see :class:`LazyConfig`. Parsed
+        configuration files are cached as long as they are not
+        modified.
+
         Parameters
         ----------
         configfile : str
             path to configuration file
+        keys : list, optional
+            keys to be parsed, defaults to all keys
 
         Returns
         -------
-        dict
+        LazyConfig
             key/value pairs of model configuration
 
         '''
 
-        config = {}
-        with open(configfile, 'r') as fp:
-            for line in fp:
-                if '=' in line:
-                    key, value = re.split('\s*=\s*', line, maxsplit=1)
-                    key = key.strip()
-                    value = self.parse_config_value(value)
-                    
-                    if type(value) is str and os.path.exists(value):
-                        value = self.parse_referenced_file(value)
+        st = os.stat(configfile)
+        cachekey = (os.path.abspath(configfile), st.st_size, st.st_mtime_ns)
 
-                    config[key] = value
+        if cachekey not in CACHE.keys():
+            values = {}
+            with open(configfile, 'r') as fp:
+                for line in fp:
+                    if '=' in line:
+                        key, value = RE_ASSIGN.split(line, maxsplit=1)
+                        values[key.strip()] = self.parse_config_value(value)
+            CACHE[cachekey] = values
+
+        values = CACHE[cachekey]
+        if keys is not None:
+            values = {key : value for key, value in values.items() if key in keys}
 
-        return config
+        return LazyConfig(values, self)
 
 
     def parse_referenced_file(self, fname):
@@ -88,9 +255,9 @@ class ConfigParser:
         data = []
         
         try:
-            data = np.loadtxt(fname)
+            data = load_numeric(fname, cache=self.cache)
             return data
-        except:
+        except (ValueError, UnicodeDecodeError, OSError):
             pass
 
         try:
@@ -125,13 +292,13 @@ class ConfigParser:
         '''
 
         value = value.strip()
-        if re.search('\s', value) or force_list:
-            return [self.parse_config_value(x) for x in re.split('\s+', value)]
-        elif re.match('[FT]$', value):
+        if RE_SPACE.search(value) or force_list:
+            return [ConfigParser.parse_config_value(x) for x in RE_SPLIT.split(value)]
+        elif RE_BOOL.match(value):
             return value == 'T'
-        elif re.match('[\-0-9]+$', value):
+        elif RE_INT.match(value):
             return int(value)
-        elif re.match('[\-0-9\.]+$', value):
+        elif RE_FLOAT.match(value):
             return float(value)
         else:
             return value
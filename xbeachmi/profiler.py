@@ -0,0 +1,288 @@
+from __future__  import absolute_import
+
+import os
+import time
+import json
+import bisect
+import logging
+import contextlib
+
+
+# initialize log
+logger = logging.getLogger(__name__)
+
+# upper bounds of latency histogram buckets in seconds
+BUCKETS = (1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1., 10., 100., float('inf'))
+
+
+class Histogram:
+    '''Latency histogram with fixed buckets
+
+    Counts the number of observations per bucket in
+    :data:`BUCKETS`, as well as the total time and number of bytes.
+
+    '''
+
+
+    def __init__(self):
+        '''Initialize the class'''
+
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+        self.nbytes = 0
+        self.buckets = [0] * len(BUCKETS)
+
+
+    def add(self, dt, nbytes=0):
+        '''Add observation
+
+        Parameters
+        ----------
+        dt : float
+            latency in seconds
+        nbytes : int, optional
+            number of bytes transferred
+
+        '''
+
+        self.count += 1
+        self.total += dt
+        self.max = max(self.max, dt)
+        self.nbytes += nbytes
+        self.buckets[bisect.bisect_left(BUCKETS, dt)] += 1
+
+
+    def to_dict(self):
+        '''Return histogram as dictionary'''
+
+        return {
+            'count' : self.count,
+            'total' : self.total,
+            'mean' : self.total / max(1, self.count),
+            'max' : self.max,
+            'bytes' : self.nbytes,
+            'buckets' : dict(zip([str(b) for b in BUCKETS], self.buckets)),
+        }
+
+
+class Profiler:
+    '''Performance instrumentation of the coupling
+
+    Records, per function and instance, the number of calls, a
+    histogram of the execution time in the instance process and the
+    number of bytes sent through the pipe, as well as the round-trip
+    time of each request. Furthermore, wall-clock timers are kept
+    per coupling phase. If disabled, all methods return immediately.
+
+    The statistics can be exported as JSON and in the Prometheus
+    text format, either at the end of a run or periodically, see
+    :func:`export`.
+
+    '''
+
+
+    def __init__(self, enabled=False, fname='xbeachmi_profile', interval=None):
+        '''Initialize the class
+
+        Parameters
+        ----------
+        enabled : bool, optional
+            record statistics
+        fname : str, optional
+            path to export files without extension
+        interval : float, optional
+            wall-clock time in seconds between periodic exports
+
+        '''
+
+        self.enabled = enabled
+        self.fname = fname
+        self.interval = interval
+        self.calls = {}
+        self.requests = {}
+        self.phases = {}
+        self.started = time.time()
+        self.exported = time.time()
+
+
+    def record_call(self, fcn, instance, dt, nbytes=0):
+        '''Record execution of a function in an instance process
+
+        Parameters
+        ----------
+        fcn : str
+            name of function
+        instance : str
+            name of instance
+        dt : float
+            execution time in seconds
+        nbytes : int, optional
+            number of bytes sent through the pipe
+
+        '''
+
+        if not self.enabled:
+            return
+
+        key = (fcn, instance)
+        if key not in self.calls.keys():
+            self.calls[key] = Histogram()
+        self.calls[key].add(dt, nbytes)
+
+
+    def record_request(self, instance, dt, nbytes=0):
+        '''Record round-trip time of a request to an instance process
+
+        Parameters
+        ----------
+        instance : str
+            name of instance
+        dt : float
+            time in seconds between sending the request and
+            receiving the reply
+        nbytes : int, optional
+            number of bytes of request and reply
+
+        '''
+
+        if not self.enabled:
+            return
+
+        if instance not in self.requests.keys():
+            self.requests[instance] = Histogram()
+        self.requests[instance].add(dt, nbytes)
+
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        '''Context manager that times a coupling phase
+
+        Parameters
+        ----------
+        name : str
+            name of phase
+
+        '''
+
+        if not self.enabled:
+            yield
+            return
+
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            if name not in self.phases.keys():
+                self.phases[name] = Histogram()
+            self.phases[name].add(time.perf_counter() - t0)
+
+
+    def to_dict(self):
+        '''Return all statistics as dictionary
+
+        Returns
+        -------
+        dict
+            dict with wall-clock time since start ("wall_time"),
+            statistics per function and instance ("calls"), per
+            instance ("requests") and per phase ("phases"), see
+            :func:`Histogram.to_dict`
+
+        '''
+
+        calls = {}
+        for (fcn, instance), h in self.calls.items():
+            calls.setdefault(fcn, {})[instance] = h.to_dict()
+
+        return {
+            'wall_time' : time.time() - self.started,
+            'calls' : calls,
+            'requests' : {instance : h.to_dict() for instance, h in self.requests.items()},
+            'phases' : {name : h.to_dict() for name, h in self.phases.items()},
+        }
+
+
+    def to_prometheus(self):
+        '''Return all statistics in the Prometheus text format
+
+        Returns
+        -------
+        str
+            metrics
+
+        '''
+
+        lines = []
+
+        def histogram(metric, helptext, items):
+            lines.append('# HELP %s %s' % (metric, helptext))
+            lines.append('# TYPE %s histogram' % metric)
+            for labels, h in items:
+                labels = ','.join(['%s="%s"' % (k, v) for k, v in labels])
+                n = 0
+                for b, c in zip(BUCKETS, h.buckets):
+                    n += c
+                    le = '+Inf' if b == float('inf') else repr(b)
+                    lines.append('%s_bucket{%s,le="%s"} %d' % (metric, labels, le, n))
+                lines.append('%s_sum{%s} %r' % (metric, labels, h.total))
+                lines.append('%s_count{%s} %d' % (metric, labels, h.count))
+
+        def counter(metric, helptext, items):
+            lines.append('# HELP %s %s' % (metric, helptext))
+            lines.append('# TYPE %s counter' % metric)
+            for labels, h in items:
+                labels = ','.join(['%s="%s"' % (k, v) for k, v in labels])
+                lines.append('%s{%s} %d' % (metric, labels, h.nbytes))
+
+        calls = [((('function', fcn), ('instance', instance)), h)
+                 for (fcn, instance), h in sorted(self.calls.items())]
+        requests = [((('instance', instance),), h)
+                    for instance, h in sorted(self.requests.items())]
+        phases = [((('phase', name),), h)
+                  for name, h in sorted(self.phases.items())]
+
+        histogram('xbeachmi_call_seconds',
+                  'Execution time of functions in instance processes', calls)
+        counter('xbeachmi_call_bytes_total',
+                'Bytes sent through pipes per function', calls)
+        histogram('xbeachmi_request_seconds',
+                  'Round-trip time of requests to instance processes', requests)
+        counter('xbeachmi_request_bytes_total',
+                'Bytes sent through pipes per instance', requests)
+        histogram('xbeachmi_phase_seconds',
+                  'Wall-clock time of coupling phases', phases)
+
+        return '\n'.join(lines) + '\n'
+
+
+    def export(self, force=True):
+        '''Write statistics to JSON and Prometheus text files
+
+        The files are written under a temporary name first and
+        renamed afterwards, such that readers never see a partial
+        file.
+
+        Parameters
+        ----------
+        force : bool, optional
+            write files regardless of the export interval
+
+        '''
+
+        if not self.enabled:
+            return
+
+        if not force:
+            if self.interval is None or time.time() - self.exported < self.interval:
+                return
+
+        for ext, text in [('json', json.dumps(self.to_dict(), indent=2)),
+                          ('prom', self.to_prometheus())]:
+            fname = '%s.%s' % (self.fname, ext)
+            with open('%s.tmp' % fname, 'w') as fp:
+                fp.write(text)
+            os.replace('%s.tmp' % fname, fname)
+
+        self.exported = time.time()
+        logger.debug('Exported profile to "%s"' % self.fname)
@@ -0,0 +1,214 @@
+from __future__  import absolute_import
+
+import os
+import json
+import logging
+import numpy as np
+
+
+# initialize log
+logger = logging.getLogger(__name__)
+
+
+class Scenario:
+    '''Indexed schedule of running instances
+
+    Stores the times at which the running instances change in a
+    sorted array. Each distinct set of instances is stored only
+    once, while each schedule entry refers to its set by index. The
+    memory needed is therefore dominated by two numeric arrays, even
+    for schedules with hundreds of thousands of entries. Entries are
+    looked up by binary search, such that the schedule can be
+    entered at any time without replaying earlier entries.
+
+    '''
+
+
+    def __init__(self, times, index, sets):
+        '''Initialize the class
+
+        Parameters
+        ----------
+        times : array_like
+            times of schedule entries
+        index : array_like
+            index of the instance set of each schedule entry
+        sets : list
+            distinct instance sets, each a tuple of instance names
+
+        '''
+
+        times = np.asarray(times, dtype=float).ravel()
+        index = np.asarray(index, dtype=np.int32).ravel()
+
+        if len(times) != len(index):
+            raise ValueError('Number of times and instance sets differ')
+
+        # stable sort keeps the order of entries with equal times
+        order = np.argsort(times, kind='stable')
+        self.times = times[order]
+        self.index = index[order]
+        self.sets = [tuple(s) for s in sets]
+
+
+    @classmethod
+    def from_entries(cls, entries):
+        '''Create schedule from a list of entries
+
+        Parameters
+        ----------
+        entries : list
+            list of pairs of time and either an instance name or a
+            list of instance names
+
+        Returns
+        -------
+        Scenario
+            schedule
+
+        '''
+
+        times = np.empty(len(entries), dtype=float)
+        index = np.empty(len(entries), dtype=np.int32)
+        sets = {}
+        for i, (t, instances) in enumerate(entries):
+            key = tuple(instances) if type(instances) is list else (instances,)
+            times[i] = t
+            index[i] = sets.setdefault(key, len(sets))
+
+        return cls(times, index, sorted(sets.keys(), key=sets.get))
+
+
+    def __len__(self):
+        return len(self.times)
+
+
+    def __getitem__(self, i):
+        return float(self.times[i]), list(self.sets[self.index[i]])
+
+
+    def get_index(self, t):
+        '''Return number of schedule entries that start at or before a given time
+
+        Parameters
+        ----------
+        t : float
+            time
+
+        Returns
+        -------
+        int
+            index of the first entry after the given time
+
+        '''
+
+        return int(np.searchsorted(self.times, t, side='right'))
+
+
+    def get_time(self, i):
+        '''Return time of a schedule entry
+
+        Parameters
+        ----------
+        i : int
+            index of schedule entry
+
+        Returns
+        -------
+        float or None
+            time of schedule entry or None if the index is beyond the
+            end of the schedule
+
+        '''
+
+        if i < len(self.times):
+            return float(self.times[i])
+        return None
+
+
+    def get_instances(self):
+        '''Return names of all instances in the schedule
+
+        Returns
+        -------
+        list
+            instance names
+
+        '''
+
+        instances = []
+        for s in self.sets:
+            instances.extend([name for name in s if name not in instances])
+        return instances
+
+
+    def save(self, fname):
+        '''Write schedule to binary file
+
+        Parameters
+        ----------
+        fname : str
+            path to ``.npz`` file
+
+        '''
+
+        np.savez(fname, times=self.times, index=self.index,
+                 sets=np.asarray(json.dumps([list(s) for s in self.sets])))
+
+
+def load(value, path=''):
+    '''Load schedule from configuration
+
+    The schedule is either given in the configuration file itself
+    as a list of pairs of time and instance name(s), or as a path to
+    a file. Supported file formats are JSON (``.json``) with the
+    same list of pairs, comma-separated text (``.csv`` or ``.txt``)
+    with the time in the first column and the instance names in the
+    remaining columns, and binary files (``.npz``) as written by
+    :func:`Scenario.save`. Lines in text files starting with "#"
+    are ignored.
+
+    Parameters
+    ----------
+    value : list or str
+        list of schedule entries or path to schedule file
+    path : str, optional
+        directory relative to which schedule files are resolved
+
+    Returns
+    -------
+    Scenario
+        schedule
+
+    '''
+
+    if isinstance(value, Scenario):
+        return value
+    elif not isinstance(value, str):
+        return Scenario.from_entries(value)
+
+    fname = os.path.join(path, value)
+    if not os.path.exists(fname):
+        raise IOError('Scenario file not found [%s]' % fname)
+
+    logger.debug('Reading scenario file "%s"...' % fname)
+
+    ext = os.path.splitext(fname)[1].lower()
+    if ext == '.json':
+        with open(fname, 'r') as fp:
+            return Scenario.from_entries(json.load(fp))
+    elif ext in ['.csv', '.txt']:
+        entries = []
+        with open(fname, 'r') as fp:
+            for line in fp:
+                line = line.strip()
+                if len(line) == 0 or line.startswith('#'):
+                    continue
+                items = [item.strip() for item in line.split(',')]
+                entries.append((float(items[0]), [item for item in items[1:] if item]))
+        return Scenario.from_entries(entries)
+    elif ext == '.npz':
+        with np.load(fname) as f:
+            return Scenario(f['times'], f['index'], json.loads(str(f['sets'])))
+    else:
+        raise ValueError('Unsupported scenario file format [%s]' % fname)
@@ -0,0 +1,194 @@
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+
+# byte alignment of individual slots in an arena
+ALIGNMENT = 64
+
+# mapping of BMI type names to numpy data types
+TYPEMAP = {
+    'double' : 'float64',
+    'float' : 'float32',
+    'real' : 'float32',
+    'int' : 'int32',
+    'integer' : 'int32',
+    'long' : 'int64',
+    'bool' : 'bool',
+    'logical' : 'int32',
+}
+
+
+def prepare():
+    '''Prepare master process for the use of shared memory
+
+    Starts the shared memory resource tracker before any instance
+    process is started, such that all instance processes share the
+    tracker of the master process. Otherwise, each instance process
+    starts its own tracker upon attaching to an arena, which then
+    removes the arena when the instance process exits.
+
+    '''
+
+    resource_tracker.ensure_running()
+
+
+def get_dtype(typename):
+    '''Convert BMI type name to numpy data type
+
+    Parameters
+    ----------
+    typename : str
+        BMI type name as returned by ``get_var_type``
+
+    Returns
+    -------
+    np.dtype
+        numpy data type, or None if the type is unknown
+
+    '''
+
+    if isinstance(typename, bytes):
+        typename = typename.decode()
+    try:
+        return np.dtype(TYPEMAP.get(str(typename).lower(), typename))
+    except TypeError:
+        return None
+
+
+def create_layout(variables):
+    '''Create memory layout for shared memory arena
+
+    Parameters
+    ----------
+    variables : dict
+        dict with variable names (keys) and tuples with shape and
+        data type (values)
+
+    Returns
+    -------
+    dict
+        dict with variable names (keys) and tuples with byte offset,
+        shape and data type string (values)
+
+    '''
+
+    layout = {}
+    offset = 0
+    for var, (shape, dtype) in variables.items():
+        if shape is None or dtype is None:
+            continue
+        shape = tuple([int(n) for n in np.atleast_1d(shape)])
+        dtype = np.dtype(dtype)
+        layout[var] = (offset, shape, dtype.str)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        offset += (nbytes + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+    return layout
+
+
+def get_size(layout):
+    '''Return the number of bytes needed for a memory layout'''
+
+    size = 0
+    for var, (offset, shape, dtype) in layout.items():
+        size = max(size, offset + int(np.prod(shape)) * np.dtype(dtype).itemsize)
+    return size
+
+
+class SharedArena:
+    '''Shared memory arena
+
+    Named shared memory block with one slot per exchange
+    variable. The master process creates an arena for each instance
+    process and a single broadcast arena for data that is set in
+    multiple instances at once. The instance processes attach to the
+    arenas by name. Only small "slot ready" messages need to be sent
+    between the processes, while the data itself is never pickled.
+
+    '''
+
+
+    def __init__(self, layout, name=None):
+        '''Initialize the class
+
+        Parameters
+        ----------
+        layout : dict
+            memory layout, see :func:`create_layout`
+        name : str, optional
+            name of existing shared memory block to attach to, a new
+            block is created if not given
+
+        '''
+
+        self.layout = layout
+
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True,
+                                                  size=max(1, get_size(layout)))
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+
+        self.name = self.shm.name
+        self.slots = {
+            var : np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset)
+            for var, (offset, shape, dtype) in layout.items()
+        }
+
+
+    def fits(self, var, value):
+        '''Check if value can be stored in the slot of a variable'''
+
+        if var not in self.slots.keys():
+            return False
+        return np.shape(value) == self.slots[var].shape
+
+
+    def read(self, var, copy=True):
+        '''Read variable from arena
+
+        Parameters
+        ----------
+        var : str
+            variable name
+        copy : bool, optional
+            return a copy of the data instead of a view on the
+            arena that is overwritten by the next write
+
+        Returns
+        -------
+        np.ndarray
+            variable data
+
+        '''
+
+        if copy:
+            return self.slots[var].copy()
+        else:
+            return self.slots[var]
+
+
+    def write(self, var, value):
+        '''Write variable to arena
+
+        Parameters
+        ----------
+        var : str
+            variable name
+        value : np.ndarray
+            variable data
+
+        '''
+
+        self.slots[var][...] = value
+
+
+    def close(self):
+        '''Close arena and remove shared memory block if owned'''
+
+        self.slots = {}
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
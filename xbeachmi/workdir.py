@@ -0,0 +1,389 @@
+from __future__  import absolute_import
+
+import os
+import json
+import shutil
+import fnmatch
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# initialize log
+logger = logging.getLogger(__name__)
+
+# name of manifest file in each model directory
+MANIFEST = '.manifest.json'
+
+# ioctl request for cloning a file on copy-on-write file systems (Linux)
+FICLONE = 0x40049409
+
+# provisioning methods
+METHODS = ('link', 'reflink', 'copy')
+
+# files excluded from model directories: hidden files and
+# directories, including the model directories themselves, netCDF
+# output, log files, XBeach log files, the checkpoint file, exported
+# profiling statistics and benchmark reports
+EXCLUDE = ('.*', '*.nc', '*.log',
+           'XBlog.txt', 'XBerror.txt', 'XBwarning.txt',
+           'xbeachmi.chk', 'xbeachmi_profile.*', 'xbeachmi_benchmark*.json')
+
+# files that may be written by XBeach in the model directory, like
+# generated boundary condition files and Fortran output, which are
+# never placed as hard links
+MUTABLE = ('*.bcf', '*.dat')
+
+
+def ignore(fname):
+    '''Check if a file or directory is excluded from model directories
+
+    Files matching any of the patterns in :data:`EXCLUDE` are
+    excluded, like model output and log files.
+
+    Parameters
+    ----------
+    fname : str
+        file or directory name
+
+    Returns
+    -------
+    bool
+        file or directory is excluded
+
+    '''
+
+    return any([fnmatch.fnmatchcase(fname, pattern) for pattern in EXCLUDE])
+
+
+def is_mutable(fname):
+    '''Check if a file may be modified by the model
+
+    Parameters
+    ----------
+    fname : str
+        file name
+
+    Returns
+    -------
+    bool
+        file matches any of the patterns in :data:`MUTABLE`
+
+    '''
+
+    return any([fnmatch.fnmatchcase(fname, pattern) for pattern in MUTABLE])
+
+
+def get_hash(fname, blocksize=1<<20):
+    '''Return content hash of a file
+
+    Parameters
+    ----------
+    fname : str
+        path to file
+    blocksize : int, optional
+        number of bytes read at once
+
+    Returns
+    -------
+    str
+        hexadecimal SHA-1 digest
+
+    '''
+
+    h = hashlib.sha1()
+    with open(fname, 'rb') as fp:
+        for block in iter(lambda: fp.read(blocksize), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def scan(path, exclude=(), cache={}, threads=1):
+    '''Create manifest of model input files
+
+    Content hashes are taken from the cache if size and
+    modification time of a file did not change.
+
+    Parameters
+    ----------
+    path : str
+        path to source directory
+    exclude : list, optional
+        paths relative to the source directory that are excluded
+    cache : dict, optional
+        previous manifest, see :func:`read_manifest`
+    threads : int, optional
+        number of threads used for hashing files
+
+    Returns
+    -------
+    dict
+        dict with paths relative to the source directory (keys) and
+        lists with size, modification time in nanoseconds and content
+        hash (values)
+
+    '''
+
+    files = {}
+    for root, dirs, fnames in os.walk(path):
+        dirs[:] = [d for d in dirs if not ignore(d)]
+        for fname in fnames:
+            if ignore(fname):
+                continue
+            rel = os.path.relpath(os.path.join(root, fname), path)
+            if rel in exclude:
+                continue
+            st = os.stat(os.path.join(path, rel))
+            files[rel] = [st.st_size, st.st_mtime_ns, None]
+            if rel in cache.keys() and cache[rel][:2] == files[rel][:2]:
+                files[rel][2] = cache[rel][2]
+
+    missing = [rel for rel, entry in files.items() if entry[2] is None]
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as pool:
+        for rel, h in zip(missing, pool.map(lambda rel: get_hash(os.path.join(path, rel)),
+                                            missing)):
+            files[rel][2] = h
+
+    return files
+
+
+def read_manifest(path):
+    '''Read manifest of a model directory
+
+    Parameters
+    ----------
+    path : str
+        path to model directory
+
+    Returns
+    -------
+    dict
+        manifest, see :func:`scan`, empty if the model directory or
+        manifest does not exist or cannot be read
+
+    '''
+
+    fname = os.path.join(path, MANIFEST)
+    if os.path.exists(fname):
+        try:
+            with open(fname, 'r') as fp:
+                return json.load(fp)
+        except ValueError:
+            logger.warning('Failed to read manifest "%s"' % fname)
+    return {}
+
+
+def write_manifest(path, files):
+    '''Write manifest of a model directory
+
+    Parameters
+    ----------
+    path : str
+        path to model directory
+    files : dict
+        manifest, see :func:`scan`
+
+    '''
+
+    with open(os.path.join(path, MANIFEST), 'w') as fp:
+        json.dump(files, fp)
+
+
+def link(src, dst, method='link'):
+    '''Place a model input file in a model directory
+
+    Falls back to the next method in :data:`METHODS` if a method is
+    not supported, for example hard links across file systems.
+
+    Parameters
+    ----------
+    src : str
+        path to source file
+    dst : str
+        path to destination file, which should not exist
+    method : str, optional
+        "link" to create a hard link, "reflink" to create a
+        copy-on-write clone or "copy" to copy the file
+
+    Returns
+    -------
+    str
+        method used
+
+    '''
+
+    if method == 'link':
+        try:
+            os.link(src, dst)
+            return 'link'
+        except OSError:
+            method = 'reflink'
+
+    if method == 'reflink' and fcntl is not None:
+        try:
+            with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            shutil.copystat(src, dst)
+            return 'reflink'
+        except OSError:
+            os.remove(dst)
+
+    shutil.copy2(src, dst)
+    return 'copy'
+
+
+def provision(src, dst, files, method='link', reuse=True):
+    '''Provision a single model directory
+
+    Only files that are missing or changed according to the manifest
+    of the model directory are placed. Files that are no longer part
+    of the model input are removed. Other files in the model
+    directory, like model output, are left untouched. Files that
+    may be modified by the model, see :func:`is_mutable`, are never
+    hard linked, but cloned or copied instead, such that the
+    source directory and other model directories are not affected.
+
+    Parameters
+    ----------
+    src : str
+        path to source directory
+    dst : str
+        path to model directory
+    files : dict
+        manifest of source directory, see :func:`scan`
+    method : str, optional
+        provisioning method, see :func:`link`
+    reuse : bool, optional
+        reuse existing model directory, otherwise it is removed first
+
+    Returns
+    -------
+    int
+        number of files placed
+
+    '''
+
+    if not reuse and os.path.exists(dst):
+        shutil.rmtree(dst)
+    os.makedirs(dst, exist_ok=True)
+
+    previous = read_manifest(dst)
+
+    for rel in previous.keys():
+        if rel not in files.keys() and os.path.exists(os.path.join(dst, rel)):
+            os.remove(os.path.join(dst, rel))
+
+    n = 0
+    for rel, (size, mtime, h) in files.items():
+        fname = os.path.join(dst, rel)
+        if rel in previous.keys() and previous[rel][2] == h and os.path.exists(fname):
+            continue
+        if os.path.lexists(fname):
+            os.remove(fname)
+        os.makedirs(os.path.dirname(fname) or dst, exist_ok=True)
+        if method == 'link' and is_mutable(os.path.basename(rel)):
+            link(os.path.join(src, rel), fname, method='reflink')
+        else:
+            link(os.path.join(src, rel), fname, method=method)
+        n += 1
+
+    write_manifest(dst, files)
+
+    return n
+
+
+def provision_all(src, targets, exclude=(), method='link', reuse=True, threads=4):
+    '''Provision multiple model directories concurrently
+
+    Parameters
+    ----------
+    src : str
+        path to source directory
+    targets : list
+        paths to model directories
+    exclude : list, optional
+        paths relative to the source directory that are not placed
+    method : str, optional
+        provisioning method, see :func:`link`
+    reuse : bool, optional
+        reuse existing model directories
+    threads : int, optional
+        number of threads
+
+    Returns
+    -------
+    dict
+        dict with paths to model directories (keys) and number of
+        files placed (values)
+
+    '''
+
+    if method not in METHODS:
+        raise ValueError('Unsupported provisioning method [%s]' % method)
+
+    cache = {}
+    if reuse:
+        for dst in targets:
+            cache.update(read_manifest(dst))
+
+    files = scan(src, exclude=exclude, cache=cache, threads=threads)
+
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as pool:
+        counts = pool.map(lambda dst: provision(src, dst, files, method=method, reuse=reuse),
+                          targets)
+        return dict(zip(targets, counts))
+
+
+def write_if_changed(fname, text):
+    '''Write text file only if its contents changed
+
+    Parameters
+    ----------
+    fname : str
+        path to text file
+    text : str
+        file contents
+
+    Returns
+    -------
+    bool
+        file is written
+
+    '''
+
+    if os.path.exists(fname):
+        with open(fname, 'r') as fp:
+            if fp.read() == text:
+                return False
+
+    with open(fname, 'w') as fp:
+        fp.write(text)
+    return True
+
+
+def get_render_hash(source, markers):
+    '''Return hash of the inputs for rendering a template
+
+    Parameters
+    ----------
+    source : str
+        template source
+    markers : dict
+        template markers
+
+    Returns
+    -------
+    str
+        hexadecimal SHA-1 digest
+
+    '''
+
+    h = hashlib.sha1(source.encode('utf-8'))
+    h.update(json.dumps({k : list(v) if not isinstance(v, str) else v
+                         for k, v in markers.items()}, sort_keys=True).encode('utf-8'))
+    return h.hexdigest()
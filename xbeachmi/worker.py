@@ -0,0 +1,350 @@
+from __future__  import absolute_import
+
+import os
+import logging
+import numpy as np
+
+import xbeachmi.mock
+import xbeachmi.sharedmem
+import xbeachmi.exchange
+import xbeachmi.aggregate
+import xbeachmi.netcdf
+
+
+# initialize log
+logger = logging.getLogger(__name__)
+
+
+class InstanceWorker:
+    '''Instance process command handler
+
+    Runs a single BMI compatible model engine inside an instance
+    process. Commands sent by the master process are executed by this
+    class if it implements them, otherwise they are passed on to the
+    model engine itself.
+
+    '''
+
+    # commands handled by the worker rather than the model engine
+    commands = ('advance_to', 'attach_arena', 'detach_arena',
+                'get_var_shared', 'set_var_shared', 'set_var_delta',
+                'reduce_begin', 'reduce_from', 'pull_from', 'set_var_reduced',
+                'output_init', 'output')
+
+
+    def __init__(self, engine, configfile):
+        '''Initialize the class
+
+        Parameters
+        ----------
+        engine : str
+            name of BMI compatible model engine library, or "mock"
+            for the pure-NumPy :class:`~xbeachmi.mock.MockEngine`
+        configfile : str
+            path to model configuration file (params.txt)
+
+        '''
+
+        if engine == 'mock':
+            self.model = xbeachmi.mock.MockEngine(engine, configfile=configfile)
+        else:
+            from bmi.wrapper import BMIWrapper
+            self.model = BMIWrapper(engine, configfile=configfile)
+        self.arena = None
+        self.broadcast = None
+        self.reduction = None
+        self.peers = {}
+        self.instance = None
+        self.writer = None
+
+
+    def execute(self, fcn, args=()):
+        '''Execute command
+
+        Parameters
+        ----------
+        fcn : str
+            name of function
+        args : tuple, optional
+            function arguments
+
+        Returns
+        -------
+        any
+            function result
+
+        '''
+
+        if fcn in self.commands:
+            r = getattr(self, fcn)(*args)
+        else:
+            r = getattr(self.model, fcn)(*args)
+
+        if fcn == 'finalize':
+            self.detach_arena()
+            if self.writer is not None:
+                self.writer.close()
+                self.writer = None
+
+        return r
+
+
+    def advance_to(self, t):
+        '''Update model engine until a given time is reached
+
+        Parameters
+        ----------
+        t : float
+            target time
+
+        Returns
+        -------
+        float
+            current time after update
+
+        '''
+
+        tc = self.model.get_current_time()
+        while tc < t:
+            self.model.update(t - tc)
+            tp, tc = tc, self.model.get_current_time()
+            if tc <= tp:
+                raise RuntimeError('Model time does not advance [t=%0.2f]' % tc)
+
+        return tc
+
+
+    def attach_arena(self, name, layout, broadcast_name, broadcast_layout,
+                     reduction_name=None, reduction_layout=None):
+        '''Attach to shared memory arenas created by the master process
+
+        Parameters
+        ----------
+        name : str
+            name of instance arena
+        layout : dict
+            memory layout of instance arena
+        broadcast_name : str
+            name of broadcast arena
+        broadcast_layout : dict
+            memory layout of broadcast arena
+        reduction_name : str, optional
+            name of reduction arena, only used for tree reduction
+        reduction_layout : dict, optional
+            memory layout of reduction arena
+
+        '''
+
+        self.detach_arena()
+        self.arena = xbeachmi.sharedmem.SharedArena(layout, name=name)
+        self.broadcast = xbeachmi.sharedmem.SharedArena(broadcast_layout,
+                                                        name=broadcast_name)
+        if reduction_name is not None:
+            self.reduction = xbeachmi.sharedmem.SharedArena(reduction_layout,
+                                                            name=reduction_name)
+        logger.debug('Attached shared memory arena "%s" [%d]' % (name, os.getpid()))
+
+
+    def detach_arena(self):
+        '''Detach from shared memory arenas'''
+
+        for arena in [self.arena, self.broadcast, self.reduction] + list(self.peers.values()):
+            if arena is not None:
+                arena.close()
+        self.arena = None
+        self.broadcast = None
+        self.reduction = None
+        self.peers = {}
+
+
+    def get_var_shared(self, var):
+        '''Write variable to instance arena
+
+        Returns
+        -------
+        bool or np.ndarray
+            True if the variable is written to the arena, or the
+            variable itself if it does not fit its slot
+
+        '''
+
+        value = self.model.get_var(var)
+        if self.arena is not None and self.arena.fits(var, value):
+            self.arena.write(var, value)
+            return True
+        return value
+
+
+    def set_var_shared(self, var, value=None):
+        '''Set variable from broadcast arena
+
+        Parameters
+        ----------
+        var : str
+            variable name
+        value : np.ndarray, optional
+            variable data, used instead of the broadcast arena if the
+            data did not fit its slot
+
+        '''
+
+        if value is None:
+            value = self.broadcast.read(var, copy=False)
+        self.model.set_var(var, value)
+
+
+    def set_var_delta(self, var, idx, values):
+        '''Update variable with encoded difference
+
+        Parameters
+        ----------
+        var : str
+            variable name
+        idx : np.ndarray
+            flat indices of changed cells
+        values : np.ndarray
+            values of changed cells
+
+        '''
+
+        value = np.array(self.model.get_var(var), copy=True)
+        self.model.set_var(var, xbeachmi.exchange.apply_delta(value, idx, values))
+
+
+    def reduce_begin(self, variables, weight, operator):
+        '''Write own contribution to a tree reduction to the reduction arena
+
+        Parameters
+        ----------
+        variables : list
+            variable names
+        weight : float
+            weight of this instance, only used if operator is "sum"
+        operator : str
+            name of operator, see
+            :func:`~xbeachmi.aggregate.get_tree_operator`
+
+        '''
+
+        for var in variables:
+            value = self.model.get_var(var)
+            if operator == 'sum':
+                np.multiply(value, weight, out=self.reduction.slots[var])
+            else:
+                self.reduction.write(var, value)
+
+
+    def reduce_from(self, name, layout, variables, operator):
+        '''Combine partial aggregate of another instance into own reduction arena
+
+        Parameters
+        ----------
+        name : str
+            name of reduction arena of other instance
+        layout : dict
+            memory layout of reduction arena of other instance
+        variables : list
+            variable names
+        operator : str
+            name of operator, see
+            :func:`~xbeachmi.aggregate.get_tree_operator`
+
+        '''
+
+        peer = self._get_peer(name, layout)
+        for var in variables:
+            xbeachmi.aggregate.combine(self.reduction.slots[var], peer.slots[var], operator)
+
+
+    def pull_from(self, name, layout, variables):
+        '''Copy aggregate from reduction arena of another instance
+
+        Parameters
+        ----------
+        name : str
+            name of reduction arena of other instance
+        layout : dict
+            memory layout of reduction arena of other instance
+        variables : list
+            variable names
+
+        '''
+
+        peer = self._get_peer(name, layout)
+        for var in variables:
+            self.reduction.write(var, peer.slots[var])
+
+
+    def set_var_reduced(self, variables):
+        '''Set variables from own reduction arena
+
+        Parameters
+        ----------
+        variables : list
+            variable names
+
+        '''
+
+        for var in variables:
+            self.model.set_var(var, self.reduction.read(var, copy=False))
+
+
+    def _get_peer(self, name, layout):
+        '''Return reduction arena of another instance, attaching upon first use'''
+
+        if name not in self.peers.keys():
+            self.peers[name] = xbeachmi.sharedmem.SharedArena(layout, name=name)
+        return self.peers[name]
+
+
+    def output_init(self, instance, ncfile, dimensions, variables, options={}):
+        '''Initialize netCDF4 output file of this instance
+
+        Parameters
+        ----------
+        instance : str
+            name of instance
+        ncfile : str
+            path to netCDF4 output file
+        dimensions : dict
+            dict with dimension variables, see
+            :func:`~xbeachmi.netcdf.initialize`
+        variables : dict
+            dict of dicts with output variables
+        options : dict, optional
+            keyword arguments for :func:`~xbeachmi.netcdf.initialize`
+            and :class:`~xbeachmi.netcdf.NetCDFWriter`, and the
+            keyword "append" to append to an existing file
+
+        '''
+
+        options = dict(options)
+        buffer_size = options.pop('buffer_size', 1)
+        flush_interval = options.pop('flush_interval', None)
+        append = options.pop('append', False)
+
+        if not append or not os.path.exists(ncfile):
+            xbeachmi.netcdf.initialize(ncfile, dimensions, variables=variables, **options)
+
+        self.instance = instance
+        self.writer = xbeachmi.netcdf.NetCDFWriter(ncfile, buffer_size=buffer_size,
+                                                   flush_interval=flush_interval)
+        logger.debug('Initialized output file "%s" [%d]' % (ncfile, os.getpid()))
+
+
+    def output(self, t, variables):
+        '''Write output variables of this instance
+
+        Parameters
+        ----------
+        t : float
+            output time
+        variables : list
+            names of output variables
+
+        '''
+
+        values = {var : self.model.get_var(var) for var in variables}
+        values['time'] = t
+        values['instance'] = self.instance
+        self.writer.append(values)